@@ -1,20 +1,66 @@
+import hashlib
+from abc import ABC, abstractmethod
 from functools import partial
-from typing import Callable, Optional
+from typing import TYPE_CHECKING, Callable, NamedTuple, Optional, Sequence, Union
 
 import numpy as np
 
-from blackjack.algorithms import ALGORITHMS_MAP, EPSILON_ALGORITHMS, EpisodeRunner
-from blackjack.policy import greedy
-from blackjack.state_space import flatten_Q, initialize_Q
-from blackjack_env import BlackjackEnv
+from blackjack.algorithms import (
+    ALGORITHMS_MAP,
+    DOUBLE_ALGORITHMS,
+    EPSILON_ALGORITHMS,
+    MODEL_ALGORITHMS,
+    EpisodeRunner,
+)
+from blackjack.dyna import TransitionModel
+from blackjack.policy import CompiledPolicy, compile_greedy
+from blackjack.state_space import flatten_Q, flatten_Q_pair, initialize_N, initialize_Q
+from blackjack_env import BlackjackEnv, Rules
+
+if TYPE_CHECKING:
+    from blackjack.agent_cache import AgentCache
+
+
+Z_95 = 1.959963984540054  # Two sided 95% normal quantile
+
+
+class EvaluationResult(NamedTuple):
+    mean: float
+    half_width: float  # Half width of the confidence interval around mean
+    num_episodes: int
+
+
+class TrainingCallback(ABC):
+    """Hook run by Agent.train between blocks of episodes."""
+
+    interval = 100_000
+
+    def next_stop(self, episode: int) -> int:
+        # First episode count after `episode` at which the callback wants to run
+        return (episode // self.interval + 1) * self.interval
+
+    @abstractmethod
+    def __call__(self, agent: "Agent", episode: int, returns: np.ndarray) -> None:
+        # `episode` counts every episode the agent has trained on and `returns`
+        # holds the training returns since this callback last ran
+        ...
 
 
 class Agent:
     def __init__(
-        self, algo_name: str, Q_init: float, decay_factor: Optional[int], seed: int = 42
+        self,
+        algo_name: str,
+        Q_init: float,
+        decay_factor: Optional[int],
+        seed: int = 42,
+        rules: Optional[Rules] = None,
+        cache: Optional["AgentCache"] = None,
     ) -> None:
+        self.algo_name = algo_name
+        self.decay_factor = decay_factor
+        self.Q_init = Q_init
         self.Q = initialize_Q(Q_init)
-        self.N = np.zeros_like(self.Q)
+        self.N = initialize_N()
         self.run_episode: EpisodeRunner = ALGORITHMS_MAP[algo_name]
         if self.run_episode in EPSILON_ALGORITHMS:
             if decay_factor is None:
@@ -24,39 +70,230 @@ class Agent:
 
             self.run_episode = partial(self.run_episode, decay_factor=decay_factor)
 
+        # Model based algorithms keep what they've seen between episodes
+        self.model = None
+        if ALGORITHMS_MAP[algo_name] in MODEL_ALGORITHMS:
+            self.model = TransitionModel()
+            self.run_episode = partial(self.run_episode, model=self.model)
+
+        # Double algorithms learn two estimates of Q, kept interleaved per state
+        # in Q_pair with separate counts in N, and Q is their mean
+        self.Q_pair = None
+        if ALGORITHMS_MAP[algo_name] in DOUBLE_ALGORITHMS:
+            self.Q_pair = np.stack([self.Q, self.Q], axis=-2)
+            self.N = np.stack([self.N, self.N], axis=-2)
+
         self.seed = seed
+        self.rules = Rules() if rules is None else rules
+        # Kept between train calls so further training continues the card stream
+        self.env = BlackjackEnv(seed, self.rules)
+        self.episodes_trained = 0
         self.train_returns = None
         self.test_returns = None
+        self.test_result = None
+        # Consulted before training, which then starts from the longest cached run
+        self.cache = cache
+        self.warm_start_digest = None  # Hash of the tables given to warm_start
+        # Each agent has its own stream of numpy's global generator, swapped in
+        # while it trains, so agents trained in turn don't change each other
         np.random.seed(seed)
+        self.np_random_state = np.random.get_state()
+
+    def warm_start(
+        self,
+        Q: np.ndarray,
+        N: Union[np.ndarray, int] = 0,
+        prior_weight: float = 1.0,
+    ) -> None:
+        """Start training from Q instead of the constant Q_init.
 
-    def train(self, num_episodes: int):
-        flat_Q = flatten_Q(self.Q)
-        flat_N = flatten_Q(self.N)
+        N is how many visits Q is worth, per state-action pair or one count for
+        all of them, scaled by prior_weight. Learning rates are 1 / N, so a
+        prior of n visits is averaged with the first real returns as if they
+        were the n + 1th, and epsilon starts as decayed as after n visits.
+        With no prior the first visit replaces a pair's value. N can be
+        shaped like Q or, for double algorithms, like the agent's N.
+        """
+        if self.episodes_trained:
+            raise ValueError("Warm starts replace the tables, start before training")
+        legal = np.isfinite(self.Q)
+        self.Q[...] = np.where(legal, np.reshape(Q, self.Q.shape), -np.inf)
+        N = np.rint(np.asarray(N, dtype=np.float64) * prior_weight).astype(np.uint64)
+        if self.Q_pair is None and N.size == 2 * self.Q.size:
+            # Counts of a double algorithm's two tables, together they're visits
+            N = N.reshape(*self.Q.shape[:-1], 2, -1).sum(axis=-2)
+        if N.size == self.N.size:
+            self.N[...] = N.reshape(self.N.shape)
+        else:
+            # One count, or one table for both estimates of a double algorithm
+            counts = N.reshape(self.Q.shape) if N.size == self.Q.size else N
+            counts = np.where(legal, counts, 0)
+            if self.Q_pair is not None:
+                counts = np.stack([counts, counts], axis=-2)
+            self.N[...] = counts
+        if self.Q_pair is not None:
+            self.Q_pair[...] = np.stack([self.Q, self.Q], axis=-2)
+        digest = hashlib.sha256(self.Q.tobytes() + self.N.tobytes())
+        self.warm_start_digest = digest.hexdigest()[:16]
+
+    def train(self, num_episodes: int, callbacks: Sequence[TrainingCallback] = ()):
+        if self.Q_pair is None:
+            flat_Q, flat_N = flatten_Q(self.Q), flatten_Q(self.N)
+        else:
+            flat_Q, flat_N = flatten_Q_pair(self.Q_pair), flatten_Q_pair(self.N)
+        start = self.episodes_trained
+        end = start + num_episodes
+        if self.cache is not None:
+            self.cache.restore(self, end)
+        # Episodes restored from the cache have no returns to show
         self.train_returns = np.zeros(num_episodes)
-        env = BlackjackEnv(self.seed)
-        for episode in range(num_episodes):
-            self.train_returns[episode] = self.run_episode(flat_Q, flat_N, env)
+        self.train_returns[: self.episodes_trained - start] = np.nan
+
+        last_calls = [self.episodes_trained] * len(callbacks)
+        while self.episodes_trained < end:
+            stops = [cb.next_stop(self.episodes_trained) for cb in callbacks]
+            stop = min([end, *stops])
+            np.random.set_state(self.np_random_state)
+            for episode in range(self.episodes_trained - start, stop - start):
+                self.train_returns[episode] = self.run_episode(flat_Q, flat_N, self.env)
+            self.np_random_state = np.random.get_state()
+            self.episodes_trained = stop
+            if self.Q_pair is not None:
+                self.Q[...] = self.Q_pair.mean(axis=-2)
+
+            # Callbacks always run at the end so they see every episode
+            for i, callback in enumerate(callbacks):
+                if stops[i] <= stop or stop == end:
+                    returns = self.train_returns[last_calls[i] - start : stop - start]
+                    callback(self, stop, returns)
+                    last_calls[i] = stop
+
+        if self.cache is not None and self.episodes_trained > start:
+            self.cache.save(self)
         return self.train_returns
 
-    def evaluate(self, num_episodes: int):
-        return evaluate_Q(self.Q, num_episodes, self.seed)
-    
+    def evaluate(
+        self, num_episodes: int, target_ci: Optional[float] = None
+    ) -> EvaluationResult:
+        """Evaluate the greedy policy, see evaluate_policy for target_ci.
+
+        The summary is kept in test_result. test_returns holds the returns of
+        every episode, or None with target_ci as chunks aren't kept.
+        """
+        policy = compile_greedy(self.Q, self.rules)
+        if target_ci is None:
+            self.test_returns = play_returns(policy, num_episodes, self.seed, self.rules)
+            self.test_result = summarize_returns(self.test_returns)
+        else:
+            self.test_returns = None
+            self.test_result = evaluate_policy(
+                policy, num_episodes, self.seed, target_ci, rules=self.rules
+            )
+        return self.test_result
+
+
+def summarize_returns(returns: np.ndarray) -> EvaluationResult:
+    returns = returns.astype(np.float64)
+    std = returns.std(ddof=1) if len(returns) > 1 else np.inf
+    half_width = Z_95 * std / np.sqrt(len(returns))
+    return EvaluationResult(float(returns.mean()), float(half_width), len(returns))
+
 
 def evaluate_Q(
-    Q: np.ndarray, num_episodes: int, seed: int
-):
-    flat_Q = flatten_Q(Q)
-    test_returns = evaluate_policy(
-        partial(greedy, Q=flat_Q), num_episodes, seed
+    Q: np.ndarray,
+    num_episodes: int,
+    seed: int,
+    target_ci: Optional[float] = None,
+    rules: Optional[Rules] = None,
+) -> EvaluationResult:
+    # Greedy play is deterministic, so the whole evaluation can run natively
+    return evaluate_policy(
+        compile_greedy(Q, rules), num_episodes, seed, target_ci, rules=rules
     )
-    return test_returns
 
 
 def evaluate_policy(
-    policy: Callable[[int], int], num_episodes: int, seed: int
+    policy: Union[Callable[[int], int], CompiledPolicy],
+    num_episodes: int,
+    seed: int,
+    target_ci: Optional[float] = None,
+    chunk_size: int = 1_000_000,
+    rules: Optional[Rules] = None,
+) -> EvaluationResult:
+    """Mean return of num_episodes games with its 95% confidence interval.
+
+    With target_ci the episodes are played in chunks until the interval half
+    width reaches target_ci, num_episodes is then the budget. A compiled
+    policy must have been compiled for the same rules.
+    """
+    play = _player(policy, seed, rules)
+    if target_ci is None:
+        return summarize_returns(play(num_episodes))
+    return _evaluate_until(play, target_ci, num_episodes, chunk_size)
+
+
+def play_returns(
+    policy: Union[Callable[[int], int], CompiledPolicy],
+    num_episodes: int,
+    seed: int,
+    rules: Optional[Rules] = None,
 ) -> np.ndarray:
-    env = BlackjackEnv(seed)
+    """Returns of num_episodes games, the same games evaluate_policy plays."""
+    return _player(policy, seed, rules)(num_episodes)
+
+
+def _player(
+    policy: Union[Callable[[int], int], CompiledPolicy],
+    seed: int,
+    rules: Optional[Rules],
+) -> Callable[[int], np.ndarray]:
+    env = BlackjackEnv(seed, Rules() if rules is None else rules)
+    if isinstance(policy, CompiledPolicy):
+        return partial(env.evaluate, policy.actions)
+    # Only Python policies draw from numpy's global generator
     np.random.seed(seed)
+    return partial(_play_episodes, env, policy)
+
+
+def _evaluate_until(
+    play: Callable[[int], np.ndarray],
+    target_ci: float,
+    max_episodes: int,
+    chunk_size: int,
+) -> EvaluationResult:
+    count = 0
+    mean = 0.0
+    sum_squares = 0.0  # Sum of squared deviations from the mean
+    half_width = np.inf
+    next_chunk = min(chunk_size, max_episodes)
+
+    while count < max_episodes and half_width > target_ci:
+        returns = play(next_chunk).astype(np.float64)
+        # Merge the chunk's statistics into the running ones (Chan et al.)
+        chunk_mean = returns.mean()
+        delta = chunk_mean - mean
+        total = count + len(returns)
+        mean += delta * len(returns) / total
+        sum_squares += ((returns - chunk_mean) ** 2).sum()
+        sum_squares += delta**2 * count * len(returns) / total
+        count = total
+
+        std = np.sqrt(sum_squares / (count - 1)) if count > 1 else np.inf
+        half_width = Z_95 * std / np.sqrt(count)
+
+        # Aim the next chunk at the episodes still needed, within the budget
+        needed = chunk_size
+        if np.isfinite(std):
+            needed = int(np.ceil((Z_95 * std / target_ci) ** 2)) - count
+        next_chunk = min(max(needed, chunk_size // 10, 1), chunk_size)
+        next_chunk = min(next_chunk, max_episodes - count)
+
+    return EvaluationResult(float(mean), float(half_width), count)
+
+
+def _play_episodes(
+    env: BlackjackEnv, policy: Callable[[int], int], num_episodes: int
+) -> np.ndarray:
     returns = np.zeros(num_episodes, dtype=np.float32)
     for episode in range(num_episodes):
         env.new_game()
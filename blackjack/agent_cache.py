@@ -0,0 +1,235 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+from blackjack.policy import compile_greedy
+from blackjack.state_space import initialize_Q
+from blackjack_env import BlackjackEnv, Rules
+
+if TYPE_CHECKING:
+    from blackjack.agent import Agent
+    from blackjack.multi_agent import MultiAgent
+
+AGENT_CACHE_PATH = Path("agent_cache")
+MAX_CACHE_BYTES = 2 * 1024**3  # Least recently used entries are removed past this
+
+_ENGINE_VERSIONS = {}
+
+TRAINING_MODULES = (
+    "blackjack.agent",
+    "blackjack.algorithms",
+    "blackjack.dyna",
+    "blackjack.multi_agent",
+    "blackjack.policy",
+    "blackjack.state_space",
+)
+
+
+def engine_version(rules: Optional[Rules] = None) -> str:
+    """Fingerprint of the engine's game under the rules.
+
+    Two random action tables play a fixed set of cards and their returns are
+    hashed, so any change to how the engine deals, plays or pays changes it
+    without a version number to remember to bump.
+    """
+    rules = Rules() if rules is None else rules
+    key = repr(rules)
+    if key not in _ENGINE_VERSIONS:
+        # Random values on the legal actions make tables that use all of them
+        rng = np.random.default_rng(0)
+        Q = initialize_Q(0.0)
+        tables = [compile_greedy(Q + rng.random(Q.shape), rules) for _ in range(2)]
+        actions = np.stack([table.actions for table in tables])
+        returns = BlackjackEnv(0, rules).evaluate_paired(actions, 20_000)
+        _ENGINE_VERSIONS[key] = hashlib.sha256(returns.tobytes()).hexdigest()[:16]
+    return _ENGINE_VERSIONS[key]
+
+
+def code_version(*modules) -> str:
+    # Source of what trains, a fix to an episode or any helper it calls
+    # shouldn't reuse old runs. Defaults to every module training runs through
+    digest = hashlib.sha256()
+    for module in modules or TRAINING_MODULES:
+        if isinstance(module, str):
+            module = importlib.import_module(module)
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()[:16]
+
+
+class AgentCache:
+    """Trained agents on disk, addressed by a hash of their configuration.
+
+    Everything that decides what training produces goes into the key: the
+    algorithm and the training code, decay factor, Q_init or warm start
+    tables, seed, rules and the engine's fingerprint. Training is deterministic
+    given these, so a run of N episodes is the first N episodes of any longer
+    run with the same key and an agent can pick up from the longest cached run
+    that doesn't overshoot. Entries are <key>-<episodes>.npz files holding the
+    tables, the random generator states to continue from and the configuration
+    as JSON.
+
+    Hits refresh an entry's modification time, and once the directory is
+    larger than max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(
+        self, directory: Path = AGENT_CACHE_PATH, max_bytes: int = MAX_CACHE_BYTES
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def key(self, config: dict) -> str:
+        encoded = json.dumps(config, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(
+        self, config: dict, max_episodes: int, min_episodes: int = 1
+    ) -> Optional[tuple[int, dict]]:
+        """The longest cached run of config with min_episodes to max_episodes
+        episodes, as (episodes, arrays), or None."""
+        key = self.key(config)
+        runs = []
+        for path in self.directory.glob(f"{key}-*.npz"):
+            episodes = path.stem.rsplit("-", 1)[1]
+            if episodes.isdigit() and min_episodes <= int(episodes) <= max_episodes:
+                runs.append((int(episodes), path))
+        if not runs:
+            return None
+        episodes, path = max(runs)
+        with np.load(path) as entry:
+            arrays = dict(entry)
+        os.utime(path)
+        return episodes, arrays
+
+    def put(self, config: dict, episodes: int, arrays: dict) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.key(config)}-{episodes}.npz"
+        metadata = json.dumps({**config, "episodes": episodes}, sort_keys=True)
+        # Written under another name first so readers never see half a file
+        partial = path.with_name(path.stem + ".partial.npz")
+        np.savez(partial, metadata=np.array(metadata), **arrays)
+        os.replace(partial, path)
+        self.evict()
+        return path
+
+    def evict(self) -> list[Path]:
+        """Delete the least recently used entries until under max_bytes."""
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed.append(path)
+        return removed
+
+    def restore(self, agent: "Agent", max_episodes: int) -> int:
+        """Move the agent to the longest cached run of its configuration that
+        is ahead of it, up to max_episodes. Returns the episodes skipped."""
+        hit = self.get(agent_config(agent), max_episodes, agent.episodes_trained + 1)
+        if hit is None:
+            return 0
+        episodes, arrays = hit
+        agent.Q[...] = arrays["Q"]
+        agent.N[...] = arrays["N"]
+        if agent.Q_pair is not None:
+            agent.Q_pair[...] = arrays["Q_pair"]
+        if agent.model is not None:
+            prefix = "model_"
+            agent.model.load_arrays(
+                {
+                    name[len(prefix) :]: table
+                    for name, table in arrays.items()
+                    if name.startswith(prefix)
+                }
+            )
+        agent.env.rng_state = str(arrays["env_rng"])
+        agent.np_random_state = (
+            "MT19937",
+            arrays["np_keys"],
+            int(arrays["np_pos"]),
+            int(arrays["np_has_gauss"]),
+            float(arrays["np_gauss"]),
+        )
+        skipped = episodes - agent.episodes_trained
+        agent.episodes_trained = episodes
+        return skipped
+
+    def save(self, agent: "Agent") -> Path:
+        _, keys, pos, has_gauss, gauss = agent.np_random_state
+        arrays = {
+            "Q": agent.Q,
+            "N": agent.N,
+            "env_rng": np.array(agent.env.rng_state),
+            "np_keys": keys,
+            "np_pos": np.array(pos),
+            "np_has_gauss": np.array(has_gauss),
+            "np_gauss": np.array(gauss),
+        }
+        if agent.Q_pair is not None:
+            arrays["Q_pair"] = agent.Q_pair
+        if agent.model is not None:
+            for name, table in agent.model.arrays().items():
+                arrays[f"model_{name}"] = table
+        return self.put(agent_config(agent), agent.episodes_trained, arrays)
+
+    def restore_lockstep(self, agents: "MultiAgent", num_episodes: int) -> bool:
+        """Load agents trained for exactly num_episodes, if cached.
+
+        The agents share one vectorized engine whose generator can't be saved,
+        so unlike restore there is no picking up from a shorter run.
+        """
+        if agents.episodes_trained:
+            return False
+        hit = self.get(lockstep_config(agents), num_episodes, num_episodes)
+        if hit is None:
+            return False
+        _, arrays = hit
+        agents.Q[...] = arrays["Q"]
+        agents.N[...] = arrays["N"]
+        agents.episodes_trained = num_episodes
+        return True
+
+    def save_lockstep(self, agents: "MultiAgent") -> Path:
+        arrays = {"Q": agents.Q, "N": agents.N}
+        return self.put(lockstep_config(agents), agents.episodes_trained, arrays)
+
+
+def agent_config(agent: "Agent") -> dict:
+    return {
+        "trainer": "agent",
+        "algorithm": agent.algo_name,
+        "code": code_version(),
+        "decay_factor": (
+            None if agent.decay_factor is None else float(agent.decay_factor)
+        ),
+        "Q_init": float(agent.Q_init),
+        "warm_start": agent.warm_start_digest,
+        "seed": agent.seed,
+        "rules": repr(agent.rules),
+        "engine": engine_version(agent.rules),
+    }
+
+
+def lockstep_config(agents: "MultiAgent") -> dict:
+    return {
+        "trainer": "lockstep",
+        "algorithms": [int(algorithm) for algorithm in agents.algorithms],
+        "code": code_version(),
+        "decay_factors": [float(d) for d in agents.decay_factors],
+        "Q_init": float(agents.initial_Q.max()),
+        "seed": agents.seed,
+        "rules": repr(agents.rules),
+        "engine": engine_version(agents.rules),
+    }
@@ -1,13 +1,19 @@
 import numpy as np
 
+from blackjack.dyna import TransitionModel
 from blackjack.policy import epsilon_greedy, expected_epsilon_greedy_return, random
 from blackjack.state_space import Action
 from blackjack_env import BlackjackEnv
-from typing import Callable
+from typing import Callable, Optional
 
 EpisodeRunner = Callable[[np.ndarray, np.ndarray, BlackjackEnv], float]
 
-def q_learning_episode(Q: np.ndarray, N: np.ndarray, env: BlackjackEnv) -> float:
+def q_learning_episode(
+    Q: np.ndarray,
+    N: np.ndarray,
+    env: BlackjackEnv,
+    model: Optional[TransitionModel] = None,
+) -> float:
     env.new_game()
     game_terminated = False
     episode_return = 0
@@ -18,6 +24,8 @@ def q_learning_episode(Q: np.ndarray, N: np.ndarray, env: BlackjackEnv) -> float
         action = random(state, Q)
         N[state, action] += 1
         result = env.play_hand(action)
+        if model is not None:
+            model.add(state, action, result)
 
         expected_return = result.reward
         # Q-learning uses greedy target policy (always picks best action)
@@ -32,6 +40,48 @@ def q_learning_episode(Q: np.ndarray, N: np.ndarray, env: BlackjackEnv) -> float
         game_terminated = result.terminated
         episode_return += result.reward
 
+    if model is not None:
+        model.end_episode(Q)
+    return episode_return
+
+
+def dyna_q_episode(
+    Q: np.ndarray, N: np.ndarray, env: BlackjackEnv, model: TransitionModel
+) -> float:
+    # Q-learning on the real episode, whose outcomes are counted in the model.
+    # Every planning_interval episodes prioritized sweeps back up Q from the
+    # model, spreading what was seen without playing any more cards
+    return q_learning_episode(Q, N, env, model)
+
+
+def double_q_learning_episode(Q: np.ndarray, N: np.ndarray, env: BlackjackEnv) -> float:
+    # Q holds two estimates per state side by side, Q[state, 0] and Q[state, 1],
+    # and N counts their updates separately. Each step updates one of them
+    # towards the other's value of its own best action, bootstrapping from the
+    # max of a single noisy estimate would be biased upwards
+    env.new_game()
+    game_terminated = False
+    episode_return = 0
+
+    while not game_terminated:
+        state = env.get_state()
+        action = random(state, Q[:, 0])
+        table = np.random.randint(2)
+        N[state, table, action] += 1
+        result = env.play_hand(action)
+
+        expected_return = result.reward
+        for next_state in (result.next_state, result.split_state):
+            if next_state != -1:
+                best_action = np.argmax(Q[next_state, table])
+                expected_return += Q[next_state, 1 - table, best_action]
+
+        Q[state, table, action] += (1 / N[state, table, action]) * (
+            expected_return - Q[state, table, action]
+        )
+        game_terminated = result.terminated
+        episode_return += result.reward
+
     return episode_return
 
 
@@ -121,7 +171,21 @@ def monte_carlo_episode(
             if np.isnan(episode_returns[state_action_idx]):
                 visited_sa.append(state_action_idx)
 
-            env.play_hand(action)
+            result = env.play_hand(action)
+            game_terminated = result.terminated
+
+            # Split aces settle on their one card straight away, the reward
+            # covers every hand that didn't get a state to play on
+            settled = (result.next_state == -1) + (result.split_state == -1)
+            if settled >= 1:
+                final_return += result.reward
+                _finalize_hand_returns(
+                    episode_returns, set(), result.reward, split_stack, visited_sa
+                )
+            if settled == 2:
+                _finalize_hand_returns(
+                    episode_returns, set(), 0, split_stack, visited_sa
+                )
         else:
             # Track first-visit for this hand
             if state_action_idx not in current_sa:
@@ -220,12 +284,197 @@ def _get_expected_return(
     # expected_epsilon_greedy_return returns the expected value directly
     return expected_epsilon_greedy_return(state, Q, num_visits, decay_factor)
 
+TRACE_DECAY = 0.8  # Lambda of SARSA Lambda and Q Lambda
+NUM_STEPS = 4  # Rewards summed before n-step SARSA bootstraps
+
+
+def sarsa_lambda_episode(
+    Q: np.ndarray,
+    N: np.ndarray,
+    env: BlackjackEnv,
+    decay_factor: int,
+    trace_decay: float = TRACE_DECAY,
+) -> float:
+    return _trace_episode(Q, N, env, decay_factor, trace_decay, watkins=False)
+
+
+def q_lambda_episode(
+    Q: np.ndarray,
+    N: np.ndarray,
+    env: BlackjackEnv,
+    decay_factor: int,
+    trace_decay: float = TRACE_DECAY,
+) -> float:
+    # Watkins's Q(lambda), traces are cut after an exploratory action so only
+    # greedy continuations are credited to earlier steps
+    return _trace_episode(Q, N, env, decay_factor, trace_decay, watkins=True)
+
+
+def _trace_episode(
+    Q: np.ndarray,
+    N: np.ndarray,
+    env: BlackjackEnv,
+    decay_factor: int,
+    trace_decay: float,
+    watkins: bool,
+) -> float:
+    env.new_game()
+    game_terminated = False
+    episode_return = 0
+
+    # Eligibility of the steps that led to the hand being played, as
+    # (state, action, eligibility). A split gives both hands a copy, the value
+    # of a split is the sum of both hands so each one credits it separately.
+    # Hands waiting on the stack keep their trace and the action chosen for them
+    trace = []
+    waiting = []
+    planned_state, action = -1, None
+
+    while not game_terminated:
+        state = env.get_state()
+        # A hand that waited for its split pair can lose the option to split
+        # again once the table limit is reached, then its action is chosen anew
+        if planned_state != state:
+            action = epsilon_greedy(state, Q, N[state].sum() + 1, decay_factor)
+        N[state, action] += 1
+        result = env.play_hand(action)
+
+        # Actions of the hands played next are chosen now, SARSA bootstraps
+        # from them and they are the actions those hands then take
+        next_states = [s for s in (result.next_state, result.split_state) if s != -1]
+        next_actions = [
+            epsilon_greedy(s, Q, N[s].sum() + 1, decay_factor) for s in next_states
+        ]
+        expected_return = result.reward
+        for next_state, next_action in zip(next_states, next_actions):
+            if watkins:
+                expected_return += np.max(Q[next_state])
+            else:
+                expected_return += Q[next_state, next_action]
+
+        td_error = expected_return - Q[state, action]
+        # Rebuilt rather than appended to, the trace may be shared with a split hand
+        trace = trace + [(state, action, 1.0)]
+        for s, a, eligibility in trace:
+            Q[s, a] += (1 / N[s, a]) * eligibility * td_error
+        trace = [(s, a, eligibility * trace_decay) for s, a, eligibility in trace]
+
+        branches = []
+        for next_state, next_action in zip(next_states, next_actions):
+            if watkins and Q[next_state, next_action] < np.max(Q[next_state]):
+                branches.append(([], next_state, next_action))
+            else:
+                branches.append((trace, next_state, next_action))
+        # The hand in split_state is played after everything on top of it
+        waiting.extend(reversed(branches[1:]))
+        if branches:
+            trace, planned_state, action = branches[0]
+        elif waiting:
+            trace, planned_state, action = waiting.pop()
+
+        game_terminated = result.terminated
+        episode_return += result.reward
+
+    return episode_return
+
+
+class _NStepReturn:
+    # Return of one step collected until every branch after it has either
+    # finished or bootstrapped num_steps steps later
+    __slots__ = ("state", "action", "target", "open_branches")
+
+    def __init__(self, state: int, action: int) -> None:
+        self.state = state
+        self.action = action
+        self.target = 0.0
+        self.open_branches = 1
+
+
+def n_step_sarsa_episode(
+    Q: np.ndarray,
+    N: np.ndarray,
+    env: BlackjackEnv,
+    decay_factor: int,
+    num_steps: int = NUM_STEPS,
+) -> float:
+    env.new_game()
+    game_terminated = False
+    episode_return = 0
+
+    # Returns still being collected by the hand being played, as
+    # (return, steps since it). After a split both hands share them, each
+    # return adds the rewards of both branches and waits for both to close
+    pending = []
+    waiting = []
+    planned_state, action = -1, None
+
+    while not game_terminated:
+        state = env.get_state()
+        # A hand that waited for its split pair can lose the option to split
+        # again once the table limit is reached, then its action is chosen anew
+        if planned_state != state:
+            action = epsilon_greedy(state, Q, N[state].sum() + 1, decay_factor)
+        N[state, action] += 1
+        result = env.play_hand(action)
+
+        next_states = [s for s in (result.next_state, result.split_state) if s != -1]
+        next_actions = [
+            epsilon_greedy(s, Q, N[s].sum() + 1, decay_factor) for s in next_states
+        ]
+        bootstrap = sum(Q[s, a] for s, a in zip(next_states, next_actions))
+
+        still_pending = []
+        for step_return, steps in pending + [(_NStepReturn(state, action), 0)]:
+            step_return.target += result.reward
+            if steps + 1 == num_steps:
+                step_return.target += bootstrap
+                step_return.open_branches -= 1
+            else:
+                # The branch ends, continues or splits in two
+                step_return.open_branches += len(next_states) - 1
+                if next_states:
+                    still_pending.append((step_return, steps + 1))
+            if step_return.open_branches == 0:
+                s, a = step_return.state, step_return.action
+                Q[s, a] += (1 / N[s, a]) * (step_return.target - Q[s, a])
+        pending = still_pending
+
+        branches = [(pending, *planned) for planned in zip(next_states, next_actions)]
+        waiting.extend(reversed(branches[1:]))
+        if branches:
+            pending, planned_state, action = branches[0]
+        elif waiting:
+            pending, planned_state, action = waiting.pop()
+
+        game_terminated = result.terminated
+        episode_return += result.reward
+
+    return episode_return
+
+
 ALGORITHMS_MAP = {
     "Q Learning": q_learning_episode,
+    "Double Q Learning": double_q_learning_episode,
+    "Dyna Q": dyna_q_episode,
     "SARSA": sarsa_episode,
     "Expected SARSA": expected_sarsa_episode,
-    "Monte Carlo": monte_carlo_episode
+    "Monte Carlo": monte_carlo_episode,
+    "SARSA Lambda": sarsa_lambda_episode,
+    "Q Lambda": q_lambda_episode,
+    "n-step SARSA": n_step_sarsa_episode,
+}
+
+EPSILON_ALGORITHMS = {
+    sarsa_episode,
+    expected_sarsa_episode,
+    monte_carlo_episode,
+    sarsa_lambda_episode,
+    q_lambda_episode,
+    n_step_sarsa_episode,
 }
 
-EPSILON_ALGORITHMS = {sarsa_episode, expected_sarsa_episode, monte_carlo_episode}
+# Trained on two interleaved tables, see double_q_learning_episode
+DOUBLE_ALGORITHMS = {double_q_learning_episode}
 
+# Given a TransitionModel of their own by Agent, see dyna_q_episode
+MODEL_ALGORITHMS = {dyna_q_episode}
@@ -0,0 +1,105 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from blackjack.basic_strategy import BASIC_STRATEGY_ACTIONS
+from blackjack.state_space import (
+    NUM_STATES,
+    VALID_STATES,
+    Action,
+    State,
+    decode_state,
+)
+
+# Flat state index bits, see get_hand_state in src/main.cpp
+_STATES = np.arange(NUM_STATES)
+_CAN_SPLIT = (_STATES % 2).astype(bool)
+_USEABLE_ACE = ((_STATES // 4) % 2).astype(bool)
+
+REGIONS = {
+    "hard": VALID_STATES & ~_USEABLE_ACE & ~_CAN_SPLIT,
+    "soft": VALID_STATES & _USEABLE_ACE & ~_CAN_SPLIT,
+    "pair": VALID_STATES & _CAN_SPLIT,
+}
+
+
+class AgreementReport(NamedTuple):
+    # Each field has one entry per Q table
+    hard: np.ndarray
+    soft: np.ndarray
+    pair: np.ndarray
+    overall: np.ndarray
+    weighted_disagreement: Optional[np.ndarray]  # None when N isn't given
+
+
+class Disagreement(NamedTuple):
+    state: State
+    learned: Action
+    basic: Action
+    q_gap: float  # Q(learned) - Q(basic), how much better the table thinks it is
+
+
+def stack_tables(tables) -> np.ndarray:
+    """Reshape one table, a stacked array or a list of tables to (K, NUM_STATES, 4)."""
+    if isinstance(tables, (list, tuple)):
+        tables = np.stack([np.asarray(table) for table in tables])
+    tables = np.asarray(tables)
+    return tables.reshape(-1, NUM_STATES, len(Action))
+
+
+def greedy_actions(Q) -> np.ndarray:
+    return np.argmax(stack_tables(Q), axis=-1)
+
+
+def q_gaps(Q) -> np.ndarray:
+    """Q(greedy) - Q(basic strategy) for every table and state, 0 where unreachable."""
+    Qs = stack_tables(Q)
+    basic = np.where(VALID_STATES, BASIC_STRATEGY_ACTIONS, 0)
+    basic_values = np.take_along_axis(Qs, basic[None, :, None], axis=-1)[..., 0]
+    gaps = Qs.max(axis=-1) - basic_values
+    return np.where(VALID_STATES, gaps, 0.0)
+
+
+def policy_agreement(Q, N=None) -> AgreementReport:
+    agree = greedy_actions(Q) == BASIC_STRATEGY_ACTIONS
+
+    def rate(region: np.ndarray) -> np.ndarray:
+        return agree[:, region].mean(axis=1)
+
+    weighted = None
+    if N is not None:
+        visits = stack_tables(N).sum(axis=-1, dtype=np.float64) * VALID_STATES
+        disagree_visits = (visits * ~agree).sum(axis=1)
+        total_visits = visits.sum(axis=1)
+        weighted = np.divide(
+            disagree_visits,
+            total_visits,
+            out=np.full_like(total_visits, np.nan),
+            where=total_visits > 0,
+        )
+
+    return AgreementReport(
+        hard=rate(REGIONS["hard"]),
+        soft=rate(REGIONS["soft"]),
+        pair=rate(REGIONS["pair"]),
+        overall=rate(VALID_STATES),
+        weighted_disagreement=weighted,
+    )
+
+
+def disagreements(Q: np.ndarray) -> list[Disagreement]:
+    """States where a single Q table's greedy action differs from basic strategy."""
+    learned = greedy_actions(Q)[0]
+    gaps = q_gaps(Q)[0]
+    states = np.flatnonzero(VALID_STATES & (learned != BASIC_STRATEGY_ACTIONS))
+    # Largest gaps first, these are the decisions the table is most sure about
+    states = states[np.argsort(-gaps[states], kind="stable")]
+    return [
+        Disagreement(
+            decode_state(int(state)),
+            Action(learned[state]),
+            Action(BASIC_STRATEGY_ACTIONS[state]),
+            float(gaps[state]),
+        )
+        for state in states
+    ]
@@ -0,0 +1,75 @@
+import time
+from typing import Optional, Sequence
+
+from blackjack.agent import Agent, evaluate_Q, play_returns
+from blackjack.basic_strategy import basic_strategy
+from blackjack.multi_agent import MultiAgent
+from blackjack.evaluation import evaluate_threaded
+from blackjack.policy import compile_policy
+from blackjack_env import Rules
+
+
+def episodes_per_second(num_episodes: int, seconds: float) -> float:
+    return num_episodes / seconds if seconds > 0 else float("inf")
+
+
+def bench_training(
+    algo_name: str, decay_factor: Optional[int], num_episodes: int, seed: int = 42
+) -> float:
+    agent = Agent(algo_name, Q_init=0, decay_factor=decay_factor, seed=seed)
+    start = time.perf_counter()
+    agent.train(num_episodes)
+    return episodes_per_second(num_episodes, time.perf_counter() - start)
+
+
+def episodes_to_target(
+    algo_name: str,
+    decay_factor: Optional[int],
+    target_return: float,
+    max_episodes: int,
+    check_every: int,
+    eval_episodes: int = 1_000_000,
+    seed: int = 42,
+) -> Optional[int]:
+    # Training episodes until the greedy policy's mean return reaches the
+    # target, every check plays the same cards. None if it isn't reached
+    agent = Agent(algo_name, Q_init=0, decay_factor=decay_factor, seed=seed)
+    while agent.episodes_trained < max_episodes:
+        agent.train(min(check_every, max_episodes - agent.episodes_trained))
+        result = evaluate_Q(agent.Q, eval_episodes, seed, rules=agent.rules)
+        if result.mean >= target_return:
+            return agent.episodes_trained
+    return None
+
+
+def bench_lockstep(
+    algo_name: str, decay_factors: Sequence[int], num_episodes: int, seed: int = 42
+) -> float:
+    # Episodes per second summed over all the agents
+    agents = MultiAgent(algo_name, Q_init=0, decay_factors=decay_factors, seed=seed)
+    start = time.perf_counter()
+    agents.train(num_episodes)
+    total_episodes = num_episodes * len(decay_factors)
+    return episodes_per_second(total_episodes, time.perf_counter() - start)
+
+
+def bench_evaluation(
+    num_episodes: int,
+    seed: int = 42,
+    native: bool = True,
+    rules: Optional[Rules] = None,
+) -> float:
+    policy = compile_policy(basic_strategy, rules) if native else basic_strategy
+    start = time.perf_counter()
+    play_returns(policy, num_episodes, seed, rules=rules)
+    return episodes_per_second(num_episodes, time.perf_counter() - start)
+
+
+def bench_threads(
+    num_episodes: int, num_threads: int, seed: int = 42, rules: Optional[Rules] = None
+) -> float:
+    # Native evaluation spread over a thread pool, scales with the cores free
+    policy = compile_policy(basic_strategy, rules)
+    start = time.perf_counter()
+    evaluate_threaded(policy, num_episodes, seed, num_threads, rules)
+    return episodes_per_second(num_episodes, time.perf_counter() - start)
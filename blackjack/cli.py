@@ -0,0 +1,465 @@
+"""Command line entry point, run with `python -m blackjack <command>`.
+
+Only argparse is imported up front. Each command imports what it needs when
+it runs, so `--help` and light commands don't pay for numpy, sqlite, polars
+or plotly. Flags that aren't given fall back to the constants in the scripts.
+"""
+
+import argparse
+from pathlib import Path
+
+# Flags left unset are absent from the namespace so script defaults apply
+UNSET = argparse.SUPPRESS
+
+
+def _given(args: argparse.Namespace, *names: str) -> dict:
+    return {name: getattr(args, name) for name in names if hasattr(args, name)}
+
+
+def _check_algorithms(parser: argparse.ArgumentParser, algorithms) -> None:
+    from blackjack.algorithms import ALGORITHMS_MAP
+
+    for algo in algorithms:
+        if algo not in ALGORITHMS_MAP:
+            parser.error(
+                f"unknown algorithm {algo!r}, choose from {', '.join(ALGORITHMS_MAP)}"
+            )
+
+
+def _train(args: argparse.Namespace) -> None:
+    from train_agent import NUM_TRAIN_EPISODES, train_agent
+
+    _check_algorithms(args.parser, [args.algo])
+    num_episodes = getattr(args, "num_episodes", NUM_TRAIN_EPISODES)
+    if max(getattr(args, "milestones", [0])) > num_episodes:
+        args.parser.error(f"milestones can't be past --episodes ({num_episodes})")
+    kwargs = _given(
+        args,
+        "decay_factor",
+        "num_episodes",
+        "seed",
+        "save_dir",
+        "snapshot_interval",
+        "snapshot_episodes",
+        "milestones",
+        "milestone_episodes",
+        "warm_start",
+        "prior_visits",
+        "prior_weight",
+    )
+    # A profiled run loaded from the cache would have nothing to profile
+    kwargs["cache_agents"] = not (args.no_cache or hasattr(args, "profile"))
+    if hasattr(args, "profile"):
+        from blackjack.profiling import report, run_profiled
+
+        kwargs["num_episodes"] = _profile_episodes(args)
+        path, stats = run_profiled(train_agent, args.algo, **kwargs)
+        label = f"{kwargs['num_episodes']:,} training episodes"
+        print(report(stats, path.with_suffix(".prof"), label))
+    else:
+        path = train_agent(args.algo, **kwargs)
+    print(f"Saved {path}")
+
+
+def _profile_episodes(args: argparse.Namespace) -> int:
+    from blackjack.profiling import PROFILE_EPISODES
+
+    return args.profile or PROFILE_EPISODES
+
+
+def _evaluate(args: argparse.Namespace) -> None:
+    import evaluate_agent
+
+    kwargs = _given(args, "num_episodes", "seed", "target_ci")
+    if args.agents:
+        kwargs["agent_files"] = tuple(args.agents)
+    kwargs.update(
+        baselines=not args.no_baselines,
+        paired=not args.independent,
+        control_variate=not (args.independent or args.no_control_variate),
+    )
+    if hasattr(args, "profile"):
+        from blackjack.profiling import report, run_profiled
+        from blackjack.results import DATABASE_PATH
+
+        kwargs["num_episodes"] = _profile_episodes(args)
+        _, stats = run_profiled(evaluate_agent.main, **kwargs)
+        path = DATABASE_PATH.with_name("evaluate.prof")
+        print(report(stats, path, f"evaluation of {kwargs['num_episodes']:,} episodes"))
+    else:
+        evaluate_agent.main(**kwargs)
+
+
+def _sweep(args: argparse.Namespace) -> None:
+    import compare_algos
+
+    if hasattr(args, "algorithms"):
+        _check_algorithms(args.parser, args.algorithms)
+    compare_algos.main(
+        **_given(
+            args,
+            "train_episodes",
+            "test_episodes",
+            "algorithms",
+            "decay_factor_step_size",
+            "decay_factor_max",
+            "seed",
+            "search",
+            "halving_rungs",
+            "halving_eta",
+        ),
+        cache_agents=not args.no_cache,
+        chain_trials=args.chain,
+    )
+
+
+def _plot(args: argparse.Namespace) -> None:
+    if args.save_path:
+        args.save_path.mkdir(parents=True, exist_ok=True)
+
+    if args.kind == "strategy":
+        from blackjack.visualizer import render_strategies
+
+        if not args.q_tables:
+            args.parser.error("plot strategy needs --q-tables")
+        save_path = args.save_path or Path("plots")
+        paths = render_strategies(args.q_tables, save_path, args.diff, args.workers)
+        print(f"Rendered {len(paths)} strategy plots to {save_path}")
+        return
+
+    import plot_results
+
+    if args.experiment_id is None:
+        args.parser.error(f"plot {args.kind} needs --experiment-id")
+    if args.kind == "compare":
+        plot_results.plot_compare_algos(args.experiment_id, args.save_path)
+    else:
+        plot_results.plot_learning_curves(
+            args.experiment_id, args.save_path, **_given(args, "bucket_size")
+        )
+
+
+def _solve(args: argparse.Namespace) -> None:
+    import solve_rules
+    from blackjack_env import DoubleRule
+
+    double_rules = {
+        "any": DoubleRule.ANY,
+        "9-11": DoubleRule.NINE_TO_ELEVEN,
+        "10-11": DoubleRule.TEN_OR_ELEVEN,
+    }
+    choices = _given(
+        args,
+        "hit_soft_17",
+        "blackjack_payout",
+        "double_after_split",
+        "max_hands",
+        "resplit_aces",
+        "double_on",
+    )
+    for name in ("hit_soft_17", "double_after_split", "resplit_aces"):
+        if name in choices:
+            choices[name] = [choice in ("hit", "yes") for choice in choices[name]]
+    if "double_on" in choices:
+        choices["double_on"] = [double_rules[choice] for choice in choices["double_on"]]
+    solve_rules.main(
+        {**solve_rules.RULE_GRID, **choices},
+        cache_strategies=not args.no_cache,
+        **_given(args, "workers", "save_dir"),
+    )
+
+
+def _bench(args: argparse.Namespace) -> None:
+    from blackjack.bench import (
+        bench_evaluation,
+        bench_lockstep,
+        bench_threads,
+        bench_training,
+        episodes_to_target,
+    )
+    from blackjack.algorithms import ALGORITHMS_MAP, EPSILON_ALGORITHMS
+    from blackjack.multi_agent import LOCKSTEP_ALGORITHMS
+    from blackjack.solver import changed_rules_name
+    from blackjack_env import DoubleRule, Rules
+
+    _check_algorithms(args.parser, args.algorithms)
+    decay_factors = {
+        algo: args.decay_factor if ALGORITHMS_MAP[algo] in EPSILON_ALGORITHMS else None
+        for algo in args.algorithms
+    }
+    for algo in args.algorithms:
+        decay_factor = decay_factors[algo]
+        speed = bench_training(algo, decay_factor, args.num_episodes, args.seed)
+        print(f"train {algo:<16} {speed:>14,.0f} episodes/s")
+        if algo in LOCKSTEP_ALGORITHMS and args.lockstep_agents > 1:
+            lockstep_decay_factors = [decay_factor] * args.lockstep_agents
+            # Each agent gets a share of the episodes so the bench takes as long
+            episodes = max(1, args.num_episodes // args.lockstep_agents)
+            speed = bench_lockstep(algo, lockstep_decay_factors, episodes, args.seed)
+            label = f"{algo} x{args.lockstep_agents}"
+            print(f"train {label:<16} {speed:>14,.0f} episodes/s")
+
+    if args.target_return is not None:
+        # Sample efficiency rather than speed, checked every --episodes episodes
+        for algo in args.algorithms:
+            episodes = episodes_to_target(
+                algo,
+                decay_factors[algo],
+                args.target_return,
+                args.target_max_episodes,
+                args.num_episodes,
+                seed=args.seed,
+            )
+            reached = "not reached" if episodes is None else f"{episodes:,}"
+            print(f"to {args.target_return:+.4f} {algo:<16} {reached:>11} episodes")
+
+    for native in (False, True):
+        speed = bench_evaluation(args.num_episodes, args.seed, native)
+        label = "native" if native else "python"
+        print(f"evaluate {label:<13} {speed:>14,.0f} episodes/s")
+
+    # Every rule set runs its own specialized engine, so should match the above
+    rules = Rules(
+        hit_soft_17=False,
+        blackjack_payout=1.2,
+        double_after_split=False,
+        max_hands=4,
+        resplit_aces=True,
+        double_on=DoubleRule.TEN_OR_ELEVEN,
+    )
+    speed = bench_evaluation(args.num_episodes, args.seed, rules=rules)
+    label = changed_rules_name(rules)
+    print(f"evaluate {'native':<13} {speed:>14,.0f} episodes/s ({label})")
+
+    # Each thread gets the same number of episodes as the single thread run
+    for num_threads in args.threads:
+        episodes = args.num_episodes * num_threads
+        speed = bench_threads(episodes, num_threads, args.seed)
+        label = f"x{num_threads} threads"
+        print(f"evaluate {label:<13} {speed:>14,.0f} episodes/s")
+
+
+def _add_profile_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        type=int,
+        const=0,
+        default=UNSET,
+        metavar="EPISODES",
+        help="run only this many episodes (default 100,000) under cProfile, save the "
+        "stats next to the output and print the time per component",
+    )
+
+
+def _add_cache_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="train from scratch instead of loading or continuing cached agents",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m blackjack",
+        description="Train, evaluate and compare blackjack reinforcement learning agents.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="train one agent and save its Q table")
+    train.add_argument("--algo", default="Q Learning", help="algorithm name")
+    train.add_argument("--decay-factor", type=int, default=UNSET)
+    train.add_argument("--episodes", dest="num_episodes", type=int, default=UNSET)
+    train.add_argument("--seed", type=int, default=UNSET)
+    train.add_argument("--save-dir", type=Path, default=UNSET)
+    train.add_argument(
+        "--snapshot-every",
+        dest="snapshot_interval",
+        type=int,
+        default=UNSET,
+        help="evaluate a greedy snapshot every this many episodes while training",
+    )
+    train.add_argument("--snapshot-episodes", type=int, default=UNSET)
+    train.add_argument(
+        "--milestones",
+        nargs="+",
+        type=int,
+        default=UNSET,
+        help="save Q and N when training reaches each of these episode counts",
+    )
+    train.add_argument(
+        "--milestone-episodes",
+        type=int,
+        default=UNSET,
+        help="evaluate the greedy policy on this many episodes at each milestone",
+    )
+    train.add_argument(
+        "--warm-start",
+        default=UNSET,
+        metavar="SOURCE",
+        help="start from a Q table (.npy), a milestone snapshot (.npz) or 'basic' "
+        "for a basic strategy prior",
+    )
+    train.add_argument(
+        "--prior-visits",
+        type=int,
+        default=UNSET,
+        help="visits a warm start without N is worth (default 10)",
+    )
+    train.add_argument(
+        "--prior-weight",
+        type=float,
+        default=UNSET,
+        help="scale for a milestone snapshot's N (default 1)",
+    )
+    _add_cache_argument(train)
+    _add_profile_argument(train)
+    train.set_defaults(handler=_train)
+
+    evaluate = commands.add_parser(
+        "evaluate", help="evaluate saved agents and baselines into the results store"
+    )
+    evaluate.add_argument("agents", nargs="*", type=Path, help="saved Q tables (.npy)")
+    evaluate.add_argument("--episodes", dest="num_episodes", type=int, default=UNSET)
+    evaluate.add_argument("--seed", type=int, default=UNSET)
+    evaluate.add_argument(
+        "--target-ci",
+        type=float,
+        default=UNSET,
+        help="stop once the 95%% CI half width reaches this (episodes is the budget)",
+    )
+    evaluate.add_argument(
+        "--no-baselines",
+        action="store_true",
+        help="skip basic strategy and the random policy",
+    )
+    evaluate.add_argument(
+        "--independent",
+        action="store_true",
+        help="give each agent its own cards instead of pairing them with basic",
+    )
+    evaluate.add_argument(
+        "--no-control-variate",
+        action="store_true",
+        help="report differences from basic instead of correcting agents' means",
+    )
+    _add_profile_argument(evaluate)
+    evaluate.set_defaults(handler=_evaluate)
+
+    sweep = commands.add_parser(
+        "sweep", help="compare algorithms over a grid of decay factors"
+    )
+    sweep.add_argument("--train-episodes", type=int, default=UNSET)
+    sweep.add_argument("--test-episodes", type=int, default=UNSET)
+    sweep.add_argument("--algorithms", nargs="+", default=UNSET)
+    sweep.add_argument(
+        "--decay-step", dest="decay_factor_step_size", type=int, default=UNSET
+    )
+    sweep.add_argument("--decay-max", dest="decay_factor_max", type=int, default=UNSET)
+    sweep.add_argument("--seed", type=int, default=UNSET)
+    sweep.add_argument(
+        "--search",
+        choices=["grid", "halving"],
+        default=UNSET,
+        help="train every decay factor fully, or prune them by successive halving",
+    )
+    sweep.add_argument("--rungs", dest="halving_rungs", type=int, default=UNSET)
+    sweep.add_argument(
+        "--eta", dest="halving_eta", type=int, default=UNSET, help="halving rate"
+    )
+    sweep.add_argument(
+        "--chain",
+        action="store_true",
+        help="warm start each grid trial from the previous decay factor's table",
+    )
+    _add_cache_argument(sweep)
+    sweep.set_defaults(handler=_sweep)
+
+    solve = commands.add_parser(
+        "solve",
+        help="solve the optimal strategy of every combination of the given rules",
+    )
+    solve.add_argument(
+        "--soft-17",
+        dest="hit_soft_17",
+        nargs="+",
+        choices=["hit", "stand"],
+        default=UNSET,
+    )
+    solve.add_argument(
+        "--payout", dest="blackjack_payout", nargs="+", type=float, default=UNSET
+    )
+    solve.add_argument(
+        "--das",
+        dest="double_after_split",
+        nargs="+",
+        choices=["yes", "no"],
+        default=UNSET,
+    )
+    solve.add_argument("--max-hands", nargs="+", type=int, default=UNSET)
+    solve.add_argument(
+        "--resplit-aces", nargs="+", choices=["yes", "no"], default=UNSET
+    )
+    solve.add_argument(
+        "--double-on", nargs="+", choices=["any", "9-11", "10-11"], default=UNSET
+    )
+    solve.add_argument("--workers", type=int, default=UNSET, help="solver processes")
+    solve.add_argument("--save-dir", type=Path, default=UNSET)
+    solve.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="solve every variant again instead of loading cached solutions",
+    )
+    solve.set_defaults(handler=_solve)
+
+    plot = commands.add_parser("plot", help="plot experiment results or a Q table")
+    plot.add_argument("kind", choices=["compare", "curves", "strategy"])
+    plot.add_argument("--experiment-id", type=int)
+    plot.add_argument(
+        "--q-tables", nargs="+", type=Path, help="Q tables (.npy) for strategy plots"
+    )
+    plot.add_argument(
+        "--diff", action="store_true", help="show where strategies differ from basic"
+    )
+    plot.add_argument("--workers", type=int, default=1, help="export processes")
+    plot.add_argument("--save-path", type=Path)
+    plot.add_argument("--bucket-size", type=int, default=UNSET)
+    plot.set_defaults(handler=_plot)
+
+    bench = commands.add_parser("bench", help="measure training and evaluation speed")
+    bench.add_argument("--episodes", dest="num_episodes", type=int, default=100_000)
+    bench.add_argument(
+        "--algorithms",
+        nargs="+",
+        default=["Q Learning", "SARSA"],
+        help="algorithms to time",
+    )
+    bench.add_argument("--decay-factor", type=int, default=100)
+    bench.add_argument("--seed", type=int, default=42)
+    bench.add_argument(
+        "--lockstep-agents", type=int, default=100, help="agents trained together"
+    )
+    bench.add_argument(
+        "--threads",
+        nargs="+",
+        type=int,
+        default=[1, 2, 4],
+        help="thread pool sizes to time native evaluation with",
+    )
+    bench.add_argument(
+        "--target-return",
+        type=float,
+        help="also count the training episodes each algorithm needs to reach this",
+    )
+    bench.add_argument("--target-max-episodes", type=int, default=10_000_000)
+    bench.set_defaults(handler=_bench)
+
+    return parser
+
+
+def main(argv=None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.parser = parser
+    args.handler(args)
@@ -0,0 +1,137 @@
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import polars as pl
+
+from blackjack.agent import Agent, TrainingCallback
+
+CURVES_PATH = Path("databases/learning_curves")
+
+# Hive partition value polars reads back as null
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+class LearningCurveWriter(TrainingCallback):
+    """Downsamples training returns into buckets and appends them to Parquet.
+
+    Files are written under root/key=value/... for each partition so curves
+    can be pruned by algorithm, decay factor or experiment when scanned.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        trial: Union[int, str],
+        partitions: dict,
+        bucket_size: int = 10_000,
+        buckets_per_file: int = 100,
+    ) -> None:
+        self.directory = root.joinpath(
+            *(
+                f"{key}={NULL_PARTITION if value is None else value}"
+                for key, value in partitions.items()
+            )
+        )
+        self.trial = str(trial)
+        self.bucket_size = bucket_size
+        self.interval = bucket_size * buckets_per_file
+        self.num_files = 0
+        self._pending = np.zeros(0)  # Returns of the unfinished bucket
+        self._pending_start = 0
+        self._rows = {"episode": [], "count": [], "mean": [], "variance": []}
+
+    def __enter__(self) -> "LearningCurveWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __call__(self, agent: Agent, episode: int, returns: np.ndarray) -> None:
+        if len(self._pending) == 0:
+            self._pending_start = episode - len(returns)
+        buffer = np.concatenate([self._pending, returns])
+        num_full = len(buffer) // self.bucket_size * self.bucket_size
+        buckets = buffer[:num_full].reshape(-1, self.bucket_size)
+
+        self._add_rows(
+            self._pending_start + np.arange(len(buckets)) * self.bucket_size,
+            np.full(len(buckets), self.bucket_size),
+            buckets.mean(axis=1),
+            buckets.var(axis=1),
+        )
+        self._pending = buffer[num_full:]
+        self._pending_start += num_full
+        self.write()
+
+    def close(self) -> None:
+        # Keep the last partial bucket, its count says how many episodes it holds
+        if len(self._pending):
+            self._add_rows(
+                [self._pending_start],
+                [len(self._pending)],
+                [self._pending.mean()],
+                [self._pending.var()],
+            )
+            self._pending = np.zeros(0)
+        self.write()
+
+    def _add_rows(self, episodes, counts, means, variances) -> None:
+        self._rows["episode"].extend(int(episode) for episode in episodes)
+        self._rows["count"].extend(int(count) for count in counts)
+        self._rows["mean"].extend(float(mean) for mean in means)
+        self._rows["variance"].extend(float(variance) for variance in variances)
+
+    def write(self) -> None:
+        if not self._rows["episode"]:
+            return
+        chunk = pl.DataFrame(
+            {"trial": self.trial, **self._rows},
+            schema={
+                "trial": pl.String,
+                "episode": pl.Int64,
+                "count": pl.Int64,
+                "mean": pl.Float64,
+                "variance": pl.Float64,
+            },
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        filename = f"{self.trial}-{self.num_files:05d}.parquet"
+        chunk.write_parquet(self.directory / filename)
+        self.num_files += 1
+        self._rows = {key: [] for key in self._rows}
+
+
+def scan_curves(root: Path = CURVES_PATH) -> pl.LazyFrame:
+    return pl.scan_parquet(root / "**" / "*.parquet", hive_partitioning=True)
+
+
+def aggregate_curves(
+    curves: pl.LazyFrame,
+    by: Sequence[str] = ("algorithm", "decay_factor"),
+    bucket_size: Optional[int] = None,
+) -> pl.LazyFrame:
+    """Pool bucket statistics across trials, optionally into coarser buckets."""
+    episode = pl.col("episode")
+    if bucket_size is not None:
+        episode = (episode // bucket_size) * bucket_size
+
+    # Pooled variance from E[x^2] = variance + mean^2 of every chunk
+    weighted_square = pl.col("count") * (pl.col("variance") + pl.col("mean") ** 2)
+    return (
+        curves.with_columns(episode.alias("episode"))
+        .group_by([*by, "episode"])
+        .agg(
+            pl.col("count").sum(),
+            (pl.col("count") * pl.col("mean")).sum().alias("total"),
+            weighted_square.sum().alias("total_square"),
+        )
+        .with_columns((pl.col("total") / pl.col("count")).alias("mean"))
+        .with_columns(
+            (pl.col("total_square") / pl.col("count") - pl.col("mean") ** 2).alias(
+                "variance"
+            )
+        )
+        .drop("total", "total_square")
+        .sort([*by, "episode"])
+    )
@@ -0,0 +1,132 @@
+import numpy as np
+
+from blackjack.state_space import NUM_STATES, Action
+
+PLANNING_INTERVAL = 100  # Real episodes between planning
+PLANNING_SWEEPS = 20  # Most prioritized sweeps per plan, it stops once converged
+PLANNING_UPDATES = 256  # Pairs backed up per sweep, those with the largest error
+MIN_ERROR = 1e-4  # Bellman errors below this aren't worth a backup
+
+
+class TransitionModel:
+    """Counts of the outcomes seen after each state-action pair.
+
+    An outcome is the (reward, next_state, split_state) of a play_hand result,
+    a pair only ever leads to a few of them so the model stays small. Outcomes
+    are rows of flat arrays that grow as new ones are seen, so a planning sweep
+    backs up every pair at once with a few vectorized operations.
+    """
+
+    def __init__(
+        self, capacity: int = 4096, planning_interval: int = PLANNING_INTERVAL
+    ) -> None:
+        self.planning_interval = planning_interval
+        self.episodes = 0
+        self._rows = {}  # (pair, reward, next_state, split_state) -> row
+        self.size = 0
+        self.pair = np.zeros(capacity, dtype=np.int64)  # state * 4 + action
+        self.reward = np.zeros(capacity, dtype=np.float64)
+        self.next_state = np.zeros(capacity, dtype=np.int64)  # -1 if none
+        self.split_state = np.zeros(capacity, dtype=np.int64)
+        self.count = np.zeros(capacity, dtype=np.float64)
+        # Splits that dealt the same pair again. Their backup includes their own
+        # value, which a few samples can make grow without bound, and the
+        # engine's hand limit that ends the loop isn't part of the state
+        self.loops = np.zeros(NUM_STATES * len(Action), dtype=bool)
+
+    def add(self, state: int, action: int, result) -> None:
+        key = (
+            state * len(Action) + action,
+            result.reward,
+            result.next_state,
+            result.split_state,
+        )
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = self.size
+            if self.size == len(self.count):
+                self._grow()
+            self.pair[row], self.reward[row], self.next_state[row] = key[:3]
+            self.split_state[row] = key[3]
+            self.loops[key[0]] |= state in (result.next_state, result.split_state)
+            self.size += 1
+        self.count[row] += 1
+
+    def end_episode(self, Q: np.ndarray) -> None:
+        self.episodes += 1
+        if self.episodes % self.planning_interval == 0:
+            self.plan(Q)
+
+    def expected_returns(self, Q: np.ndarray):
+        """Seen pairs and their expected return under the model, backing up
+        the greedy value of every state an outcome leads to."""
+        rows = slice(0, self.size)
+        # The value of no state (-1) is the 0 appended at the end
+        V = np.append(Q.max(axis=1), 0.0)
+        targets = self.reward[rows] + V[self.next_state[rows]]
+        targets += V[self.split_state[rows]]
+
+        pair, count = self.pair[rows], self.count[rows]
+        totals = np.bincount(pair, weights=count, minlength=NUM_STATES * len(Action))
+        sums = np.bincount(pair, weights=count * targets, minlength=len(totals))
+        seen = np.flatnonzero(totals)
+        return seen, sums[seen] / totals[seen]
+
+    def plan(
+        self,
+        Q: np.ndarray,
+        num_sweeps: int = PLANNING_SWEEPS,
+        num_updates: int = PLANNING_UPDATES,
+        min_error: float = MIN_ERROR,
+    ) -> int:
+        """Back up the pairs with the largest Bellman error, returns how many
+        updates were made. Errors are recomputed every sweep, so a change
+        reaches the pairs leading to it on the next one. Pairs that can loop
+        back to their own state are left to the real updates."""
+        flat_Q = Q.reshape(-1)
+        updates = 0
+        for _ in range(num_sweeps):
+            seen, expected = self.expected_returns(Q)
+            errors = np.abs(expected - flat_Q[seen])
+            errors[self.loops[seen]] = 0.0
+            if len(errors) > num_updates:
+                top = np.argpartition(errors, -num_updates)[-num_updates:]
+            else:
+                top = np.arange(len(errors))
+            top = top[errors[top] > min_error]
+            if not len(top):
+                break
+            flat_Q[seen[top]] = expected[top]
+            updates += len(top)
+        return updates
+
+    def arrays(self) -> dict:
+        """The outcomes seen so far, for saving."""
+        rows = slice(0, self.size)
+        names = ("pair", "reward", "next_state", "split_state", "count")
+        arrays = {name: getattr(self, name)[rows].copy() for name in names}
+        arrays["episodes"] = np.array(self.episodes)
+        return arrays
+
+    def load_arrays(self, arrays: dict) -> None:
+        """Replace the model with one saved by arrays."""
+        self.__init__(max(len(arrays["count"]), 1), self.planning_interval)
+        for name in ("pair", "reward", "next_state", "split_state", "count"):
+            getattr(self, name)[: len(arrays[name])] = arrays[name]
+        self.size = len(arrays["count"])
+        self.episodes = int(arrays["episodes"])
+        for row in range(self.size):
+            key = (
+                int(self.pair[row]),
+                float(self.reward[row]),
+                int(self.next_state[row]),
+                int(self.split_state[row]),
+            )
+            self._rows[key] = row
+            state = key[0] // len(Action)
+            self.loops[key[0]] |= state in key[2:]
+
+    def _grow(self) -> None:
+        for name in ("pair", "reward", "next_state", "split_state", "count"):
+            table = getattr(self, name)
+            setattr(self, name, np.concatenate([table, np.zeros_like(table)]))
@@ -0,0 +1,294 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from blackjack.agent import Z_95, EvaluationResult, evaluate_policy
+from blackjack.agent_cache import engine_version
+from blackjack.basic_strategy import basic_strategy
+from blackjack.policy import CompiledPolicy, compile_greedy, compile_policy
+from blackjack.results import ResultsStore
+from blackjack.solver import exact_return
+from blackjack_env import BlackjackEnv, Rules
+
+# A compiled policy, a deterministic state -> action callable or a Q table
+PolicyLike = Union[CompiledPolicy, Callable[[int], int], np.ndarray]
+
+
+def as_compiled(policy: PolicyLike, rules: Optional[Rules] = None) -> CompiledPolicy:
+    if isinstance(policy, CompiledPolicy):
+        return policy
+    if isinstance(policy, np.ndarray):
+        return compile_greedy(policy, rules)
+    return compile_policy(policy, rules)
+
+
+def thread_seeds(seed: int, num_threads: int) -> list:
+    # Independent env seeds that fit the engine's int seed
+    seeds = np.random.SeedSequence(seed).generate_state(num_threads) % 2**31
+    return [int(s) for s in seeds]
+
+
+def evaluate_threaded(
+    policy: PolicyLike,
+    num_episodes: int,
+    seed: int,
+    num_threads: Optional[int] = None,
+    rules: Optional[Rules] = None,
+) -> np.ndarray:
+    """Returns of num_episodes games played by a pool of threads.
+
+    Native evaluation releases the GIL, so each thread plays its share on its
+    own env in parallel and they all read the one compiled action table. The
+    returns depend on num_threads, which sets the seeds, but not on how the
+    threads are scheduled.
+    """
+    num_threads = num_threads or os.cpu_count() or 1
+    actions = as_compiled(policy, rules).actions
+    rules = Rules() if rules is None else rules
+    shares = [len(s) for s in np.array_split(np.arange(num_episodes), num_threads)]
+
+    def play(thread_seed: int, share: int) -> np.ndarray:
+        return BlackjackEnv(thread_seed, rules).evaluate(actions, share)
+
+    with ThreadPoolExecutor(num_threads) as pool:
+        returns = pool.map(play, thread_seeds(seed, num_threads), shares)
+        return np.concatenate(list(returns))
+
+
+def evaluate_memoized(
+    policy: PolicyLike,
+    num_episodes: int,
+    seed: int,
+    target_ci: Optional[float] = None,
+    chunk_size: int = 1_000_000,
+    rules: Optional[Rules] = None,
+    store: Optional[ResultsStore] = None,
+) -> EvaluationResult:
+    """Evaluate a deterministic policy, reusing any earlier identical evaluation.
+
+    Results are kept in the store's evaluations table under the digest of the
+    compiled action table. Q tables that only differ away from their greedy
+    actions, as many of a sweep's do, are then played once. The key also holds
+    the rules, budget, seed, target_ci, chunk size and the engine's fingerprint.
+    """
+    compiled = as_compiled(policy, rules)
+    config = {
+        "rules": repr(Rules() if rules is None else rules),
+        "num_episodes": num_episodes,
+        "seed": seed,
+        "target_ci": target_ci,
+        "chunk_size": chunk_size,
+        "engine": engine_version(rules),
+    }
+    if store is not None:
+        cached = store.cached_evaluation(compiled.digest, config)
+        if cached is not None:
+            return EvaluationResult(*cached)
+
+    result = evaluate_policy(compiled, num_episodes, seed, target_ci, chunk_size, rules)
+    if store is not None:
+        store.cache_evaluation(compiled.digest, config, *result)
+    return result
+
+
+class RunningMoments:
+    """Mean vector and co-moment matrix of several return streams, merged per chunk."""
+
+    def __init__(self, num_streams: int) -> None:
+        self.count = 0
+        self.mean = np.zeros(num_streams)
+        self.comoment = np.zeros((num_streams, num_streams))
+
+    def update(self, returns: np.ndarray) -> None:
+        # returns has shape (num_streams, chunk_size), merged as in Chan et al.
+        returns = returns.astype(np.float64)
+        chunk_count = returns.shape[1]
+        chunk_mean = returns.mean(axis=1)
+        centered = returns - chunk_mean[:, None]
+
+        delta = chunk_mean - self.mean
+        total = self.count + chunk_count
+        self.comoment += centered @ centered.T
+        self.comoment += np.outer(delta, delta) * self.count * chunk_count / total
+        self.mean += delta * chunk_count / total
+        self.count = total
+
+    def select(self, streams: np.ndarray) -> "RunningMoments":
+        """Moments of the given streams in that order, a stream can repeat."""
+        selected = RunningMoments(len(streams))
+        selected.count = self.count
+        selected.mean = self.mean[streams]
+        selected.comoment = self.comoment[np.ix_(streams, streams)]
+        return selected
+
+    def covariance(self) -> np.ndarray:
+        if self.count < 2:
+            return np.full_like(self.comoment, np.inf)
+        return self.comoment / (self.count - 1)
+
+    def difference_variance(self) -> np.ndarray:
+        # Var(X_i - X_j) = Var(X_i) + Var(X_j) - 2 Cov(X_i, X_j)
+        covariance = self.covariance()
+        variance = np.diag(covariance)
+        return np.maximum(variance[:, None] + variance[None, :] - 2 * covariance, 0)
+
+
+def _play_common(
+    policies: Sequence[PolicyLike],
+    num_episodes: int,
+    seed: int,
+    half_width: Callable[[RunningMoments], float],
+    target_ci: Optional[float],
+    chunk_size: int,
+    rules: Optional[Rules],
+) -> RunningMoments:
+    # Plays chunks on common cards until the budget is spent or half_width,
+    # the widest 95% CI of interest, reaches target_ci
+    if num_episodes < 1:
+        raise ValueError("Need at least one episode to evaluate")
+    tables = np.stack([as_compiled(policy, rules).actions for policy in policies])
+    # Policies with the same action table get the same returns, so each table
+    # is only played once. Sweeps often end up with many of the same policy
+    tables, streams = np.unique(tables, axis=0, return_inverse=True)
+    streams = streams.reshape(-1)
+    env = BlackjackEnv(seed, Rules() if rules is None else rules)
+    moments = RunningMoments(len(tables))
+
+    next_chunk = min(chunk_size, num_episodes)
+    while moments.count < num_episodes:
+        moments.update(env.evaluate_paired(tables, next_chunk))
+        if target_ci is None:
+            next_chunk = min(chunk_size, num_episodes - moments.count)
+            continue
+
+        widest = half_width(moments.select(streams))
+        if widest <= target_ci:
+            break
+        # Aim the next chunk at the episodes still needed, within the budget
+        needed = chunk_size
+        if np.isfinite(widest):
+            needed = int(np.ceil(moments.count * ((widest / target_ci) ** 2 - 1)))
+        next_chunk = min(max(needed, chunk_size // 10, 1), chunk_size)
+        next_chunk = min(next_chunk, num_episodes - moments.count)
+    return moments.select(streams)
+
+
+class PairedEvaluation(NamedTuple):
+    means: np.ndarray  # Mean return of each policy
+    half_widths: np.ndarray  # 95% CI half width of each mean
+    differences: np.ndarray  # [i, j] is the mean of policy i minus policy j
+    difference_half_widths: np.ndarray
+    num_episodes: int
+
+
+def evaluate_paired(
+    policies: Sequence[PolicyLike],
+    num_episodes: int,
+    seed: int,
+    target_ci: Optional[float] = None,
+    chunk_size: int = 1_000_000,
+    rules: Optional[Rules] = None,
+) -> PairedEvaluation:
+    """Evaluate policies on identical cards (common random numbers).
+
+    Every policy plays the same shoe in each episode, so the noise they share
+    cancels out of their differences. With target_ci play stops once every
+    pairwise difference is known to within target_ci, num_episodes is then
+    the budget.
+    """
+
+    def widest_difference(moments: RunningMoments) -> float:
+        widest = np.sqrt(moments.difference_variance().max())
+        return Z_95 * widest / np.sqrt(moments.count)
+
+    moments = _play_common(
+        policies, num_episodes, seed, widest_difference, target_ci, chunk_size, rules
+    )
+    scale = Z_95 / np.sqrt(moments.count)
+    return PairedEvaluation(
+        means=moments.mean.copy(),
+        half_widths=scale * np.sqrt(np.diag(moments.covariance())),
+        differences=moments.mean[:, None] - moments.mean[None, :],
+        difference_half_widths=scale * np.sqrt(moments.difference_variance()),
+        num_episodes=moments.count,
+    )
+
+
+class ControlVariateEvaluation(NamedTuple):
+    means: np.ndarray  # Corrected mean return of each policy
+    half_widths: np.ndarray  # 95% CI half width of each corrected mean
+    raw_means: np.ndarray  # Plain sample means before the correction
+    raw_half_widths: np.ndarray
+    coefficients: np.ndarray  # c = Cov(X, Y) / Var(Y) for each policy
+    variance_reductions: np.ndarray  # 1 / (1 - rho^2), episodes saved by the control
+    control_sample_mean: float
+    num_episodes: int
+
+
+def _control_variate(moments: RunningMoments, control_mean: float):
+    # The control is the last stream, the others are corrected by it
+    covariance = moments.covariance()
+    control_variance = covariance[-1, -1]
+    variance = np.diag(covariance)[:-1]
+    coefficients = covariance[:-1, -1] / control_variance
+    means = moments.mean[:-1] - coefficients * (moments.mean[-1] - control_mean)
+    # Var(X - cY) at the optimal c is Var(X) (1 - rho^2)
+    rho_squared = covariance[:-1, -1] ** 2 / (variance * control_variance)
+    rho_squared = np.minimum(rho_squared, 1)
+    return means, variance * (1 - rho_squared), coefficients, rho_squared
+
+
+def evaluate_controlled(
+    policies: Sequence[PolicyLike],
+    num_episodes: int,
+    seed: int,
+    control: PolicyLike = basic_strategy,
+    control_mean: Optional[float] = None,
+    target_ci: Optional[float] = None,
+    chunk_size: int = 1_000_000,
+    rules: Optional[Rules] = None,
+) -> ControlVariateEvaluation:
+    """Estimate mean returns using a control policy with a known mean return.
+
+    The control plays the same cards as the policies. Whenever its sample mean
+    is off from control_mean by luck, the policies' means are off in the same
+    direction, so each is corrected by c times that error with c fitted from
+    the returns. The closer a policy plays to the control the more variance
+    this removes. Any error in control_mean carries over scaled by c. By
+    default control_mean is the control's exact return under the rules.
+    """
+    control = as_compiled(control, rules)
+    if control_mean is None:
+        control_mean = exact_return(control.actions, rules)
+
+    def widest_corrected(moments: RunningMoments) -> float:
+        corrected_variance = _control_variate(moments, control_mean)[1]
+        return Z_95 * np.sqrt(corrected_variance.max() / moments.count)
+
+    moments = _play_common(
+        [*policies, control],
+        num_episodes,
+        seed,
+        widest_corrected,
+        target_ci,
+        chunk_size,
+        rules,
+    )
+    means, variance, coefficients, rho_squared = _control_variate(
+        moments, control_mean
+    )
+    scale = Z_95 / np.sqrt(moments.count)
+    with np.errstate(divide="ignore"):
+        variance_reductions = 1 / (1 - rho_squared)
+    return ControlVariateEvaluation(
+        means=means,
+        half_widths=scale * np.sqrt(variance),
+        raw_means=moments.mean[:-1].copy(),
+        raw_half_widths=scale * np.sqrt(np.diag(moments.covariance())[:-1]),
+        coefficients=coefficients,
+        variance_reductions=variance_reductions,
+        control_sample_mean=float(moments.mean[-1]),
+        num_episodes=moments.count,
+    )
@@ -0,0 +1,162 @@
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from blackjack.state_space import flatten_Q, initialize_Q, state_index
+from blackjack_env import BlackjackVecEnv, Rules
+
+Q_LEARNING = 0
+SARSA = 1
+EXPECTED_SARSA = 2
+
+# Algorithms whose updates only need the current step, so they vectorize
+LOCKSTEP_ALGORITHMS = {
+    "Q Learning": Q_LEARNING,
+    "SARSA": SARSA,
+    "Expected SARSA": EXPECTED_SARSA,
+}
+
+
+class MultiAgent:
+    """K agents trained in lockstep, one step of every agent per loop.
+
+    Q and N are stacked into (K, num_states, 4) arrays over the reachable
+    states only (see StateIndex) and each agent plays its own environment of
+    a BlackjackVecEnv, so action selection and updates are a few numpy
+    operations across K instead of K Python episodes. Agents can differ in
+    algorithm and decay factor.
+    """
+
+    def __init__(
+        self,
+        algo_names: Union[str, Sequence[str]],
+        Q_init: float,
+        decay_factors: Sequence[Optional[int]],
+        seed: int = 42,
+        rules: Optional[Rules] = None,
+    ) -> None:
+        num_agents = len(decay_factors)
+        if isinstance(algo_names, str):
+            algo_names = [algo_names] * num_agents
+        if len(algo_names) != num_agents:
+            raise ValueError("Need one algorithm per decay factor")
+
+        for algo_name, decay_factor in zip(algo_names, decay_factors):
+            if algo_name not in LOCKSTEP_ALGORITHMS:
+                raise ValueError(f"{algo_name} can't be trained in lockstep")
+            if algo_name != "Q Learning" and decay_factor is None:
+                raise ValueError(
+                    "Decay factor must be specified when using an epsilon algorithm"
+                )
+
+        self.algorithms = np.array([LOCKSTEP_ALGORITHMS[a] for a in algo_names])
+        # Q learning explores uniformly, an infinite decay factor keeps epsilon at 1
+        self.decay_factors = np.array(
+            [np.inf if d is None else d for d in decay_factors], dtype=np.float64
+        )
+        self.rules = Rules() if rules is None else rules
+        self.index = state_index(rules)
+        # Q of states the engine never deals stays at its initial value
+        self.initial_Q = flatten_Q(initialize_Q(Q_init))
+        self.Q = np.stack([self.index.compact(self.initial_Q)] * num_agents)
+        self.N = np.zeros(self.Q.shape, dtype=np.uint64)
+        self.legal = self.index.legal
+
+        self.seed = seed
+        self.env = BlackjackVecEnv(num_agents, seed, self.rules)
+        self.rng = np.random.default_rng(seed)
+        self.episodes_trained = 0
+        self.train_returns = None
+
+    def __len__(self) -> int:
+        return len(self.decay_factors)
+
+    def agent_Q(self, agent: int) -> np.ndarray:
+        """One agent's Q table, shaped like Agent.Q."""
+        Q = self.index.expand(self.Q[agent], self.initial_Q)
+        return Q.reshape(initialize_Q(0).shape)
+
+    def _dense(self, states: np.ndarray) -> np.ndarray:
+        # Engine states to rows of Q and N, keeping -1 for no state
+        return np.where(states == -1, -1, self.index.dense[states])
+
+    def _epsilon(self, agents: np.ndarray, num_visits: np.ndarray) -> np.ndarray:
+        decay_factors = self.decay_factors[agents]
+        with np.errstate(invalid="ignore"):
+            epsilon = decay_factors / (decay_factors + num_visits)
+        return np.where(np.isinf(decay_factors), 1.0, epsilon)
+
+    def _epsilon_greedy(
+        self, agents: np.ndarray, states: np.ndarray, num_visits: np.ndarray
+    ) -> np.ndarray:
+        q = self.Q[agents, states]
+        # Random keys on the legal actions pick one of them uniformly
+        random_actions = np.argmax(
+            self.rng.random(q.shape) * self.legal[states], axis=1
+        )
+        explore = self.rng.random(len(agents)) < self._epsilon(agents, num_visits)
+        return np.where(explore, random_actions, np.argmax(q, axis=1))
+
+    def _state_value(self, agents: np.ndarray, states: np.ndarray) -> np.ndarray:
+        # Value each algorithm bootstraps from, 0 where there is no state
+        has_state = states != -1
+        states = np.where(has_state, states, 0)
+        q = self.Q[agents, states]
+        best = q.max(axis=1)
+        num_visits = self.N[agents, states].sum(axis=1)
+        epsilon = self._epsilon(agents, num_visits)
+
+        algorithms = self.algorithms[agents]
+        value = best
+        if (algorithms == SARSA).any():
+            actions = self._epsilon_greedy(agents, states, num_visits)
+            value = np.where(algorithms == SARSA, q[np.arange(len(q)), actions], value)
+        if (algorithms == EXPECTED_SARSA).any():
+            legal = self.legal[states]
+            mean = np.where(legal, q, 0).sum(axis=1) / legal.sum(axis=1)
+            expected = (1 - epsilon) * best + epsilon * mean
+            value = np.where(algorithms == EXPECTED_SARSA, expected, value)
+        return np.where(has_state, value, 0)
+
+    def train(self, num_episodes: int) -> np.ndarray:
+        """Train every agent for num_episodes, returns their (K, episodes) returns."""
+        num_agents = len(self)
+        # Returns are small multiples of 0.5 so float32 holds them exactly
+        self.train_returns = np.zeros((num_agents, num_episodes), dtype=np.float32)
+        episode_returns = np.zeros(num_agents, dtype=np.float32)
+        episodes_done = np.zeros(num_agents, dtype=np.int64)
+        all_agents = np.arange(num_agents)
+
+        agents = all_agents
+        states = self._dense(self.env.get_states())
+        while len(agents):
+            s = states[agents]
+            num_visits = self.N[agents, s].sum(axis=1) + 1
+            a = self._epsilon_greedy(agents, s, num_visits)
+            # Agents that finished sit at the start of their next game
+            actions = np.full(num_agents, -1)
+            actions[agents] = a
+            rewards, next_states, split_states, terminated = self.env.step(actions)
+
+            self.N[agents, s, a] += 1
+            target = (
+                rewards[agents]
+                + self._state_value(agents, self._dense(next_states[agents]))
+                + self._state_value(agents, self._dense(split_states[agents]))
+            )
+            self.Q[agents, s, a] += (target - self.Q[agents, s, a]) / self.N[
+                agents, s, a
+            ]
+
+            episode_returns[agents] += rewards[agents]
+            finished = agents[terminated[agents]]
+            self.train_returns[finished, episodes_done[finished]] = episode_returns[
+                finished
+            ]
+            episode_returns[finished] = 0
+            episodes_done[finished] += 1
+            agents = np.flatnonzero(episodes_done < num_episodes)
+            states = self._dense(self.env.get_states())
+
+        self.episodes_trained += num_episodes
+        return self.train_returns
@@ -1,8 +1,19 @@
-from typing import Callable
+import hashlib
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
 
 import numpy as np
 
-from blackjack.state_space import Action
+from blackjack.state_space import (
+    NUM_STATES,
+    VALID_STATES,
+    Action,
+    fill_legal_actions,
+    flatten_Q,
+    initialize_Q,
+    valid_states,
+)
+from blackjack_env import Rules
 
 Policy = Callable[[int, np.ndarray], Action]
 
@@ -25,7 +36,7 @@ def epsilon_func(num_visits: int, decay_factor: int):
 def epsilon_greedy(
     state: int, Q: np.ndarray, num_visits: int, decay_factor: int
 ) -> Action:
-    epsilon = epsilon_func(decay_factor, num_visits)
+    epsilon = epsilon_func(num_visits, decay_factor)
 
     if np.random.rand() < epsilon:
         return random(state, Q)
@@ -39,3 +50,63 @@ def expected_epsilon_greedy_return(
     epsilon = epsilon_func(num_visits, decay_factor)
     legal = Q[state] != -np.inf
     return (1 - epsilon) * np.max(Q[state]) + epsilon * np.mean(Q[state][legal])
+
+
+class CompiledPolicy(NamedTuple):
+    actions: np.ndarray  # int8 action per flat state, -1 where unreachable
+    digest: str  # Stable hash of the action table
+
+
+def _legal_actions() -> np.ndarray:
+    legal = np.zeros(initialize_Q(0).shape, dtype=bool)
+    fill_legal_actions(legal)
+    return flatten_Q(legal)
+
+
+def _compiled(actions: np.ndarray) -> CompiledPolicy:
+    actions = np.ascontiguousarray(actions, dtype=np.int8)
+    actions.flags.writeable = False
+    return CompiledPolicy(actions, hashlib.sha256(actions.tobytes()).hexdigest())
+
+
+def _valid_states(rules: Optional[Rules]) -> np.ndarray:
+    return VALID_STATES if rules is None else valid_states(rules)
+
+
+def compile_policy(
+    policy: Callable[[int], int], rules: Optional[Rules] = None
+) -> CompiledPolicy:
+    """Evaluate a deterministic policy once per valid state into an action table.
+
+    Other table rules make other states reachable, pass the rules the table
+    will be played under.
+    """
+    legal = _legal_actions()
+    actions = np.full(NUM_STATES, -1, dtype=np.int8)
+    for state in np.flatnonzero(_valid_states(rules)):
+        action = int(policy(int(state)))
+        if not 0 <= action < len(Action) or not legal[state, action]:
+            raise ValueError(f"Policy chose illegal action {action} in state {state}")
+        actions[state] = action
+    return _compiled(actions)
+
+
+def compile_greedy(Q: np.ndarray, rules: Optional[Rules] = None) -> CompiledPolicy:
+    # Same as compile_policy(partial(greedy, Q=Q)) without the per-state calls
+    actions = np.argmax(flatten_Q(Q), axis=-1).astype(np.int8)
+    return _compiled(np.where(_valid_states(rules), actions, -1))
+
+
+def save_compiled_policy(policy: CompiledPolicy, directory: Path) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{policy.digest}.npy"
+    if not path.exists():
+        np.save(path, policy.actions)
+    return path
+
+
+def load_compiled_policy(digest: str, directory: Path) -> CompiledPolicy:
+    policy = _compiled(np.load(directory / f"{digest}.npy"))
+    if policy.digest != digest:
+        raise ValueError(f"Cached policy {digest} is corrupted")
+    return policy
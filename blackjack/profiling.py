@@ -0,0 +1,78 @@
+import cProfile
+import pstats
+from pathlib import Path
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+PROFILE_EPISODES = 100_000  # Episodes a profiled run is cut down to
+ENGINE = "engine (C++)"
+OTHER = "other"
+# Modules of the hot path, everything else in the package is grouped on its own
+COMPONENTS = ("algorithms.py", "dyna.py", "policy.py", "agent.py", "multi_agent.py")
+
+
+def run_profiled(func: Callable[..., T], *args, **kwargs) -> tuple[T, pstats.Stats]:
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    return result, pstats.Stats(profiler)
+
+
+def component_times(stats: pstats.Stats) -> dict[str, float]:
+    """Seconds spent in each component, summing to the profiled total.
+
+    Every function's own time goes to its component: calls into blackjack_env
+    are the engine, package files are named after their module. Time in numpy
+    and builtins is handed back to the callers that made the calls, in
+    proportion to the time each caller's calls took, so np.argmax in greedy
+    counts as policy.py.
+    """
+    shares = {}
+
+    def owner(func: tuple, visiting: frozenset) -> dict[str, float]:
+        if func in shares:
+            return shares[func]
+        component = _component(func)
+        if component is not None:
+            return {component: 1.0}
+        callers = stats.stats[func][4]
+        total = sum(edge[2] for caller, edge in callers.items() if caller not in visiting)
+        if not total:
+            return {OTHER: 1.0}
+        result = {}
+        for caller, edge in callers.items():
+            if caller in visiting:
+                continue  # Recursion, the rest of the cycle is counted elsewhere
+            for name, share in owner(caller, visiting | {func}).items():
+                result[name] = result.get(name, 0.0) + share * edge[2] / total
+        shares[func] = result
+        return result
+
+    times = {}
+    for func, (_, _, own_time, _, _) in stats.stats.items():
+        for name, share in owner(func, frozenset()).items():
+            times[name] = times.get(name, 0.0) + own_time * share
+    return times
+
+
+def _component(func: tuple) -> Optional[str]:
+    filename, _, name = func
+    if "blackjack_env." in name:
+        return ENGINE
+    path = Path(filename)
+    if path.parent.name == "blackjack":
+        return path.name if path.name in COMPONENTS else "blackjack (other)"
+    return None
+
+
+def report(stats: pstats.Stats, path: Path, label: str) -> str:
+    """Dump the stats to path and describe where the time went."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stats.dump_stats(path)
+    times = component_times(stats)
+    total = sum(times.values())
+    lines = [f"profiled {label} in {total:.2f} s, saved {path} (open with snakeviz)"]
+    for name, seconds in sorted(times.items(), key=lambda item: -item[1]):
+        share = seconds / total if total else 0.0
+        lines.append(f"  {name:<18} {seconds:>8.3f} s {share:>7.1%}")
+    return "\n".join(lines)
@@ -0,0 +1,234 @@
+import datetime
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+DATABASE_PATH = Path("databases/results.sqlite3")
+
+SCHEMA = """--sql
+CREATE TABLE IF NOT EXISTS experiments (
+    experiment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    config TEXT,
+    created DATETIME
+);
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    experiment_id INTEGER NOT NULL REFERENCES experiments(experiment_id),
+    algorithm TEXT NOT NULL,
+    decay_factor INTEGER,
+    seed INTEGER,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    trial_id INTEGER NOT NULL REFERENCES trials(trial_id),
+    name TEXT NOT NULL,
+    step INTEGER NOT NULL DEFAULT 0,
+    value REAL,
+    PRIMARY KEY (trial_id, name, step)
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    policy TEXT NOT NULL,
+    config TEXT NOT NULL,
+    mean REAL,
+    half_width REAL,
+    num_episodes INTEGER,
+    created DATETIME,
+    PRIMARY KEY (policy, config)
+);
+CREATE INDEX IF NOT EXISTS experiments_by_name ON experiments(name);
+CREATE INDEX IF NOT EXISTS trials_by_config
+    ON trials(experiment_id, algorithm, decay_factor);
+"""
+
+# Column order of the rows returned by ResultsStore.fetch_metrics
+METRIC_COLUMNS = (
+    "experiment_id",
+    "trial_id",
+    "algorithm",
+    "decay_factor",
+    "name",
+    "step",
+    "value",
+)
+
+
+class ResultsStore:
+    """Experiments, their trials and each trial's metrics in one SQLite database.
+
+    Writes are grouped into transactions of batch_size rows, call flush() or
+    close the store to commit the rest.
+    """
+
+    def __init__(self, path: Union[str, Path] = DATABASE_PATH, batch_size: int = 500):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL only needs a sync at checkpoints to stay consistent
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self._pending = 0
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def flush(self) -> None:
+        self.conn.commit()
+        self._pending = 0
+
+    def _written(self, num_rows: int = 1) -> None:
+        self._pending += num_rows
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def create_experiment(self, name: str, config: Optional[dict] = None) -> int:
+        cursor = self.conn.execute(
+            """--sql
+            INSERT INTO experiments(name, config, created) VALUES (?, ?, ?)""",
+            (name, json.dumps(config or {}), datetime.datetime.now().isoformat()),
+        )
+        # Experiments are rare and later rows reference them, commit straight away
+        self.flush()
+        return cursor.lastrowid
+
+    def add_trial(
+        self,
+        experiment_id: int,
+        algorithm: str,
+        decay_factor: Optional[int] = None,
+        seed: Optional[int] = None,
+        params: Optional[dict] = None,
+    ) -> int:
+        cursor = self.conn.execute(
+            """--sql
+            INSERT INTO trials(experiment_id, algorithm, decay_factor, seed, params)
+            VALUES (?, ?, ?, ?, ?)""",
+            (
+                experiment_id,
+                algorithm,
+                decay_factor,
+                seed,
+                json.dumps(params) if params else None,
+            ),
+        )
+        self._written()
+        return cursor.lastrowid
+
+    def add_metrics(self, trial_id: int, metrics: dict, step: int = 0) -> None:
+        self.conn.executemany(
+            """--sql
+            INSERT OR REPLACE INTO metrics(trial_id, name, step, value)
+            VALUES (?, ?, ?, ?)""",
+            [(trial_id, name, step, value) for name, value in metrics.items()],
+        )
+        self._written(len(metrics))
+
+    def record_trial(
+        self,
+        experiment_id: int,
+        algorithm: str,
+        metrics: dict,
+        decay_factor: Optional[int] = None,
+        seed: Optional[int] = None,
+        params: Optional[dict] = None,
+        step: int = 0,
+    ) -> int:
+        trial_id = self.add_trial(experiment_id, algorithm, decay_factor, seed, params)
+        self.add_metrics(trial_id, metrics, step)
+        return trial_id
+
+    def cached_evaluation(self, policy: str, config: dict) -> Optional[tuple]:
+        """(mean, half_width, num_episodes) of an earlier evaluation of the
+        policy digest under config, or None."""
+        return self.conn.execute(
+            """--sql
+            SELECT mean, half_width, num_episodes FROM evaluations
+            WHERE policy = ? AND config = ?""",
+            (policy, json.dumps(config, sort_keys=True)),
+        ).fetchone()
+
+    def cache_evaluation(
+        self,
+        policy: str,
+        config: dict,
+        mean: float,
+        half_width: float,
+        num_episodes: int,
+    ) -> None:
+        self.conn.execute(
+            """--sql
+            INSERT OR REPLACE INTO evaluations(
+                policy, config, mean, half_width, num_episodes, created
+            )
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            (
+                policy,
+                json.dumps(config, sort_keys=True),
+                mean,
+                half_width,
+                num_episodes,
+                datetime.datetime.now().isoformat(),
+            ),
+        )
+        self._written()
+
+    def experiments(self, name: Optional[str] = None) -> list[tuple]:
+        """(experiment_id, name, config, created) rows, oldest first."""
+        query = "SELECT experiment_id, name, config, created FROM experiments"
+        if name is None:
+            return self.conn.execute(query + " ORDER BY experiment_id").fetchall()
+        return self.conn.execute(
+            query + " WHERE name = ? ORDER BY experiment_id", (name,)
+        ).fetchall()
+
+    def latest_experiment(self, name: str) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT MAX(experiment_id) FROM experiments WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0]
+
+    def fetch_metrics(
+        self,
+        experiment_ids: Union[int, Iterable[int], None] = None,
+        name: Optional[str] = "mean_return",
+        algorithm: Optional[str] = None,
+    ) -> list[tuple]:
+        """Metric rows joined with their trials, columns as in METRIC_COLUMNS."""
+        conditions = []
+        args = []
+        if experiment_ids is not None:
+            if isinstance(experiment_ids, int):
+                experiment_ids = [experiment_ids]
+            experiment_ids = list(experiment_ids)
+            conditions.append(
+                f"t.experiment_id IN ({', '.join('?' * len(experiment_ids))})"
+            )
+            args.extend(experiment_ids)
+        if name is not None:
+            conditions.append("m.name = ?")
+            args.append(name)
+        if algorithm is not None:
+            conditions.append("t.algorithm = ?")
+            args.append(algorithm)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.conn.execute(
+            f"""--sql
+            SELECT t.experiment_id, t.trial_id, t.algorithm, t.decay_factor,
+                   m.name, m.step, m.value
+            FROM trials t JOIN metrics m ON m.trial_id = t.trial_id
+            {where}
+            ORDER BY t.experiment_id, t.algorithm, t.decay_factor, m.step""",
+            args,
+        ).fetchall()
@@ -0,0 +1,218 @@
+import bisect
+import os
+import queue
+import sys
+import threading
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from blackjack.agent import Agent, TrainingCallback, evaluate_policy
+from blackjack.evaluation import evaluate_memoized
+from blackjack.policy import CompiledPolicy, compile_greedy
+from blackjack.results import ResultsStore
+from blackjack_env import Rules
+
+_STOP = None  # Queued once per worker when no more snapshots will come
+
+
+class SnapshotEvaluator(TrainingCallback):
+    """Evaluates greedy snapshots of an agent on worker threads while it trains.
+
+    Every interval episodes the greedy policy is compiled, which copies it, and
+    put on a queue of at most max_pending snapshots. Native evaluation releases
+    the GIL, so the workers play them on other cores while training carries on,
+    and training only waits when the queue is full. Each result is stored as
+    mean_return, ci_half_width and num_episodes metrics of the trial with the
+    episodes trained as the step. Rows are written from the training thread,
+    SQLite connections can't be shared between threads.
+
+    Every snapshot is played on the same cards, so the curve's steps come from
+    the policy changing rather than from the deal.
+    """
+
+    def __init__(
+        self,
+        store: ResultsStore,
+        trial_id: int,
+        interval: int = 1_000_000,
+        num_episodes: int = 1_000_000,
+        seed: int = 42,
+        target_ci: Optional[float] = None,
+        num_workers: Optional[int] = None,
+        max_pending: int = 4,
+        rules: Optional[Rules] = None,
+    ) -> None:
+        self.store = store
+        self.trial_id = trial_id
+        self.interval = interval
+        self.num_episodes = num_episodes
+        self.seed = seed
+        self.target_ci = target_ci
+        self.rules = rules
+        # Leave a core for training
+        num_workers = num_workers or max((os.cpu_count() or 1) - 1, 1)
+
+        self._snapshots = queue.Queue(max_pending)
+        self._results = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "SnapshotEvaluator":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __call__(self, agent: Agent, episode: int, returns: np.ndarray) -> None:
+        self._snapshots.put((episode, compile_greedy(agent.Q, self.rules)))
+        self._write_results()
+
+    def close(self) -> None:
+        """Wait for the queued snapshots and write their results."""
+        if not self._workers:
+            return
+        for _ in self._workers:
+            self._snapshots.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        self._write_results()
+
+    def _work(self) -> None:
+        while (snapshot := self._snapshots.get()) is not _STOP:
+            episode, policy = snapshot
+            try:
+                self._results.put((episode, self._evaluate(policy)))
+            except Exception as error:
+                # Raised on the training thread, which can stop training
+                self._results.put((episode, error))
+
+    def _evaluate(self, policy: CompiledPolicy) -> dict:
+        result = evaluate_policy(
+            policy, self.num_episodes, self.seed, self.target_ci, rules=self.rules
+        )
+        return {
+            "mean_return": result.mean,
+            "ci_half_width": result.half_width,
+            "num_episodes": result.num_episodes,
+        }
+
+    def _write_results(self) -> None:
+        while True:
+            try:
+                episode, metrics = self._results.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(metrics, Exception):
+                raise metrics
+            self.store.add_metrics(self.trial_id, metrics, step=episode)
+
+
+class MilestoneSnapshots(TrainingCallback):
+    """Saves Q and N when training reaches each milestone episode count.
+
+    One run to the last milestone replaces a training job per budget. Each
+    milestone is directory/<episodes>.npz holding only the entries of Q and N
+    that changed since the previous one, with their new values, so the
+    tables are rebuilt exactly by load_milestone. States that stopped being
+    visited don't take any space in later snapshots. The first snapshot
+    holds every entry.
+
+    With evaluate_episodes the greedy policy is also evaluated at each
+    milestone. The result is saved in the snapshot and, given a store and
+    trial_id, as metrics of the trial with the episodes as the step.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        milestones: Sequence[int],
+        evaluate_episodes: Optional[int] = None,
+        seed: int = 42,
+        store: Optional[ResultsStore] = None,
+        trial_id: Optional[int] = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.milestones = sorted(set(milestones))
+        self.evaluate_episodes = evaluate_episodes
+        self.seed = seed
+        self.store = store
+        self.trial_id = trial_id
+        self.saved = []
+        self._previous = None  # (episodes, Q, N) of the last snapshot
+
+    def next_stop(self, episode: int) -> int:
+        i = bisect.bisect_right(self.milestones, episode)
+        return self.milestones[i] if i < len(self.milestones) else sys.maxsize
+
+    def __call__(self, agent: Agent, episode: int, returns: np.ndarray) -> None:
+        # Also called when training ends, which needn't be a milestone
+        if episode not in self.milestones:
+            return
+        Q, N = agent.Q.reshape(-1), agent.N.reshape(-1)
+        if self._previous is None:
+            previous = -1  # Nothing to build on, every entry is saved
+            Q_index, N_index = np.arange(len(Q)), np.arange(len(N))
+        else:
+            previous, last_Q, last_N = self._previous
+            Q_index = np.flatnonzero(Q != last_Q)
+            N_index = np.flatnonzero(N != last_N)
+
+        arrays = {
+            "previous": np.array(previous),
+            "Q_shape": np.array(agent.Q.shape),
+            "Q_index": Q_index,
+            "Q": Q[Q_index],
+            "N_shape": np.array(agent.N.shape),
+            "N_index": N_index,
+            "N": N[N_index],
+        }
+        if self.evaluate_episodes is not None:
+            result = evaluate_memoized(
+                agent.Q,
+                self.evaluate_episodes,
+                self.seed,
+                rules=agent.rules,
+                store=self.store,
+            )
+            arrays["mean_return"] = np.array(result.mean)
+            arrays["ci_half_width"] = np.array(result.half_width)
+            if self.store is not None and self.trial_id is not None:
+                metrics = {
+                    "mean_return": result.mean,
+                    "ci_half_width": result.half_width,
+                    "num_episodes": result.num_episodes,
+                }
+                self.store.add_metrics(self.trial_id, metrics, step=episode)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{episode}.npz"
+        np.savez_compressed(path, **arrays)
+        self.saved.append(path)
+        self._previous = (episode, Q.copy(), N.copy())
+
+
+def load_milestone(directory: Path, episodes: int) -> tuple[np.ndarray, np.ndarray]:
+    """Q and N of the snapshot taken after episodes, rebuilt from the first one."""
+    chain = []
+    while True:
+        with np.load(Path(directory) / f"{episodes}.npz") as snapshot:
+            chain.append(dict(snapshot))
+        episodes = int(chain[-1]["previous"])
+        if episodes < 0:
+            break
+
+    Q = N = None
+    for snapshot in reversed(chain):
+        if Q is None:
+            Q = np.empty(snapshot["Q_shape"], dtype=snapshot["Q"].dtype)
+            N = np.empty(snapshot["N_shape"], dtype=snapshot["N"].dtype)
+        Q.reshape(-1)[snapshot["Q_index"]] = snapshot["Q"]
+        N.reshape(-1)[snapshot["N_index"]] = snapshot["N"]
+    return Q, N
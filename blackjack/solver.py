@@ -0,0 +1,478 @@
+import itertools
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from blackjack.agent_cache import AgentCache, code_version, engine_version
+from blackjack.basic_strategy import D, H, P, S, basic_strategy
+from blackjack.policy import compile_greedy, compile_policy
+from blackjack.state_space import MAX_VALUE, Action, flatten_Q, initialize_Q
+from blackjack_env import DoubleRule, Rules, encode_state
+
+STRATEGY_CACHE_PATH = Path("strategy_cache")
+
+# Infinite deck, every rank is equally likely and 10, J, Q and K are worth 10
+RANKS = range(1, 14)
+RANK_PROBABILITY = 1 / 13
+# Columns of the dealer's final hand distribution
+DEALER_TOTALS = range(17, MAX_VALUE + 1)
+NATURAL = len(DEALER_TOTALS)
+BUST = NATURAL + 1
+
+
+class Solution(NamedTuple):
+    Q: np.ndarray  # Exact expected return of every legal action, 0 if unreachable
+    actions: np.ndarray  # Greedy action table of Q, -1 where unreachable
+    expected_return: float  # Of playing actions
+    chart_return: float  # Of playing strategy_chart(actions)
+    optimal_return: float  # With every hand's composition and split depth known
+
+
+class Chart(NamedTuple):
+    # Same layout as STRATEGY_HARD, STRATEGY_SOFT and STRATEGY_PAIR
+    hard: dict
+    soft: dict
+    pair: dict
+
+
+def _card_value(rank: int) -> int:
+    # Aces count 1 here, hands track whether they have one to count as 11
+    return min(rank, 10)
+
+
+def _hand_value(hard: int, ace: bool) -> tuple[int, bool]:
+    if ace and hard + 10 <= MAX_VALUE:
+        return hard + 10, True
+    return hard, False
+
+
+@lru_cache(maxsize=None)
+def dealer_outcomes(upcard: int, hit_soft_17: bool) -> np.ndarray:
+    """Probabilities of the dealer finishing on 17 to 21, a natural or bust,
+    given the upcard's value (2 to 11)."""
+
+    @lru_cache(maxsize=None)
+    def play(hard: int, ace: bool, num_cards: int) -> tuple:
+        value, soft = _hand_value(hard, ace)
+        outcome = np.zeros(BUST + 1)
+        if value > MAX_VALUE:
+            outcome[BUST] = 1.0
+        elif value == MAX_VALUE and num_cards == 2:
+            outcome[NATURAL] = 1.0
+        elif value < 17 or (hit_soft_17 and soft and value == 17):
+            for rank in RANKS:
+                drawn = play(hard + _card_value(rank), ace or rank == 1, num_cards + 1)
+                outcome += RANK_PROBABILITY * np.array(drawn)
+        else:
+            outcome[value - DEALER_TOTALS.start] = 1.0
+        return tuple(outcome)
+
+    ace = upcard == 11
+    return np.array(play(1 if ace else upcard, ace, 1))
+
+
+class _Hand(NamedTuple):
+    hard: int  # Total with aces as 1
+    ace: bool
+    two_cards: bool
+    pair: int  # Rank of both cards, 0 if they differ
+    split: bool
+    split_aces: bool  # A split ace waiting to be split again
+    depth: int  # Hands on the engine's stack, 0 for the hands past two cards
+
+
+class _Round:
+    """Exact expected returns of the player's hands against one upcard.
+
+    Hands are walked the way the engine plays them: a split plays the new
+    hand one deeper on the stack first, and split aces stand on one card
+    unless they draw an ace they may split again. Without an action table
+    every hand plays its best action, with one the hand's state decides.
+    """
+
+    def __init__(
+        self, rules: Rules, upcard: int, actions: Optional[np.ndarray] = None
+    ) -> None:
+        self.rules = rules
+        self.upcard = upcard
+        self.actions = actions
+        self.options = {}  # _Hand -> {action: expected return}
+        self._returns = {}
+
+        outcomes = dealer_outcomes(upcard, rules.hit_soft_17)
+        # A dealer natural is a 21 to every hand but the player's natural
+        finals = outcomes[:NATURAL].copy()
+        finals[-1] += outcomes[NATURAL]
+        below = np.concatenate([[0.0], np.cumsum(finals)[:-1]])
+        above = finals.sum() - below - finals
+        self.stand_returns = np.full(MAX_VALUE + 1, -finals.sum() + outcomes[BUST])
+        for value in DEALER_TOTALS:
+            index = value - DEALER_TOTALS.start
+            self.stand_returns[value] = outcomes[BUST] + below[index] - above[index]
+        self.natural_return = rules.blackjack_payout * (1.0 - outcomes[NATURAL])
+
+    def play(self) -> float:
+        # The player's two cards, the dealer's upcard is already known
+        total = 0.0
+        for first, second in itertools.product(RANKS, RANKS):
+            hand = _Hand(
+                _card_value(first) + _card_value(second),
+                1 in (first, second),
+                True,
+                first if first == second else 0,
+                False,
+                False,
+                1,
+            )
+            total += RANK_PROBABILITY**2 * self.hand_return(hand)
+        return total
+
+    def hand_return(self, hand: _Hand) -> float:
+        if hand not in self._returns:
+            self._evaluate(hand)
+        return self._returns[hand]
+
+    def _evaluate(self, hand: _Hand) -> None:
+        value, _ = _hand_value(hand.hard, hand.ace)
+        natural = hand.two_cards and not hand.split and value == MAX_VALUE
+        stand = self.natural_return if natural else self.stand_returns[value]
+        options = {Action.STAND: stand}
+        if hand.split_aces:
+            options[Action.HIT] = stand
+        else:
+            options[Action.HIT] = self._draw(hand, 1.0)
+        if self.can_double(hand):
+            options[Action.DOUBLE] = self._draw(hand, 2.0)
+
+        action = -1 if self.actions is None else int(self.actions[self.state(hand)])
+        if hand.split_aces and action >= 0 and action != Action.SPLIT:
+            action = Action.STAND  # The engine keeps the ace's one card
+        can_split = self.can_split(hand)
+        if action >= 0 and action not in options and not (
+            action == Action.SPLIT and can_split
+        ):
+            raise ValueError(
+                f"Action table has illegal action {action} for state {self.state(hand)}"
+            )
+
+        best = max(options.values()) if action < 0 else options.get(action)
+        if can_split:
+            # Once the new hand is played this one is back at the same depth,
+            # so it can deal itself again. Splitting is worth split plus loop
+            # times its own return, and splitting every time solves to resplit
+            split, loop = self._split(hand)
+            resplit = split / (1.0 - loop)
+            if action < 0:
+                best = max(best, resplit)
+            elif action == Action.SPLIT:
+                best = resplit
+            options[Action.SPLIT] = split + loop * best
+        self.options[hand] = options
+        self._returns[hand] = best
+
+    def state(self, hand: _Hand) -> int:
+        value, soft = _hand_value(hand.hard, hand.ace)
+        return int(
+            encode_state(
+                value, self.upcard, soft, self.can_double(hand), self.can_split(hand)
+            )
+        )
+
+    def can_double(self, hand: _Hand) -> bool:
+        if not hand.two_cards or hand.split_aces:
+            return False
+        if hand.split and not self.rules.double_after_split:
+            return False
+        value, soft = _hand_value(hand.hard, hand.ace)
+        if self.rules.double_on == DoubleRule.NINE_TO_ELEVEN:
+            return not soft and 9 <= value <= 11
+        if self.rules.double_on == DoubleRule.TEN_OR_ELEVEN:
+            return not soft and 10 <= value <= 11
+        return True
+
+    def can_split(self, hand: _Hand) -> bool:
+        return bool(hand.pair) and hand.depth < self.rules.max_hands
+
+    def _draw(self, hand: _Hand, bet: float) -> float:
+        # Hit and play on, or double and stand on whatever comes
+        total = 0.0
+        for rank in RANKS:
+            hard, ace = hand.hard + _card_value(rank), hand.ace or rank == 1
+            value, _ = _hand_value(hard, ace)
+            if value > MAX_VALUE:
+                total -= bet
+            elif bet > 1.0:
+                total += bet * self.stand_returns[value]
+            else:
+                total += self.hand_return(_Hand(hard, ace, False, 0, False, False, 0))
+        return RANK_PROBABILITY * total
+
+    def _split(self, hand: _Hand) -> tuple[float, float]:
+        """Return of splitting the hand, apart from the times it deals the
+        same hand again, and the expected number of those times."""
+        returns = [0.0, 0.0]
+
+        def play(split_hand: _Hand, probability: float) -> None:
+            if split_hand == hand:
+                returns[1] += probability
+            else:
+                returns[0] += probability * self.hand_return(split_hand)
+
+        depth = hand.depth
+        if hand.pair == 1:
+            returns[0] += self._split_aces(depth, play)
+            return tuple(returns)
+
+        for rank in RANKS:
+            pair = hand.pair if rank == hand.pair else 0
+            hard = _card_value(hand.pair) + _card_value(rank)
+            # The new hand is one deeper on the stack and plays first
+            for hand_depth in (depth + 1, depth):
+                split_hand = _Hand(hard, rank == 1, True, pair, True, False, hand_depth)
+                play(split_hand, RANK_PROBABILITY)
+        return tuple(returns)
+
+    def _split_aces(self, depth: int, play) -> float:
+        # Plays the hands that wait and returns what the others win
+        def stand(rank: int) -> float:
+            value, _ = _hand_value(1 + _card_value(rank), True)
+            return self.stand_returns[value]
+
+        def wait(depth: int) -> _Hand:
+            return _Hand(2, True, True, 1, True, True, depth)
+
+        # Each ace draws one card, another ace waits to be split again if the
+        # rules allow it and there's room for both hands it would make
+        waits = self.rules.resplit_aces and depth + 1 < self.rules.max_hands
+        probability = RANK_PROBABILITY**2
+        settled = 0.0
+        for upper, lower in itertools.product(RANKS, RANKS):
+            upper_waits = waits and upper == 1
+            lower_waits = waits and lower == 1
+            if upper_waits and lower_waits:
+                play(wait(depth + 1), probability)
+                play(wait(depth), probability)
+            elif upper_waits or lower_waits:
+                # The one waiting hand is left in the lower hand's place
+                play(wait(depth), probability)
+                settled += stand(lower if upper_waits else upper)
+            else:
+                settled += stand(upper) + stand(lower)
+        return probability * settled
+
+
+def _upcard_probability(upcard: int) -> float:
+    return RANK_PROBABILITY * (4 if upcard == 10 else 1)
+
+
+def exact_return(actions: np.ndarray, rules: Optional[Rules] = None) -> float:
+    """Expected return per episode of an action table, with no sampling error.
+
+    States without an action are played optimally. Tables only leave out
+    states too rare to matter, like 2,2 split all the way to the hand limit.
+    """
+    rules = Rules() if rules is None else rules
+    return float(
+        sum(
+            _upcard_probability(upcard) * _Round(rules, upcard, actions).play()
+            for upcard in range(2, 12)
+        )
+    )
+
+
+def _solve(rules: Rules) -> Solution:
+    Q = initialize_Q(0.0)
+    flat_Q = flatten_Q(Q)
+    optimal_return = 0.0
+    for upcard in range(2, 12):
+        game = _Round(rules, upcard)
+        optimal_return += _upcard_probability(upcard) * game.play()
+        # A state shared by several hands takes its values from an unsplit
+        # one if there is one, otherwise the split hand least deep on the stack
+        canonical = {}
+        for hand, options in game.options.items():
+            state = game.state(hand)
+            order = (hand.split, hand.depth)
+            if state not in canonical or order < canonical[state][0]:
+                canonical[state] = (order, options)
+        for state, (_, options) in canonical.items():
+            for action, value in options.items():
+                flat_Q[state, action] = value
+
+    actions = compile_greedy(Q, rules).actions
+    chart_actions = compile_policy(
+        partial(basic_strategy, **strategy_chart(actions)._asdict()), rules
+    ).actions
+    return Solution(
+        Q,
+        actions,
+        exact_return(actions, rules),
+        exact_return(chart_actions, rules),
+        float(optimal_return),
+    )
+
+
+def rules_fields(rules: Rules) -> dict:
+    # Rules don't pickle, workers are sent their fields instead
+    return {
+        "hit_soft_17": rules.hit_soft_17,
+        "blackjack_payout": rules.blackjack_payout,
+        "double_after_split": rules.double_after_split,
+        "max_hands": rules.max_hands,
+        "resplit_aces": rules.resplit_aces,
+        "double_on": rules.double_on.name,
+    }
+
+
+def rules_from_fields(fields: dict) -> Rules:
+    return Rules(**{**fields, "double_on": DoubleRule.__members__[fields["double_on"]]})
+
+
+def _solve_fields(fields: dict) -> Solution:
+    return _solve(rules_from_fields(fields))
+
+
+def solver_config(rules: Rules) -> dict:
+    return {
+        "trainer": "exact solver",
+        "code": code_version(sys.modules[__name__]),
+        "rules": repr(rules),
+        "engine": engine_version(rules),
+    }
+
+
+def solve(
+    rules: Optional[Rules] = None, cache: Optional[AgentCache] = None
+) -> Solution:
+    """Optimal strategy of the rules and its exact expected return."""
+    rules = Rules() if rules is None else rules
+    return solve_grid([rules], cache=cache)[0]
+
+
+def solve_grid(
+    variants: Sequence[Rules], workers: int = 1, cache: Optional[AgentCache] = None
+) -> list[Solution]:
+    """Solve many rule variants, in parallel over worker processes.
+
+    Solutions are cached by a hash of the rules, the solver's code and the
+    engine's fingerprint, so only variants not solved before are worked on.
+    """
+    solutions = [None] * len(variants)
+    configs = [solver_config(rules) if cache else None for rules in variants]
+    if cache:
+        for index, config in enumerate(configs):
+            hit = cache.get(config, 0, 0)
+            if hit is not None:
+                arrays = hit[1]
+                solutions[index] = Solution(
+                    arrays["Q"], arrays["actions"], *map(float, arrays["returns"])
+                )
+
+    unsolved = [index for index, solution in enumerate(solutions) if solution is None]
+    fields = [rules_fields(variants[index]) for index in unsolved]
+    workers = max(1, min(workers, len(unsolved)))
+    if workers == 1:
+        solved = map(_solve_fields, fields)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            solved = list(pool.map(_solve_fields, fields))
+
+    for index, solution in zip(unsolved, solved):
+        solutions[index] = solution
+        if cache:
+            returns = solution[2:]
+            arrays = {"Q": solution.Q, "actions": solution.actions, "returns": returns}
+            cache.put(configs[index], 0, arrays)
+    return solutions
+
+
+def rule_grid(**choices: Sequence) -> list[Rules]:
+    """Every combination of the choices for each Rules field, e.g.
+    rule_grid(hit_soft_17=[True, False], blackjack_payout=[1.5, 1.2])."""
+    names = list(choices)
+    return [
+        Rules(**dict(zip(names, values)))
+        for values in itertools.product(*choices.values())
+    ]
+
+
+def _variant_parts(rules: Rules) -> list[str]:
+    return [
+        "h17" if rules.hit_soft_17 else "s17",
+        f"bj{rules.blackjack_payout:g}",
+        "das" if rules.double_after_split else "ndas",
+        f"{rules.max_hands}hands",
+        "rsa" if rules.resplit_aces else "nrsa",
+        rules.double_on.name.lower(),
+    ]
+
+
+def variant_name(rules: Rules) -> str:
+    return "-".join(_variant_parts(rules))
+
+
+def changed_rules_name(rules: Rules) -> str:
+    """variant_name with only the rules that differ from the defaults."""
+    defaults = _variant_parts(Rules())
+    parts = [
+        part for part, default in zip(_variant_parts(rules), defaults) if part != default
+    ]
+    return "-".join(parts) or "default"
+
+
+def strategy_chart(actions: np.ndarray) -> Chart:
+    """Charts of an action table in the basic strategy layout.
+
+    A hand that doubles is D, or DS when it stands once it can't double.
+    Unreachable rows are hits, and where the table plays a two card hand
+    differently to a longer one the chart follows the two card hand.
+    """
+
+    def entry(hand_value: int, soft: bool, can_split: bool, upcard: int):
+        doubled = actions[encode_state(hand_value, upcard, soft, True, can_split)]
+        undoubled = actions[encode_state(hand_value, upcard, soft, False, can_split)]
+        if doubled == D:
+            return "DS" if undoubled == S else D
+        if doubled >= 0:
+            return int(doubled)
+        return int(undoubled) if undoubled >= 0 else H
+
+    def row(hand_value: int, soft: bool, can_split: bool = False) -> list:
+        return [entry(hand_value, soft, can_split, upcard) for upcard in range(2, 12)]
+
+    hard = {hand_value: row(hand_value, False) for hand_value in range(4, 22)}
+    soft = {hand_value: row(hand_value, True) for hand_value in range(12, 22)}
+    pair = {hand_value: row(hand_value, False, True) for hand_value in range(4, 21, 2)}
+    pair["A"] = row(12, True, True)
+    return Chart(hard, soft, pair)
+
+
+def format_chart(chart: Chart) -> str:
+    """Python source for the chart, as in basic_strategy.py."""
+    names = {H: "H", S: "S", D: "D", P: "P", "DS": '"DS"'}
+    tables = [
+        ("STRATEGY_HARD", chart.hard, {}),
+        ("STRATEGY_SOFT", chart.soft, {12: "A,A when it can't be split"}),
+        ("STRATEGY_PAIR", chart.pair, {"A": "A,A"}),
+    ]
+    for value in range(13, 22):
+        tables[1][2][value] = f"A,{value - 11}"
+    for value in range(4, 21, 2):
+        tables[2][2][value] = f"{value // 2},{value // 2}"
+
+    lines = []
+    for name, table, comments in tables:
+        lines.append(f"{name} = {{")
+        for key, row in table.items():
+            if len(set(row)) == 1:
+                actions = f"[{names[row[0]]}] * {len(row)}"
+            else:
+                actions = f"[{', '.join(names[action] for action in row)}]"
+            comment = f"  # {comments[key]}" if key in comments else ""
+            lines.append(f"    {key!r}: {actions},{comment}")
+        lines.append("}\n")
+    return "\n".join(lines)
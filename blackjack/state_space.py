@@ -1,12 +1,23 @@
 from enum import IntEnum
-from typing import NamedTuple
+from typing import NamedTuple, Optional
 
 import numpy as np
 
+from blackjack_env import DoubleRule, Rules, encode_state
+
 MAX_VALUE = 21
 MIN_VALUE = 4
 NUM_HAND_VALUES = (MAX_VALUE - MIN_VALUE) + 1
 NUM_UPCARDS = 10
+NUM_STATES = NUM_HAND_VALUES * NUM_UPCARDS * 2 * 2 * 2
+MAX_HANDS = Rules().max_hands
+
+# Hard totals each double rule allows doubling on
+DOUBLE_TOTALS = {
+    DoubleRule.ANY: range(MIN_VALUE, MAX_VALUE + 1),
+    DoubleRule.NINE_TO_ELEVEN: range(9, 12),
+    DoubleRule.TEN_OR_ELEVEN: range(10, 12),
+}
 
 
 class State(NamedTuple):
@@ -39,6 +50,13 @@ def initialize_Q(value: float) -> np.ndarray:
     return Q
 
 
+def initialize_N() -> np.ndarray:
+    # N(s, a) counts visits, as integers since float32 stops counting at 2^24
+    return np.zeros(
+        (NUM_HAND_VALUES, NUM_UPCARDS, 2, 2, 2, len(Action)), dtype=np.uint64
+    )
+
+
 def fill_legal_actions(legal: np.ndarray):
     CAN_DOUBLE = 1
     CAN_SPLIT = 1
@@ -54,10 +72,123 @@ def fill_legal_actions(legal: np.ndarray):
     legal[:, :, :, :, CAN_SPLIT, Action.SPLIT] = True
 
 
+def valid_states(rules: Optional[Rules] = None) -> np.ndarray:
+    # Flat mask of the states the engine can actually deal to a player
+    HARD = 0
+    SOFT = 1
+    valid = np.zeros((NUM_HAND_VALUES, NUM_UPCARDS, 2, 2, 2), dtype=bool)
+    hand_values = np.arange(MIN_VALUE, MAX_VALUE + 1)
+
+    # Hard hands: three or more cards make 6-21, two unpaired cards make 5-20
+    valid[hand_values >= 6, :, HARD, 0, 0] = True
+    valid[(hand_values >= 5) & (hand_values <= 20), :, HARD, 1, 0] = True
+    # Pairs of 2s through 10s, always with two cards so can double
+    valid[(hand_values % 2 == 0) & (hand_values <= 20), :, HARD, 1, 1] = True
+
+    # Soft hands start at A,2 and A,A is the only soft 12
+    valid[hand_values >= 13, :, SOFT, :, 0] = True
+    valid[hand_values == 12, :, SOFT, 1, 1] = True
+    if rules is None:
+        return valid.reshape(-1)
+
+    # Two card hands the rules don't let the player double
+    doubles = np.isin(hand_values, DOUBLE_TOTALS[rules.double_on])
+    undoubled = ~doubles if rules.double_after_split else np.ones_like(doubles)
+    pairs = (hand_values % 2 == 0) & (hand_values <= 20)
+    valid[undoubled & (hand_values == 5), :, HARD, 0, 0] = True
+    valid[undoubled & pairs, :, HARD, 0, 1] = True
+    if rules.double_on != DoubleRule.ANY or rules.resplit_aces:
+        # A,A can't be doubled, or is a split ace waiting to be split again
+        valid[hand_values == 12, :, SOFT, 0, 1] = True
+
+    # Pairs once no more hands are allowed, only 2,2 and A,A aren't covered
+    if 1 < rules.max_hands < MAX_HANDS:
+        # A split 2,2 at the limit
+        valid[hand_values == 4, :, HARD, int(not undoubled[0]), 0] = True
+    if rules.max_hands == 1:
+        valid[hand_values == 4, :, HARD, int(doubles[0]), 0] = True
+        can_double = int(rules.double_on == DoubleRule.ANY)
+        valid[hand_values == 12, :, SOFT, can_double, 0] = True
+        valid[:, :, :, :, 1] = False
+
+    # Hands the rules never let double
+    if rules.double_on != DoubleRule.ANY:
+        valid[~doubles, :, HARD, 1, :] = False
+        valid[:, :, SOFT, 1, :] = False
+    return valid.reshape(-1)
+
+
+VALID_STATES = valid_states()
+
+
+class StateIndex(NamedTuple):
+    """Dense numbering of the reachable states and their legal actions.
+
+    Tables indexed by engine state have a row for all 1,440 states, most of
+    which are never dealt. Compacted tables keep only the reachable rows, or
+    only the legal state-action pairs, and expand back to the engine layout.
+    """
+
+    states: np.ndarray  # Engine state of each dense state, ascending
+    dense: np.ndarray  # Dense state of each engine state, -1 if unreachable
+    legal: np.ndarray  # (num dense states, num actions) legal actions
+    pair_states: np.ndarray  # Dense state of each legal state-action pair
+    pair_actions: np.ndarray  # Action of each legal state-action pair
+
+    @property
+    def num_states(self) -> int:
+        return len(self.states)
+
+    def compact(self, table: np.ndarray) -> np.ndarray:
+        # Engine states are the second to last axis, as in flatten_Q(Q)
+        return table[..., self.states, :]
+
+    def expand(self, table: np.ndarray, base: np.ndarray) -> np.ndarray:
+        # Unreachable rows are taken from base
+        expanded = base.astype(table.dtype, copy=True)
+        expanded[..., self.states, :] = table
+        return expanded
+
+    def compact_pairs(self, table: np.ndarray) -> np.ndarray:
+        return table[..., self.states[self.pair_states], self.pair_actions]
+
+    def expand_pairs(self, values: np.ndarray, base: np.ndarray) -> np.ndarray:
+        expanded = base.astype(values.dtype, copy=True)
+        expanded[..., self.states[self.pair_states], self.pair_actions] = values
+        return expanded
+
+
+def state_index(rules: Optional[Rules] = None) -> StateIndex:
+    # Engine states come from the C++ encoding of every hand the rules can deal
+    shape = (NUM_HAND_VALUES, NUM_UPCARDS, 2, 2, 2)
+    value, upcard, useable_ace, can_double, can_split = np.indices(shape)
+    engine_states = encode_state(
+        value + MIN_VALUE, upcard + 2, useable_ace, can_double, can_split
+    )
+    reachable = valid_states(rules).reshape(shape)
+    states = np.sort(engine_states[reachable])
+
+    dense = np.full(NUM_STATES, -1, dtype=np.int32)
+    dense[states] = np.arange(len(states))
+    legal = np.zeros((NUM_STATES, len(Action)), dtype=bool)
+    fill_legal_actions(legal.reshape(*shape, len(Action)))
+    legal = legal[states]
+    pair_states, pair_actions = np.nonzero(legal)
+    return StateIndex(states, dense, legal, pair_states, pair_actions)
+
+
+STATE_INDEX = state_index()
+
+
 def flatten_Q(Q: np.ndarray) -> np.ndarray:
     return Q.reshape(-1, len(Action))
 
 
+def flatten_Q_pair(Q: np.ndarray) -> np.ndarray:
+    # Two tables interleaved per state, as (..., 2, len(Action))
+    return Q.reshape(-1, 2, len(Action))
+
+
 def decode_state(state: int):
     can_split = state % 2
     state //= 2
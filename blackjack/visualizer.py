@@ -1,6 +1,15 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Sequence
+
 import numpy as np
 import plotly.express as px
-from pathlib import Path
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+from blackjack.basic_strategy import BASIC_STRATEGY_ACTIONS
+from blackjack.state_space import NUM_HAND_VALUES, NUM_UPCARDS, VALID_STATES, Action
 
 HAND_HARD = 0
 HAND_SOFT = 1
@@ -8,83 +17,174 @@ HAND_PAIR = 2
 
 ACTIONS = ["HIT", "STAND", "DOUBLE", "SPLIT"]
 
-def plot_strategy_hard(Q: np.ndarray, save_path: Path):
-    best = np.argmax(Q, axis=-1)
+UPCARDS = list(range(2, 12))
+# Row labels of each view, hard and soft are totals and pairs are the paired card
+HAND_LABELS = {
+    HAND_HARD: list(range(4, 21)),
+    HAND_SOFT: list(range(13, 22)),
+    HAND_PAIR: list(range(2, 12)),
+}
+HAND_TITLES = {HAND_HARD: "Hard", HAND_SOFT: "Soft", HAND_PAIR: "Pairs"}
+
+STATE_SHAPE = (NUM_HAND_VALUES, NUM_UPCARDS, 2, 2, 2)
+
+
+def best_actions(Q: np.ndarray) -> np.ndarray:
+    return np.argmax(Q.reshape(*STATE_SHAPE, len(Action)), axis=-1)
 
+
+def hard_view(best: np.ndarray) -> np.ndarray:
     useable_ace = 0
     can_double = 1
     can_split = 0
-    hard = best[:17, :, useable_ace, can_double, can_split]
-
-    # valid player values 4–21, dealer 1–11
-    fig = px.imshow(
-        hard,
-        labels=dict(x="Dealer Upcard", y="Player Total", color="Action"),
-        x=list(range(2, 12)),
-        y=list(range(4, 21)),
-        color_continuous_scale="Viridis"
-    )
-    fig.update_coloraxes(
-        colorbar=dict(
-            tickvals=[0,1,2,3], 
-            ticktext=ACTIONS
-        )
-    )
-    fig.show()
-    fig.write_image(save_path / "hard_strategy.png", format="png")
+    return best[:17, :, useable_ace, can_double, can_split]
 
-def plot_strategy_soft(Q: np.ndarray, save_path: Path):
-    best = np.argmax(Q, axis=-1)
 
-    # only take hard hands with 2 cards
+def soft_view(best: np.ndarray) -> np.ndarray:
+    # only take soft hands with 2 cards
     useable_ace = 1
     can_double = 1
     can_split = 0
-    soft = best[9:, :, useable_ace, can_double, can_split]
+    return best[9:, :, useable_ace, can_double, can_split]
+
+
+def pair_view(best: np.ndarray) -> np.ndarray:
+    # Pairs of 2s to 10s are even hard totals, A,A is the only soft 12
+    can_double = 1
+    can_split = 1
+    pair = best[0:19:2, :, 0, can_double, can_split]
+    soft12 = best[8, :, 1, can_double, can_split]
+    return np.vstack([pair, soft12])
+
+
+def strategy_views(best: np.ndarray) -> dict[int, np.ndarray]:
+    """Hard, soft and pair tables from one state-shaped array of actions."""
+    return {
+        HAND_HARD: hard_view(best),
+        HAND_SOFT: soft_view(best),
+        HAND_PAIR: pair_view(best),
+    }
+
+
+BASIC_STRATEGY_VIEWS = strategy_views(BASIC_STRATEGY_ACTIONS.reshape(STATE_SHAPE))
+VALID_VIEWS = strategy_views(VALID_STATES.reshape(STATE_SHAPE))
 
+
+def _plot_strategy(view: np.ndarray, hand: int, save_path: Path, filename: str):
     # valid player values 4–21, dealer 1–11
     fig = px.imshow(
-        soft,
+        view,
         labels=dict(x="Dealer Upcard", y="Player Total", color="Action"),
-        x=list(range(2, 12)),
-        y=list(range(13, 22)),
+        x=UPCARDS,
+        y=HAND_LABELS[hand],
         color_continuous_scale="Viridis"
     )
     fig.update_coloraxes(
         colorbar=dict(
-            tickvals=[0,1,2,3], 
+            tickvals=[0,1,2,3],
             ticktext=ACTIONS
         )
     )
     fig.show()
-    fig.write_image(save_path / "soft_strategy.png", format="png")
+    fig.write_image(save_path / filename, format="png")
+
+
+def plot_strategy_hard(Q: np.ndarray, save_path: Path):
+    hard = hard_view(best_actions(Q))
+    _plot_strategy(hard, HAND_HARD, save_path, "hard_strategy.png")
+
+
+def plot_strategy_soft(Q: np.ndarray, save_path: Path):
+    soft = soft_view(best_actions(Q))
+    _plot_strategy(soft, HAND_SOFT, save_path, "soft_strategy.png")
+
 
 def plot_strategy_pair(Q: np.ndarray, save_path: Path):
-    best: np.ndarray = np.argmax(Q, axis=-1)
+    pair = pair_view(best_actions(Q))
+    _plot_strategy(pair, HAND_PAIR, save_path, "pair_strategy.png")
 
-    # only take hard hands with 2 cards
-    useable_ace = 0
-    can_double = 1
-    can_split = 1
-    pair = best[0:19:2, :, useable_ace, can_double, can_split]
 
-    useable_ace = 1
-    soft12 = best[8, :, useable_ace, can_double, can_split]
-    pair = np.vstack([pair, soft12])
+def strategy_figure(Q: np.ndarray, diff: bool = False, title: str = "") -> go.Figure:
+    """All three strategy views of a Q table side by side in one figure.
 
-    # valid player values 4–21, dealer 1–11
-    fig = px.imshow(
-        pair,
-        labels=dict(x="Dealer Upcard", y="Player Total", color="Action"),
-        x=list(range(2, 12)),
-        y=list(range(2, 12)),
-        color_continuous_scale="Viridis"
+    With diff=True cells show where the greedy action differs from basic
+    strategy instead of the action itself, unreachable cells are left blank.
+    """
+    views = strategy_views(best_actions(Q))
+    fig = make_subplots(
+        rows=1,
+        cols=len(views),
+        subplot_titles=[HAND_TITLES[hand] for hand in views],
+        horizontal_spacing=0.06,
     )
-    fig.update_coloraxes(
-        colorbar=dict(
-            tickvals=[0,1,2,3], 
-            ticktext=ACTIONS
+    for col, (hand, view) in enumerate(views.items(), start=1):
+        if diff:
+            differs = (view != BASIC_STRATEGY_VIEWS[hand]).astype(float)
+            z = np.where(VALID_VIEWS[hand], differs, np.nan)
+        else:
+            z = view
+        fig.add_trace(
+            go.Heatmap(z=z, x=UPCARDS, y=HAND_LABELS[hand], coloraxis="coloraxis"),
+            row=1,
+            col=col,
         )
-    )
-    fig.show()
-    fig.write_image(save_path / "pair_strategy.png", format="png")
+        fig.update_xaxes(title_text="Dealer Upcard", dtick=1, row=1, col=col)
+        fig.update_yaxes(autorange="reversed", dtick=1, row=1, col=col)
+
+    if diff:
+        coloraxis = dict(
+            colorscale=[[0, "#dddddd"], [1, "#d62728"]],
+            cmin=0,
+            cmax=1,
+            colorbar=dict(tickvals=[0, 1], ticktext=["Basic", "Differs"]),
+        )
+    else:
+        coloraxis = dict(
+            colorscale="Viridis",
+            cmin=0,
+            cmax=len(ACTIONS) - 1,
+            colorbar=dict(tickvals=[0, 1, 2, 3], ticktext=ACTIONS),
+        )
+    fig.update_layout(coloraxis=coloraxis, title=title, width=1500, height=550)
+    fig.update_yaxes(title_text="Player Hand", row=1, col=1)
+    return fig
+
+
+def _render_chunk(
+    Q_paths: Sequence[Path], save_dir: Path, diff: bool, scale: float
+) -> list[Path]:
+    suffix = "_diff" if diff else ""
+    figures = [
+        strategy_figure(np.load(path), diff, title=path.stem) for path in Q_paths
+    ]
+    outputs = [save_dir / f"{path.stem}{suffix}_strategy.png" for path in Q_paths]
+    # One call exports the whole chunk through a single Kaleido process
+    pio.write_images(figures, outputs, scale=scale)
+    return outputs
+
+
+def render_strategies(
+    Q_paths: Sequence[Path],
+    save_dir: Path,
+    diff: bool = False,
+    workers: int = 1,
+    scale: float = 2,
+) -> list[Path]:
+    """Export strategy figures for many saved Q tables without displaying them."""
+    Q_paths = list(Q_paths)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    workers = max(1, min(workers, len(Q_paths)))
+    if workers == 1:
+        return _render_chunk(Q_paths, save_dir, diff, scale)
+
+    chunk_size = -(-len(Q_paths) // workers)
+    chunks = [Q_paths[i : i + chunk_size] for i in range(0, len(Q_paths), chunk_size)]
+    with ProcessPoolExecutor(workers) as pool:
+        rendered = pool.map(
+            _render_chunk,
+            chunks,
+            [save_dir] * len(chunks),
+            [diff] * len(chunks),
+            [scale] * len(chunks),
+        )
+    return [path for chunk in rendered for path in chunk]
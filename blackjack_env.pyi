@@ -1,5 +1,8 @@
 # Type hints for C++ Blackjack Environment
 from dataclasses import dataclass
+from enum import Enum
+
+import numpy as np
 
 # ---------- Result object ----------
 @dataclass(frozen=True)
@@ -9,9 +12,73 @@ class Result:
     split_state: int
     terminated: bool
 
+# ---------- State encoding ----------
+NUM_STATES: int
+# Flat state index the engine uses, elementwise over numpy arrays
+def encode_state(
+    hand_value: int | np.ndarray,
+    upcard: int | np.ndarray,
+    useable_ace: bool | np.ndarray,
+    can_double: bool | np.ndarray,
+    can_split: bool | np.ndarray,
+) -> int | np.ndarray: ...
+
+# ---------- Table rules ----------
+class DoubleRule(Enum):
+    ANY = 0  # Any two cards
+    NINE_TO_ELEVEN = 1  # Hard 9, 10 or 11
+    TEN_OR_ELEVEN = 2  # Hard 10 or 11
+
+class Rules:
+    # The defaults are the rules the environment has always used
+    def __init__(
+        self,
+        *,
+        hit_soft_17: bool = True,
+        blackjack_payout: float = 1.5,
+        double_after_split: bool = True,
+        max_hands: int = 12,  # 1 means no splitting
+        resplit_aces: bool = False,
+        double_on: DoubleRule = DoubleRule.ANY,
+    ) -> None: ...
+    hit_soft_17: bool
+    blackjack_payout: float
+    double_after_split: bool
+    max_hands: int
+    resplit_aces: bool
+    double_on: DoubleRule
+
 # ---------- BlackjackEnv API ----------
 class BlackjackEnv:
-    def __init__(self, seed: int) -> None: ...
+    # Raises ValueError for rules it can't play, the env keeps a copy of them
+    def __init__(self, seed: int, rules: Rules = ...) -> None: ...
+    @property
+    def rules(self) -> Rules: ...
+    # Card generator state as text, setting it continues the same stream of
+    # cards. Raises ValueError if it isn't a state the env saved
+    @property
+    def rng_state(self) -> str: ...
+    @rng_state.setter
+    def rng_state(self, state: str) -> None: ...
     def new_game(self) -> None: ...
     def get_state(self) -> int: ...  # state index
-    def play_hand(self, action: int) -> Result: ...
\ No newline at end of file
+    def play_hand(self, action: int) -> Result: ...
+    # Batch calls release the GIL, so envs can run on a thread each. An env must
+    # not be used from two threads at once
+    # Plays whole episodes natively, actions is an int8 table indexed by state
+    def evaluate(self, actions: np.ndarray, num_episodes: int) -> np.ndarray: ...
+    # Every row of actions plays the same cards each episode, returns (policies, episodes)
+    def evaluate_paired(self, actions: np.ndarray, num_episodes: int) -> np.ndarray: ...
+
+# ---------- BlackjackVecEnv API ----------
+class BlackjackVecEnv:
+    # Every env is seeded with seed and starts its first game straight away
+    def __init__(self, num_envs: int, seed: int, rules: Rules = ...) -> None: ...
+    @property
+    def num_envs(self) -> int: ...
+    def get_states(self) -> np.ndarray: ...  # int32 state of each env
+    # One action per env, finished games are replaced by new ones and envs given
+    # a negative action are skipped. Releases the GIL while stepping
+    def step(
+        self, actions: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: ...
@@ -1,14 +1,17 @@
-import datetime
-import sqlite3
+import math
+from typing import Optional, Sequence
 
 import numpy as np
 
 from blackjack.agent import Agent
-from blackjack.algorithms import ALGORITHMS_MAP
+from blackjack.agent_cache import AGENT_CACHE_PATH, AgentCache
+from blackjack.algorithms import ALGORITHMS_MAP, EPSILON_ALGORITHMS
+from blackjack.curves import CURVES_PATH, LearningCurveWriter
+from blackjack.evaluation import evaluate_memoized, evaluate_paired
+from blackjack.multi_agent import LOCKSTEP_ALGORITHMS, MultiAgent
+from blackjack.results import DATABASE_PATH, ResultsStore
 
-DATABASE_NAME = "compare_algos"
-DATABASE_PATH = f"databases/{DATABASE_NAME}.sqlite3"
-REGISTRY_NAME = "hyperparameter_registry"
+EXPERIMENT_NAME = "compare_algos"
 
 SEED = 42
 TRAIN_EPISODES = 1_000_000
@@ -16,115 +19,351 @@ TEST_EPISODES = 1_000_000
 DECAY_FACTOR_STEP_SIZE = 10
 DECAY_FACTOR_MAX = 1000
 
+# Grid searches train all decay factors of an algorithm together with MultiAgent,
+# in blocks of LOCKSTEP_BLOCK episodes to bound the memory their returns take
+LOCKSTEP = True
+LOCKSTEP_BLOCK = 250_000
 
-def save_hyperparameters(cursor: sqlite3.Cursor, conn: sqlite3.Connection) -> None:
-    # Create table if doesn't exist
-    cursor.execute(
-        f"""--sql
-        CREATE TABLE IF NOT EXISTS {REGISTRY_NAME} (
-            experiment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            train_episodes INTEGER,
-            test_episodes INTEGER,
-            algorithms TEXT,
-            decay_factor_step_size INTEGER,
-            decay_factor_max INTEGER,
-            seed INTEGER,
-            created DATETIME
-        )"""
-    )
-    conn.commit()
-
-    # Save hyperparameters
-    cursor.execute(
-        f"""--sql
-        INSERT INTO {REGISTRY_NAME}(
-            train_episodes, test_episodes, algorithms, decay_factor_step_size,
-            decay_factor_max, seed, created
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (
-            TRAIN_EPISODES,
-            TEST_EPISODES,
-            ",".join(list(ALGORITHMS_MAP.keys())),
-            DECAY_FACTOR_STEP_SIZE,
-            DECAY_FACTOR_MAX,
-            SEED,
-            datetime.datetime.now(),
-        ),
-    )
-    conn.commit()
-
-
-def create_experiment(cursor: sqlite3.Cursor, conn: sqlite3.Connection) -> str:
-    """Create experiment results table and return table name."""
-    # Get the most recent experiment_id from registry
-    cursor.execute(f"""--sql SELECT MAX(experiment_id) FROM {REGISTRY_NAME}""")
-    result = cursor.fetchone()
-    experiment_id = result[0] if result and result[0] else 1
-
-    # Create table with experiment_id in name
-    table_name = f"{DATABASE_NAME}_exp_{experiment_id}"
-    cursor.execute(
-        f"""--sql
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            algorithm TEXT NOT NULL,
-            decay_factor INTEGER,
-            mean_return REAL
-        )"""
-    )
-    conn.commit()
-    return table_name
+# "grid" trains every decay factor for TRAIN_EPISODES, "halving" runs a
+# successive halving search that only trains the promising ones that long
+SEARCH = "grid"
+HALVING_RUNGS = 4
+HALVING_ETA = 3  # Each rung keeps the best 1 / eta of the decay factors
+
+# Trained agents are kept in AGENT_CACHE_PATH, a rerun with the same
+# configuration loads them and a longer one carries on from them
+CACHE_AGENTS = True
+
+# Grid trials of an algorithm are trained one after another, each warm started
+# from the previous decay factor's Q with its N scaled by CHAIN_PRIOR_WEIGHT
+CHAIN_TRIALS = False
+CHAIN_PRIOR_WEIGHT = 0.1
+
+
+def save_hyperparameters(
+    store: ResultsStore,
+    train_episodes: int = TRAIN_EPISODES,
+    test_episodes: int = TEST_EPISODES,
+    algorithms: Sequence[str] = tuple(ALGORITHMS_MAP),
+    decay_factor_step_size: int = DECAY_FACTOR_STEP_SIZE,
+    decay_factor_max: int = DECAY_FACTOR_MAX,
+    seed: int = SEED,
+    search: str = SEARCH,
+    halving_rungs: int = HALVING_RUNGS,
+    halving_eta: int = HALVING_ETA,
+    chain_trials: bool = CHAIN_TRIALS,
+) -> int:
+    """Register the experiment configuration and return its experiment_id."""
+    config = {
+        "train_episodes": train_episodes,
+        "test_episodes": test_episodes,
+        "algorithms": list(algorithms),
+        "decay_factor_step_size": decay_factor_step_size,
+        "decay_factor_max": decay_factor_max,
+        "seed": seed,
+        "search": search,
+    }
+    if search == "halving":
+        config["halving_rungs"] = halving_rungs
+        config["halving_eta"] = halving_eta
+    elif chain_trials:
+        config["chain_prior_weight"] = CHAIN_PRIOR_WEIGHT
+    return store.create_experiment(EXPERIMENT_NAME, config)
 
 
 def run_trial(
-    cursor: sqlite3.Cursor,
-    conn: sqlite3.Connection,
-    table_name: str,
+    store: ResultsStore,
+    experiment_id: int,
     trial_num: int,
     algo: str,
     decay_factor: int | None = None,
-):
-    """Run single trial, save to DB, print result, return next trial_num."""
-    agent = Agent(algo_name=algo, Q_init=0, decay_factor=decay_factor, seed=SEED)
-    agent.train(num_episodes=TRAIN_EPISODES)
-    mean_return = float(np.mean(agent.evaluate(num_episodes=TEST_EPISODES)))
-    cursor.execute(
-        f"""--sql
-        INSERT INTO {table_name}(algorithm, decay_factor, mean_return)
-        VALUES (?, ?, ?)""",
-        (algo, decay_factor, mean_return),
+    train_episodes: int = TRAIN_EPISODES,
+    test_episodes: int = TEST_EPISODES,
+    seed: int = SEED,
+    cache: Optional[AgentCache] = None,
+    warm_start_from: Optional[Agent] = None,
+) -> Agent:
+    """Run single trial, save to DB and print result."""
+    agent = Agent(
+        algo_name=algo, Q_init=0, decay_factor=decay_factor, seed=seed, cache=cache
+    )
+    params = None
+    if warm_start_from is not None:
+        agent.warm_start(warm_start_from.Q, warm_start_from.N, CHAIN_PRIOR_WEIGHT)
+        params = {"warm_start_decay_factor": warm_start_from.decay_factor}
+    with LearningCurveWriter(
+        CURVES_PATH,
+        trial=f"{experiment_id}-{trial_num}",
+        partitions={
+            "experiment_id": experiment_id,
+            "algorithm": algo,
+            "decay_factor": decay_factor,
+        },
+    ) as learning_curve:
+        agent.train(num_episodes=train_episodes, callbacks=[learning_curve])
+    # Decay factors often agree on the greedy policy, each is only played once
+    mean_return = evaluate_memoized(
+        agent.Q, test_episodes, seed, rules=agent.rules, store=store
+    ).mean
+    store.record_trial(
+        experiment_id,
+        algo,
+        {"mean_return": mean_return},
+        decay_factor=decay_factor,
+        seed=seed,
+        params=params,
     )
-    conn.commit()
 
     decay_str = f" (decay={decay_factor})" if decay_factor else ""
     print(f"Trial {trial_num}: {algo}{decay_str} = {mean_return:.6f}")
+    return agent
+
+
+def run_lockstep_trials(
+    store: ResultsStore,
+    experiment_id: int,
+    first_trial_num: int,
+    algo: str,
+    decay_factors: Sequence[int],
+    train_episodes: int = TRAIN_EPISODES,
+    test_episodes: int = TEST_EPISODES,
+    seed: int = SEED,
+    cache: Optional[AgentCache] = None,
+):
+    """Train every decay factor in lockstep, then evaluate and save each trial."""
+    agents = MultiAgent(algo, Q_init=0, decay_factors=decay_factors, seed=seed)
+    trial_nums = range(first_trial_num, first_trial_num + len(decay_factors))
+    curves = [
+        LearningCurveWriter(
+            CURVES_PATH,
+            trial=f"{experiment_id}-{trial_num}",
+            partitions={
+                "experiment_id": experiment_id,
+                "algorithm": algo,
+                "decay_factor": decay_factor,
+            },
+        )
+        for trial_num, decay_factor in zip(trial_nums, decay_factors)
+    ]
+
+    # A cached group has no returns, so its curves stay empty
+    cached = cache is not None and cache.restore_lockstep(agents, train_episodes)
+    while agents.episodes_trained < train_episodes:
+        block = min(LOCKSTEP_BLOCK, train_episodes - agents.episodes_trained)
+        returns = agents.train(block)
+        for curve, agent_returns in zip(curves, returns):
+            curve(agents, agents.episodes_trained, agent_returns)
+    if cache is not None and not cached:
+        cache.save_lockstep(agents)
+
+    for agent, (trial_num, decay_factor) in enumerate(zip(trial_nums, decay_factors)):
+        curves[agent].close()
+        mean_return = evaluate_memoized(
+            agents.agent_Q(agent), test_episodes, seed, store=store
+        ).mean
+        store.record_trial(
+            experiment_id,
+            algo,
+            {"mean_return": mean_return},
+            decay_factor=decay_factor,
+            seed=seed,
+        )
+        print(f"Trial {trial_num}: {algo} (decay={decay_factor}) = {mean_return:.6f}")
+
+
+def rung_budgets(train_episodes: int, num_rungs: int, eta: int) -> list[int]:
+    """Total training episodes at each rung, growing by eta up to train_episodes."""
+    return [
+        max(1, train_episodes // eta ** (num_rungs - 1 - rung))
+        for rung in range(num_rungs)
+    ]
+
+
+def successive_halving(
+    store: ResultsStore,
+    experiment_id: int,
+    first_trial_num: int,
+    algo: str,
+    decay_factors: Sequence[int],
+    train_episodes: int = TRAIN_EPISODES,
+    test_episodes: int = TEST_EPISODES,
+    seed: int = SEED,
+    num_rungs: int = HALVING_RUNGS,
+    eta: int = HALVING_ETA,
+    cache: Optional[AgentCache] = None,
+) -> int:
+    """Search decay factors by successive halving and return the best one.
+
+    Every decay factor is trained for a small budget and evaluated, the best
+    1 / eta carry on training from their current Q and N to the next rung's
+    budget. The last rung reaches train_episodes. Each rung's evaluation is
+    stored as a metric of the trial with step set to the episodes trained.
+    """
+    agents = {}
+    trial_ids = {}
+    curves = {}
+    for trial_num, decay_factor in enumerate(decay_factors, start=first_trial_num):
+        agents[decay_factor] = Agent(
+            algo_name=algo,
+            Q_init=0,
+            decay_factor=decay_factor,
+            seed=seed,
+            cache=cache,
+        )
+        trial_ids[decay_factor] = store.add_trial(
+            experiment_id, algo, decay_factor, seed
+        )
+        curves[decay_factor] = LearningCurveWriter(
+            CURVES_PATH,
+            trial=f"{experiment_id}-{trial_num}",
+            partitions={
+                "experiment_id": experiment_id,
+                "algorithm": algo,
+                "decay_factor": decay_factor,
+            },
+        )
+
+    survivors = list(decay_factors)
+    for rung, budget in enumerate(rung_budgets(train_episodes, num_rungs, eta)):
+        for decay_factor in survivors:
+            agent = agents[decay_factor]
+            agent.train(
+                budget - agent.episodes_trained, callbacks=[curves[decay_factor]]
+            )
+
+        # Survivors play the same cards so their ranking isn't down to luck
+        result = evaluate_paired(
+            [agents[decay_factor].Q for decay_factor in survivors],
+            test_episodes,
+            seed,
+            chunk_size=max(10_000, 10_000_000 // len(survivors)),
+        )
+        for decay_factor, mean_return in zip(survivors, result.means):
+            store.add_metrics(
+                trial_ids[decay_factor],
+                {"mean_return": float(mean_return), "rung": rung},
+                step=budget,
+            )
+
+        ranked = [survivors[i] for i in np.argsort(-result.means, kind="stable")]
+        keep = max(1, math.ceil(len(ranked) / eta))
+        for decay_factor in ranked[keep:]:
+            curves.pop(decay_factor).close()
+            del agents[decay_factor]
+        survivors = ranked[:keep]
+        print(
+            f"Rung {rung} ({budget} episodes): {algo} kept decay factors {survivors}"
+        )
+
+    for curve in curves.values():
+        curve.close()
+    return survivors[0]
 
 
 def run_experiment(
-    cursor: sqlite3.Cursor, conn: sqlite3.Connection, table_name: str
+    store: ResultsStore,
+    experiment_id: int,
+    algorithms: Sequence[str] = tuple(ALGORITHMS_MAP),
+    decay_factor_step_size: int = DECAY_FACTOR_STEP_SIZE,
+    decay_factor_max: int = DECAY_FACTOR_MAX,
+    search: str = SEARCH,
+    halving_rungs: int = HALVING_RUNGS,
+    halving_eta: int = HALVING_ETA,
+    chain_trials: bool = CHAIN_TRIALS,
+    **trial_kwargs,
 ) -> None:
     """Run experiments and save results to database."""
     trial_num = 1
-    for algo in ALGORITHMS_MAP.keys():
-        if algo == "Q Learning":
-            run_trial(cursor, conn, table_name, trial_num, algo)
+    for algo in algorithms:
+        decay_factors = [
+            int(decay_factor)
+            for decay_factor in np.arange(
+                decay_factor_step_size, decay_factor_max + 1, decay_factor_step_size
+            )
+        ]
+        if ALGORITHMS_MAP[algo] not in EPSILON_ALGORITHMS:
+            # The decay factor only sets exploration, so one trial covers them all
+            run_trial(store, experiment_id, trial_num, algo, **trial_kwargs)
             trial_num += 1
+        elif search == "halving":
+            best = successive_halving(
+                store,
+                experiment_id,
+                trial_num,
+                algo,
+                decay_factors,
+                num_rungs=halving_rungs,
+                eta=halving_eta,
+                **trial_kwargs,
+            )
+            trial_num += len(decay_factors)
+            print(f"{algo}: best decay factor {best}")
+        elif LOCKSTEP and algo in LOCKSTEP_ALGORITHMS and not chain_trials:
+            run_lockstep_trials(
+                store, experiment_id, trial_num, algo, decay_factors, **trial_kwargs
+            )
+            trial_num += len(decay_factors)
         else:
-            for decay_factor in np.arange(
-                DECAY_FACTOR_STEP_SIZE, DECAY_FACTOR_MAX + 1, DECAY_FACTOR_STEP_SIZE
-            ):
-                run_trial(cursor, conn, table_name, trial_num, algo, int(decay_factor))
+            previous = None
+            for decay_factor in decay_factors:
+                agent = run_trial(
+                    store,
+                    experiment_id,
+                    trial_num,
+                    algo,
+                    decay_factor,
+                    warm_start_from=previous,
+                    **trial_kwargs,
+                )
+                previous = agent if chain_trials else None
                 trial_num += 1
 
 
-def main():
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    save_hyperparameters(cursor, conn)
-    table_name = create_experiment(cursor, conn)
-    run_experiment(cursor, conn, table_name)
-    conn.close()
-    print(f"\nResults saved to {DATABASE_PATH} (table_name: {table_name})")
+def main(
+    train_episodes: int = TRAIN_EPISODES,
+    test_episodes: int = TEST_EPISODES,
+    algorithms: Sequence[str] = tuple(ALGORITHMS_MAP),
+    decay_factor_step_size: int = DECAY_FACTOR_STEP_SIZE,
+    decay_factor_max: int = DECAY_FACTOR_MAX,
+    seed: int = SEED,
+    search: str = SEARCH,
+    halving_rungs: int = HALVING_RUNGS,
+    halving_eta: int = HALVING_ETA,
+    cache_agents: bool = CACHE_AGENTS,
+    chain_trials: bool = CHAIN_TRIALS,
+) -> int:
+    cache = AgentCache(AGENT_CACHE_PATH) if cache_agents else None
+    with ResultsStore(DATABASE_PATH) as store:
+        experiment_id = save_hyperparameters(
+            store,
+            train_episodes,
+            test_episodes,
+            algorithms,
+            decay_factor_step_size,
+            decay_factor_max,
+            seed,
+            search,
+            halving_rungs,
+            halving_eta,
+            chain_trials,
+        )
+        run_experiment(
+            store,
+            experiment_id,
+            algorithms,
+            decay_factor_step_size,
+            decay_factor_max,
+            search,
+            halving_rungs,
+            halving_eta,
+            chain_trials,
+            train_episodes=train_episodes,
+            test_episodes=test_episodes,
+            seed=seed,
+            cache=cache,
+        )
+    print(f"\nResults saved to {DATABASE_PATH} (experiment_id: {experiment_id})")
+    return experiment_id
 
 
 if __name__ == "__main__":
@@ -1,17 +1,29 @@
-import sqlite3
 from functools import partial
 from pathlib import Path
+from typing import Optional
 
 import numpy as np
 
-from blackjack.agent import evaluate_policy, evaluate_Q
+from blackjack.agent import evaluate_policy
 from blackjack.basic_strategy import basic_strategy
-from blackjack.policy import random
+from blackjack.evaluation import (
+    evaluate_controlled,
+    evaluate_memoized,
+    evaluate_paired,
+)
+from blackjack.policy import compile_policy, random
+from blackjack.results import DATABASE_PATH, ResultsStore
 from blackjack.state_space import flatten_Q, initialize_Q
 from train_agent import NUM_TRAIN_EPISODES
 
 SEED = 42
-NUM_TEST_EPISODES = 200_000_000  # Confidence interval of around +/- 0.02%
+NUM_TEST_EPISODES = 200_000_000  # Budget, stops early once TARGET_CI is reached
+TARGET_CI = 0.0002  # Half width of the 95% confidence interval, +/- 0.02%
+# Play deterministic agents on identical cards and compare them to basic strategy
+PAIRED = True
+# Correct agents' means with basic strategy played on the same cards as a control,
+# takes precedence over PAIRED
+CONTROL_VARIATE = True
 
 SAVED_AGENT_PATH = Path("trained_agents")
 SAVED_AGENTS = (
@@ -19,106 +31,181 @@ SAVED_AGENTS = (
     f"Expected_SARSA__{NUM_TRAIN_EPISODES}.npy",
 )
 
-DATABASE_NAME = "evaluate_agents"
-DATABASE_PATH = f"databases/{DATABASE_NAME}.sqlite3"
-REGISTRY_NAME = "hyperparameter_registry"
+EXPERIMENT_NAME = "evaluate_agents"
 
 
 def save_hyperparameters(
-    cursor: sqlite3.Cursor, conn: sqlite3.Connection, agents_evaluated: list[str]
-) -> int | None:
-    # Create table if doesn't exist
-    cursor.execute(
-        f"""--sql
-        CREATE TABLE IF NOT EXISTS {REGISTRY_NAME} (
-            experiment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            num_episodes INTEGER,
-            agents_evaluated TEXT
-        )"""
-    )
-    conn.commit()
-
-    # Save hyperparameters
-    cursor.execute(
-        f"""--sql
-        INSERT INTO {REGISTRY_NAME}(
-            num_episodes, agents_evaluated
-        ) VALUES (?, ?)""",
-        (NUM_TEST_EPISODES, ", ".join(agents_evaluated)),
-    )
-    conn.commit()
-    return cursor.lastrowid
-
-
-def create_evaluation(
-    cursor: sqlite3.Cursor, conn: sqlite3.Connection, experiment_id: int | None
-) -> str:
-    table_name = f"{DATABASE_NAME}_test_{experiment_id}"
-    cursor.execute(
-        f"""--sql
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            agent TEXT NOT NULL,
-            mean_return REAL
-        )"""
+    store: ResultsStore,
+    agents_evaluated: list[str],
+    num_episodes: int = NUM_TEST_EPISODES,
+    target_ci: Optional[float] = TARGET_CI,
+) -> int:
+    return store.create_experiment(
+        EXPERIMENT_NAME,
+        {
+            "num_episodes": num_episodes,
+            "target_ci": target_ci,
+            "agents_evaluated": agents_evaluated,
+        },
     )
-    conn.commit()
-    return table_name
 
 
 def evaluate_agent(
-    cursor: sqlite3.Cursor,
-    conn: sqlite3.Connection,
+    store: ResultsStore,
+    experiment_id: int,
     agent: str,
     evaluate_func,
-    table_name: str,
+    num_episodes: int = NUM_TEST_EPISODES,
+    seed: int = SEED,
+    target_ci: Optional[float] = TARGET_CI,
 ):
-    mean_return = float(np.mean(evaluate_func(num_episodes=NUM_TEST_EPISODES)))
-    cursor.execute(
-        f"""--sql
-        INSERT INTO {table_name} (agent, mean_return)
-        VALUES (?, ?)
-        """,
-        (agent, mean_return),
-    )
-    conn.commit()
-
+    # evaluate_func returns an EvaluationResult, with or without target_ci
+    if target_ci is None:
+        result = evaluate_func(num_episodes=num_episodes)
+    else:
+        result = evaluate_func(num_episodes=num_episodes, target_ci=target_ci)
+    metrics = {
+        "mean_return": result.mean,
+        "ci_half_width": result.half_width,
+        "num_episodes": result.num_episodes,
+    }
+    store.record_trial(experiment_id, agent, metrics, seed=seed)
+    return result.mean
+
+
+def evaluate_agents_paired(
+    store: ResultsStore,
+    experiment_id: int,
+    names: list[str],
+    policies: list,
+    num_episodes: int = NUM_TEST_EPISODES,
+    seed: int = SEED,
+    target_ci: Optional[float] = TARGET_CI,
+    baseline: Optional[int] = None,
+):
+    """Evaluate policies on common cards, differences are taken against baseline."""
+    result = evaluate_paired(policies, num_episodes, seed, target_ci)
+    for i, name in enumerate(names):
+        metrics = {
+            "mean_return": result.means[i],
+            "ci_half_width": result.half_widths[i],
+            "num_episodes": result.num_episodes,
+        }
+        if baseline is not None and i != baseline:
+            metrics["difference_vs_baseline"] = result.differences[i, baseline]
+            metrics["difference_ci_half_width"] = result.difference_half_widths[
+                i, baseline
+            ]
+        store.record_trial(experiment_id, name, metrics, seed=seed)
+    return result
+
+
+def evaluate_agents_controlled(
+    store: ResultsStore,
+    experiment_id: int,
+    names: list[str],
+    policies: list,
+    num_episodes: int = NUM_TEST_EPISODES,
+    seed: int = SEED,
+    target_ci: Optional[float] = TARGET_CI,
+):
+    """Evaluate policies with basic strategy as a control variate."""
+    result = evaluate_controlled(policies, num_episodes, seed, target_ci=target_ci)
+    for i, name in enumerate(names):
+        metrics = {
+            "mean_return": result.means[i],
+            "ci_half_width": result.half_widths[i],
+            "raw_mean_return": result.raw_means[i],
+            "raw_ci_half_width": result.raw_half_widths[i],
+            "variance_reduction": result.variance_reductions[i],
+            "num_episodes": result.num_episodes,
+        }
+        store.record_trial(experiment_id, name, metrics, seed=seed)
+    return result
+
+
+def download_saved_agents(files: tuple[Path, ...]):
+    return [np.load(file) for file in files]
+
+
+def agent_name(file: Path) -> str:
+    return file.stem.replace("_", " ")
+
+
+def main(
+    agent_files: tuple[Path, ...] = tuple(SAVED_AGENT_PATH / f for f in SAVED_AGENTS),
+    num_episodes: int = NUM_TEST_EPISODES,
+    seed: int = SEED,
+    baselines: bool = True,
+    target_ci: Optional[float] = TARGET_CI,
+    paired: bool = PAIRED,
+    control_variate: bool = CONTROL_VARIATE,
+):
+    agent_names = [agent_name(file) for file in agent_files]
+    agent_Qs = download_saved_agents(agent_files)
+    baseline_names = ["Basic Strategy", "Random Strategy"] if baselines else []
+
+    with ResultsStore(DATABASE_PATH) as store:
+        experiment_id = save_hyperparameters(
+            store, agent_names + baseline_names, num_episodes, target_ci
+        )
+
+        def run(name: str, evaluate_func):
+            mean_return = evaluate_agent(
+                store, experiment_id, name, evaluate_func, num_episodes, seed, target_ci
+            )
+            print(f"{name} evaluated: {mean_return:.6f}")
+
+        # Deterministic policies evaluated before with the same settings are
+        # read back from the store rather than played again
+        memoized = partial(evaluate_memoized, seed=seed, store=store)
+        basic = compile_policy(basic_strategy)
+        if control_variate:
+            if agent_Qs:
+                result = evaluate_agents_controlled(
+                    store,
+                    experiment_id,
+                    agent_names,
+                    agent_Qs,
+                    num_episodes,
+                    seed,
+                    target_ci,
+                )
+                for i, name in enumerate(agent_names):
+                    print(
+                        f"{name} evaluated: {result.means[i]:.6f} "
+                        f"(variance reduced {result.variance_reductions[i]:.1f}x)"
+                    )
+            if baselines:
+                run("Basic Strategy", partial(memoized, basic))
+        elif paired:
+            names = agent_names + (["Basic Strategy"] if baselines else [])
+            policies = agent_Qs + ([basic] if baselines else [])
+            result = evaluate_agents_paired(
+                store,
+                experiment_id,
+                names,
+                policies,
+                num_episodes,
+                seed,
+                target_ci,
+                baseline=len(names) - 1 if baselines else None,
+            )
+            for i, name in enumerate(names):
+                print(f"{name} evaluated: {result.means[i]:.6f}")
+        else:
+            for Q, name in zip(agent_Qs, agent_names):
+                run(name, partial(memoized, Q))
+            if baselines:
+                run("Basic Strategy", partial(memoized, basic))
+
+        if baselines:
+            random_policy = partial(random, Q=flatten_Q(initialize_Q(0)))
+            run("Random Strategy", partial(evaluate_policy, random_policy, seed=seed))
 
-def download_saved_agents(files: tuple[str, ...]):
-    return [np.load(SAVED_AGENT_PATH / file) for file in files]
+    print(f"\nResults saved to {DATABASE_PATH} (experiment_id: {experiment_id})")
+    return experiment_id
 
 
 if __name__ == "__main__":
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-
-    agent_names = [
-        filename.replace(".npy", "").replace("_", " ") for filename in SAVED_AGENTS
-    ]
-
-    agent_Qs = download_saved_agents(SAVED_AGENTS)
-
-    experiment_id = save_hyperparameters(
-        cursor,
-        conn,
-        agent_names + ["Basic Strategy", "Random"],
-    )
-    table_name = create_evaluation(cursor, conn, experiment_id)
-
-    for Q, agent_name in zip(agent_Qs, agent_names):
-        evaluate_func = partial(evaluate_Q, Q=Q, seed=SEED)
-        evaluate_agent(cursor, conn, agent_name, evaluate_func, table_name)
-        print(f"{agent_name} evaluated")
-
-    evaluate_func = partial(evaluate_policy, policy=basic_strategy, seed=SEED)
-    evaluate_agent(cursor, conn, "Basic Strategy", evaluate_func, table_name)
-    print("Basic Stat evaluated")
-
-    random_policy = partial(random, Q=flatten_Q(initialize_Q(0)))
-    evaluate_func = partial(evaluate_policy, policy=random_policy, seed=SEED)
-    evaluate_agent(cursor, conn, "Random Strategy", evaluate_func, table_name)
-    print("Random evaluated")
-
-    conn.close()
-
-    print(f"\nResults saved to {DATABASE_PATH} (experiment_id: {experiment_id})")
+    main()
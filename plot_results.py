@@ -1,4 +1,3 @@
-import sqlite3
 from typing import Optional
 
 import plotly.graph_objects as go
@@ -8,17 +7,23 @@ from blackjack.visualizer import plot_strategy_hard, plot_strategy_pair, plot_st
 import numpy as np
 
 import compare_algos
+from blackjack.curves import aggregate_curves, scan_curves
+from blackjack.results import DATABASE_PATH, METRIC_COLUMNS, ResultsStore
 
 save_path = Path("plots")
 
 def plot_compare_algos(experiment_id: int, save_path: Optional[Path] = None) -> None:
-    conn = sqlite3.connect(compare_algos.DATABASE_PATH)
-    table_name = f"{compare_algos.DATABASE_NAME}_exp_{experiment_id}"
-    results_df = pl.read_database(f"SELECT * FROM {table_name}", conn)
-    conn.close()
+    with ResultsStore(DATABASE_PATH) as store:
+        rows = store.fetch_metrics(experiment_id, name="mean_return")
+    results_df = (
+        pl.DataFrame(rows, schema=METRIC_COLUMNS, orient="row")
+        .rename({"value": "mean_return"})
+        # Halving searches evaluate at several steps, plot each trial's last
+        .filter(pl.col("step") == pl.col("step").max().over("trial_id"))
+    )
 
     if results_df.is_empty():
-        print(f"No data found in table '{table_name}'.")
+        print(f"No results found for experiment {experiment_id}.")
         return
 
     fig = go.Figure()
@@ -60,7 +65,56 @@ def plot_compare_algos(experiment_id: int, save_path: Optional[Path] = None) ->
     )
 
     if save_path:
-        fig.write_image(save_path / f"{table_name}.png", scale=4)
+        fig.write_image(
+            save_path / f"{compare_algos.EXPERIMENT_NAME}_exp_{experiment_id}.png",
+            scale=4,
+        )
+
+
+def plot_learning_curves(
+    experiment_id: int,
+    save_path: Optional[Path] = None,
+    bucket_size: int = 50_000,
+    decay_factors: Optional[list[int]] = None,
+) -> None:
+    curves = scan_curves().filter(pl.col("experiment_id") == experiment_id)
+    if decay_factors is not None:
+        curves = curves.filter(
+            pl.col("decay_factor").is_null()
+            | pl.col("decay_factor").is_in(decay_factors)
+        )
+    curves_df = aggregate_curves(curves, bucket_size=bucket_size).collect()
+
+    if curves_df.is_empty():
+        print(f"No learning curves found for experiment {experiment_id}.")
+        return
+
+    fig = go.Figure()
+    for (algo, decay_factor), curve in curves_df.group_by(
+        ["algorithm", "decay_factor"], maintain_order=True
+    ):
+        name = algo if decay_factor is None else f"{algo} (decay={decay_factor})"
+        fig.add_trace(
+            go.Scatter(
+                x=curve["episode"].to_list(),
+                y=curve["mean"].to_list(),
+                mode="lines",
+                name=name,
+            )
+        )
+
+    fig.update_layout(
+        title="Learning Curves of Reinforcement Learning Algorithms in Blackjack",
+        xaxis_title="Training Episode",
+        yaxis_title="Mean Training Return",
+        legend_title="Algorithm",
+    )
+
+    if save_path:
+        fig.write_image(
+            save_path / f"learning_curves_exp_{experiment_id}.png",
+            scale=4,
+        )
 
 
 def plot_Q_table(Q_path: Path, save_path: Path):
@@ -5,7 +5,7 @@ ext_modules = [
     Pybind11Extension(
         "blackjack_env", 
         ["src/main.cpp", "src/hand.cpp"],
-        depends=["src/main.hpp", "src/hand.hpp"],
+        depends=["src/main.hpp", "src/hand.hpp", "src/engine.hpp", "src/rules.hpp"],
         extra_compile_args=[
             '/O2',
             '/DNDEBUG',
@@ -0,0 +1,66 @@
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from blackjack.agent_cache import AgentCache
+from blackjack.solver import (
+    STRATEGY_CACHE_PATH,
+    format_chart,
+    rule_grid,
+    solve_grid,
+    strategy_chart,
+    variant_name,
+)
+from blackjack_env import DoubleRule
+
+# Choices for each Rules field, every combination is solved. Fields left out
+# keep the default rules
+RULE_GRID = {
+    "hit_soft_17": [True, False],
+    "blackjack_payout": [1.5, 1.2],
+    "double_after_split": [True, False],
+    "double_on": [DoubleRule.ANY, DoubleRule.TEN_OR_ELEVEN],
+}
+WORKERS = 4
+SAVE_DIR = Path("strategies")
+# Solutions are kept in STRATEGY_CACHE_PATH, a rerun only solves new variants
+CACHE_STRATEGIES = True
+
+
+def main(
+    grid: Optional[dict] = None,
+    workers: int = WORKERS,
+    save_dir: Path = SAVE_DIR,
+    cache_strategies: bool = CACHE_STRATEGIES,
+) -> list[Path]:
+    """Solve every rule variant in the grid and save its chart and Q table.
+
+    Each variant gets <name>.py with its charts in the STRATEGY_HARD, SOFT and
+    PAIR layout of basic_strategy.py, and <name>.npy with its exact Q table
+    that train_agent can warm start from.
+    """
+    variants = rule_grid(**(RULE_GRID if grid is None else grid))
+    cache = AgentCache(STRATEGY_CACHE_PATH) if cache_strategies else None
+    solutions = solve_grid(variants, workers, cache)
+
+    save_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for rules, solution in zip(variants, solutions):
+        name = variant_name(rules)
+        header = (
+            f"# {rules!r}\n"
+            f"# House edge {-solution.chart_return:.4%} playing these charts, "
+            f"{-solution.optimal_return:.4%} playing perfectly\n"
+            "from blackjack.basic_strategy import D, H, P, S\n\n"
+        )
+        path = save_dir / f"{name}.py"
+        path.write_text(header + format_chart(strategy_chart(solution.actions)))
+        np.save(save_dir / f"{name}.npy", solution.Q)
+        paths.append(path)
+        print(f"{name:<44} house edge {-solution.chart_return:>8.4%}")
+    return paths
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#pragma once
+#include "hand.hpp"
+#include "rules.hpp"
+#include <cstdint>
+#include <memory>
+#include <random>
+#include <sstream>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+constexpr int MAX_VALUE = 21;
+constexpr int MIN_VALUE = 4;
+constexpr int NUM_HAND_VALUES = (MAX_VALUE - MIN_VALUE) + 1;
+constexpr int NUM_UPCARDS = 10;
+constexpr int NUM_STATES = NUM_HAND_VALUES * NUM_UPCARDS * 2 * 2 * 2;
+// Cards drawn per episode for paired evaluation, enough for almost every game
+constexpr size_t SHOE_SIZE = 16;
+
+constexpr int HIT = 0;
+constexpr int STAND = 1;
+constexpr int DOUBLE_DOWN = 2;
+constexpr int SPLIT = 3;
+
+using State = int;
+
+// Flat index of a player state, the layout every state table follows
+constexpr State encode_state(int value, int upcard, bool useable_ace,
+                             bool can_double, bool can_split) {
+  State idx = 0;
+  idx = (value - MIN_VALUE);              // Player Sum: 4-21 (18 values)
+  idx = idx * NUM_UPCARDS + (upcard - 2); // Dealer Card: 2-11 (10 values)
+  idx = idx * 2 + (int)useable_ace;       // Usable Ace: 0-1 (2 values)
+  idx = idx * 2 + (int)can_double;        // Can Double: 0-1 (2 values)
+  idx = idx * 2 + (int)can_split;         // Can Split: 0-1 (2 values)
+  return idx;
+}
+
+struct Result {
+  float reward;
+  State next_state;
+  State split_state; // -1 if no extra hand is made
+  bool terminated;
+};
+
+// Game logic behind BlackjackEnv, one implementation per RuleSet
+class Engine {
+public:
+  virtual ~Engine() = default;
+  virtual void new_game() = 0;
+  virtual bool in_play() const = 0; // False once every hand is settled
+  virtual State get_state() = 0;
+  virtual Result play_hand(int action) = 0;
+  // Whole episodes from per-state action tables, the loops run inside the
+  // specialized engine so only the call itself is dispatched
+  virtual void evaluate(const int8_t *actions, int num_episodes,
+                        float *returns) = 0;
+  virtual void evaluate_paired(const int8_t *actions, size_t num_policies,
+                               int num_episodes, float *returns) = 0;
+  // Generator state as text, with it a run can be continued exactly
+  virtual std::string get_rng_state() const = 0;
+  virtual void set_rng_state(const std::string &state) = 0;
+};
+
+std::unique_ptr<Engine> make_engine(const Rules &rules, int seed);
+
+template <class R> class TableEngine final : public Engine {
+public:
+  TableEngine(const Rules &rules, int seed)
+      : payout(float(rules.blackjack_payout)), max_hands(rules.max_hands),
+        rng(seed), dist(1, int(CARD_VALUES.size())) {}
+
+  void new_game() override;
+  bool in_play() const override { return hands.hand_size > 0; }
+  State get_state() override { return get_hand_state(hands.get_hand()); }
+  Result play_hand(int action) override;
+  void evaluate(const int8_t *actions, int num_episodes,
+                float *returns) override;
+  void evaluate_paired(const int8_t *actions, size_t num_policies,
+                       int num_episodes, float *returns) override;
+  std::string get_rng_state() const override {
+    std::ostringstream out;
+    out << rng;
+    return out.str();
+  }
+  void set_rng_state(const std::string &state) override {
+    std::istringstream in(state);
+    std::mt19937 restored;
+    in >> restored;
+    if (in.fail())
+      throw std::invalid_argument("Not a generator state");
+    rng = restored;
+  }
+
+private:
+  void deal_hand(Hand &hand) { hand.add_card(draw_card()); }
+  int draw_card() {
+    // The shoe is only filled during paired evaluation
+    if (shoe_pos < shoe.size())
+      return shoe[shoe_pos++];
+    if (!shoe.empty()) {
+      extend_shoe();
+      return shoe[shoe_pos++];
+    }
+    return dist(rng);
+  }
+  void extend_shoe();
+  bool can_double(const Hand &hand, const HandInfo &info) const;
+  bool can_split(const HandInfo &info) const {
+    return info.can_split && int(hands.hand_size) < max_hands;
+  }
+  Result play_split_hand(Hand &hand);
+  Result settle_split_aces();
+  void play_dealer_hand();
+  State get_hand_state(const Hand &hand);
+  float calculate_reward(const Hand &hand);
+  float play_episode(const int8_t *actions);
+
+  float payout;
+  int max_hands;
+
+  HandStack hands; // Stack to store hands
+  Hand dealer_hand;
+
+  std::mt19937 rng;
+  std::uniform_int_distribution<int> dist;
+
+  // Cards pre-drawn for an episode so several policies can replay them
+  std::vector<int> shoe;
+  size_t shoe_pos = 0;
+  std::mt19937::result_type extension_seed = 0;
+  std::mt19937 shoe_extension;
+};
+
+template <class R> void TableEngine<R>::new_game() {
+  hands.reset();
+  dealer_hand.reset();
+
+  for (size_t i = 0; i < 2; i++) {
+    deal_hand(hands.get_hand());
+    deal_hand(dealer_hand);
+  }
+
+  play_dealer_hand();
+}
+
+template <class R>
+bool TableEngine<R>::can_double(const Hand &hand, const HandInfo &info) const {
+  if (!info.can_double)
+    return false;
+  if constexpr (R::resplit_aces) {
+    // Split aces waiting to be split again are the only ones the player sees
+    if (hand.split_aces)
+      return false;
+  }
+  if constexpr (!R::double_after_split) {
+    if (hand.split)
+      return false;
+  }
+  if constexpr (R::double_on == DoubleRule::NINE_TO_ELEVEN)
+    return !info.useable_ace && info.value >= 9 && info.value <= 11;
+  if constexpr (R::double_on == DoubleRule::TEN_OR_ELEVEN)
+    return !info.useable_ace && info.value >= 10 && info.value <= 11;
+  return true;
+}
+
+template <class R> State TableEngine<R>::get_hand_state(const Hand &hand) {
+  HandInfo info = hand.get_info();
+  int upcard = Hand::get_card_value(dealer_hand.cards[0]);
+
+  return encode_state(info.value, upcard, info.useable_ace,
+                      can_double(hand, info), can_split(info));
+}
+
+template <class R> float TableEngine<R>::calculate_reward(const Hand &hand) {
+  const HandInfo &hand_info = hand.get_info();
+  const HandInfo &dealer_info = dealer_hand.get_info();
+  float bet = static_cast<float>(hand_info.bet);
+
+  if (!hand.split && hand_info.blackjack()) {
+    if (dealer_info.blackjack())
+      return 0.0f;
+    return payout;
+  }
+
+  if (hand_info.bust())
+    return -bet;
+  if (dealer_info.bust())
+    return bet;
+  if (hand_info.value > dealer_info.value)
+    return bet;
+  if (hand_info.value < dealer_info.value)
+    return -bet;
+  return 0.0f;
+}
+
+template <class R> void TableEngine<R>::play_dealer_hand() {
+  HandInfo info = dealer_hand.get_info();
+  while ((!info.bust() && info.value < 17) ||
+         (R::hit_soft_17 && info.soft_17())) {
+    deal_hand(dealer_hand);
+    info = dealer_hand.get_info();
+  }
+}
+
+template <class R> Result TableEngine<R>::play_split_hand(Hand &hand) {
+  bool ace_pair = hand.get_info().ace_pair();
+  hands.split_hand();
+  Hand &hand2 = hands.get_hand();
+
+  deal_hand(hand);
+  deal_hand(hand2);
+
+  // If ace pair you can only hit one card to each hand
+  if (ace_pair) {
+    hand.split_aces = hand2.split_aces = true;
+    return settle_split_aces();
+  }
+
+  return {
+      0,
+      get_hand_state(hand2),
+      get_hand_state(hand),
+      false,
+  };
+}
+
+template <class R> Result TableEngine<R>::settle_split_aces() {
+  // The two hands just split are on top of the stack, each stands on its one
+  // card unless it drew another ace that may be split again
+  Hand &lower = hands.hands[hands.hand_size - 2];
+  Hand &upper = hands.hands[hands.hand_size - 1];
+  bool lower_waits = false;
+  bool upper_waits = false;
+  if constexpr (R::resplit_aces) {
+    lower_waits = can_split(lower.get_info());
+    upper_waits = can_split(upper.get_info());
+  }
+
+  float reward = 0.0f;
+  if (!upper_waits) {
+    reward += calculate_reward(upper);
+    hands.pop_hand();
+  }
+  if (!lower_waits) {
+    reward += calculate_reward(lower);
+    if (upper_waits)
+      lower = upper; // Keep the waiting hand on top
+    hands.pop_hand();
+  }
+
+  if (lower_waits && upper_waits) {
+    return {reward, get_hand_state(upper), get_hand_state(lower), false};
+  }
+  if (lower_waits || upper_waits) {
+    return {reward, get_hand_state(hands.get_hand()), -1, false};
+  }
+  return {reward, -1, -1, hands.hand_size == 0};
+}
+
+template <class R> Result TableEngine<R>::play_hand(int action) {
+  Hand &hand = hands.get_hand();
+
+  if (action == SPLIT) {
+    return play_split_hand(hand);
+  }
+
+  if constexpr (R::resplit_aces) {
+    // A split ace that isn't split again keeps its one card
+    if (hand.split_aces)
+      action = STAND;
+  }
+
+  if (action == DOUBLE_DOWN) {
+    deal_hand(hand);
+    hand.bet *= 2;
+  }
+
+  if (action == HIT) {
+    deal_hand(hand);
+    HandInfo hand_info = hand.get_info();
+    if (!hand_info.bust()) {
+      return {
+          0,
+          get_hand_state(hand),
+          -1,
+          false,
+      };
+    }
+  }
+
+  // Player stands or has gone bust
+  float reward = calculate_reward(hand);
+  // Remove hand since hand is finished
+  hands.pop_hand();
+  return {
+      reward,
+      -1,
+      -1,
+      (hands.hand_size == 0),
+  };
+}
+
+template <class R>
+float TableEngine<R>::play_episode(const int8_t *actions) {
+  new_game();
+  float episode_return = 0.0f;
+  bool terminated = false;
+
+  while (!terminated) {
+    int action = actions[get_state()];
+    if (action < 0)
+      throw std::invalid_argument("Action table has no action for state");
+    Result result = play_hand(action);
+    episode_return += result.reward;
+    terminated = result.terminated;
+  }
+  return episode_return;
+}
+
+template <class R>
+void TableEngine<R>::evaluate(const int8_t *actions, int num_episodes,
+                              float *returns) {
+  for (int episode = 0; episode < num_episodes; episode++) {
+    returns[episode] = play_episode(actions);
+  }
+}
+
+template <class R> void TableEngine<R>::extend_shoe() {
+  // Rare long games continue from a generator seeded once per episode, so
+  // the extra cards are the same for every policy
+  if (shoe.size() == SHOE_SIZE)
+    shoe_extension.seed(extension_seed);
+  for (size_t i = 0; i < SHOE_SIZE; i++)
+    shoe.push_back(dist(shoe_extension));
+}
+
+template <class R>
+void TableEngine<R>::evaluate_paired(const int8_t *actions,
+                                     size_t num_policies, int num_episodes,
+                                     float *returns) {
+  // Every episode uses a fixed number of draws from the env's generator, so
+  // its cards only depend on the seed and episode index, not on the policies
+  try {
+    for (int episode = 0; episode < num_episodes; episode++) {
+      shoe.resize(SHOE_SIZE);
+      for (size_t i = 0; i < SHOE_SIZE; i++)
+        shoe[i] = dist(rng);
+      extension_seed = rng();
+
+      for (size_t policy = 0; policy < num_policies; policy++) {
+        shoe_pos = 0;
+        returns[policy * num_episodes + episode] =
+            play_episode(actions + policy * NUM_STATES);
+      }
+    }
+  } catch (...) {
+    shoe.clear();
+    throw;
+  }
+  shoe.clear();
+  shoe_pos = 0;
+}
@@ -43,6 +43,8 @@ void Hand::reset() {
   }
   card_size = 0;
   bet = 1;
+  split = false;
+  split_aces = false;
 }
 
 void HandStack::new_hand(int card) {
@@ -63,6 +65,8 @@ void HandStack::split_hand() {
 
   // Every hand split gets a bet of 1
   new_hand(active_hand.pop_card());
+  active_hand.split = true;
+  hands[hand_size - 1].split = true;
 }
 
 void HandStack::pop_hand() {
@@ -72,8 +76,7 @@ void HandStack::pop_hand() {
 }
 
 void HandStack::reset() {
-  for (size_t i = 0; i < MAX_HANDS; i++) {
-    hands[i].reset();
-  }
+  // Later slots are reset by new_hand when a split first uses them
+  hands[0].reset();
   hand_size = 1;
 }
\ No newline at end of file
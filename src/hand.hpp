@@ -1,6 +1,7 @@
 #pragma once
 
 #include <array>
+#include <cstddef>
 
 // Nearly impossible to have 15 or more cards
 constexpr int MAX_CARDS = 22;
@@ -18,23 +19,26 @@ constexpr int HARD = 0;
 constexpr int SOFT = 1;
 constexpr int PAIR = 2;
 
+// What the cards allow, the table rules are applied on top by the engine
 struct HandInfo {
   int bet;
   int value;
   bool useable_ace;
-  bool can_double;
-  bool can_split;
+  bool can_double; // Two cards
+  bool can_split;  // Two cards of the same rank
 
   bool bust() const { return value > BLACKJACK_VALUE; };
   bool blackjack() const { return value == BLACKJACK_VALUE && can_double; };
   bool soft_17() const { return useable_ace && value == 17; };
-  bool ace_pair() const { return can_split && value == 12; };
+  bool ace_pair() const { return can_split && useable_ace && value == 12; };
 };
 
 struct Hand {
   std::array<int, MAX_CARDS> cards{};
   int bet = 1;
   size_t card_size = 0;
+  bool split = false;      // Made by a split, so 21 in two cards isn't a natural
+  bool split_aces = false; // One of a pair of split aces
 
   Hand() = default;
   Hand(int card) { add_card(card); };
@@ -48,7 +52,7 @@ struct Hand {
 
 struct HandStack {
   std::array<Hand, MAX_HANDS> hands; // Stack to store hands
-  size_t hand_size;
+  size_t hand_size = 0;
 
   Hand &get_hand() { return hands[hand_size - 1]; };
   void new_hand(int card);
@@ -1,132 +1,152 @@
 #include "main.hpp"
 #include "hand.hpp"
 #include "pybind11/pybind11.h"
+#include <stdexcept>
+#include <string>
 
 // TODO Replace all constants 
 
 namespace py = pybind11;
 
-void BlackjackEnv::new_game() {
-  hands.reset();
-  dealer_hand.reset();
-
-  for (size_t i = 0; i < 2; i++) {
-    deal_hand(hands.get_hand());
-    deal_hand(dealer_hand);
+template <bool H17, bool DAS, bool RSA>
+std::unique_ptr<Engine> make_engine(const Rules &rules, int seed) {
+  switch (rules.double_on) {
+  case DoubleRule::NINE_TO_ELEVEN:
+    return std::make_unique<
+        TableEngine<RuleSet<H17, DAS, RSA, DoubleRule::NINE_TO_ELEVEN>>>(rules,
+                                                                        seed);
+  case DoubleRule::TEN_OR_ELEVEN:
+    return std::make_unique<
+        TableEngine<RuleSet<H17, DAS, RSA, DoubleRule::TEN_OR_ELEVEN>>>(rules,
+                                                                       seed);
+  default:
+    return std::make_unique<
+        TableEngine<RuleSet<H17, DAS, RSA, DoubleRule::ANY>>>(rules, seed);
   }
-
-  play_dealer_hand();
 }
 
-State BlackjackEnv::get_hand_state(const Hand &hand) {
-  auto [_, hand_value, useable_ace, can_double, can_split] = hand.get_info();
-  int upcard = Hand::get_card_value(dealer_hand.cards[0]);
-
-  State idx = 0;
-  idx = (hand_value - 4); // Player Sum: 4-21 (18 values), Offset by min value
-  idx = idx * 10 + (upcard - 2);    // Dealer Card: 2-11 (10 values)
-  idx = idx * 2 + (int)useable_ace; // Usable Ace: 0-1 (2 values)
-  idx = idx * 2 + (int)can_double;  // Can Double: 0-1 (2 values)
-  idx = idx * 2 + (int)can_split;   // Can Split: 0-1 (2 values)
-  return idx;
+template <bool H17, bool DAS>
+std::unique_ptr<Engine> make_engine(const Rules &rules, int seed) {
+  if (rules.resplit_aces)
+    return make_engine<H17, DAS, true>(rules, seed);
+  return make_engine<H17, DAS, false>(rules, seed);
 }
 
-float BlackjackEnv::calculate_reward(const HandInfo &hand_info) {
-  const HandInfo &dealer_info = dealer_hand.get_info();
-  float bet = static_cast<float>(hand_info.bet);
-
-  if (hands.hand_size == 1 && hand_info.blackjack()) {
-    if (dealer_info.blackjack())
-      return 0.0f;
-    return 1.5f;
-  }
+template <bool H17>
+std::unique_ptr<Engine> make_engine(const Rules &rules, int seed) {
+  if (rules.double_after_split)
+    return make_engine<H17, true>(rules, seed);
+  return make_engine<H17, false>(rules, seed);
+}
 
-  if (hand_info.bust())
-    return -bet;
-  if (dealer_info.bust())
-    return bet;
-  if (hand_info.value > dealer_info.value)
-    return bet;
-  if (hand_info.value < dealer_info.value)
-    return -bet;
-  return 0.0f;
+std::unique_ptr<Engine> make_engine(const Rules &rules, int seed) {
+  if (rules.max_hands < 1 || rules.max_hands > MAX_HANDS)
+    throw std::invalid_argument("max_hands must be between 1 and " +
+                                std::to_string(MAX_HANDS));
+  if (rules.blackjack_payout < 0)
+    throw std::invalid_argument("blackjack_payout can't be negative");
+  if (rules.hit_soft_17)
+    return make_engine<true>(rules, seed);
+  return make_engine<false>(rules, seed);
 }
 
-void BlackjackEnv::play_dealer_hand() {
-  HandInfo info = dealer_hand.get_info();
-  while ((!info.bust() && info.value < 17) || info.soft_17()) {
-    deal_hand(dealer_hand);
-    info = dealer_hand.get_info();
+py::array_t<float> BlackjackEnv::evaluate(
+    py::array_t<int8_t, py::array::c_style | py::array::forcecast> actions,
+    int num_episodes) {
+  if (actions.ndim() != 1 || actions.shape(0) != NUM_STATES)
+    throw std::invalid_argument("Action table must have one entry per state");
+
+  py::array_t<float> returns(num_episodes);
+  const int8_t *table = actions.data();
+  float *out = returns.mutable_data();
+  {
+    // Python objects are only touched outside this block, so other threads
+    // can run while the episodes play
+    py::gil_scoped_release release;
+    engine->evaluate(table, num_episodes, out);
   }
+  return returns;
 }
 
-Result BlackjackEnv::play_split_hand(Hand& hand) {
-  bool ace_pair = hand.get_info().ace_pair();
-  hands.split_hand();
-  Hand &hand2 = hands.get_hand();
-
-  deal_hand(hand);
-  deal_hand(hand2);
-
-  // If ace pair you can only hit one card to each hand
-  if (ace_pair) {
-    float reward = calculate_reward(hand.get_info()) +
-                    calculate_reward(hand2.get_info());
-    return {
-        reward,
-        -1,
-        -1,
-        true,
-    };
+py::array_t<float> BlackjackEnv::evaluate_paired(
+    py::array_t<int8_t, py::array::c_style | py::array::forcecast> actions,
+    int num_episodes) {
+  if (actions.ndim() != 2 || actions.shape(1) != NUM_STATES)
+    throw std::invalid_argument("Action tables must have one entry per state");
+
+  py::ssize_t num_policies = actions.shape(0);
+  py::array_t<float> returns({num_policies, py::ssize_t(num_episodes)});
+  const int8_t *tables = actions.data();
+  float *out = returns.mutable_data();
+  {
+    py::gil_scoped_release release;
+    engine->evaluate_paired(tables, num_policies, num_episodes, out);
   }
-
-  return {
-      0,
-      get_hand_state(hand2),
-      get_hand_state(hand),
-      false,
-  };
+  return returns;
 }
 
-Result BlackjackEnv::play_hand(int action) {
-  Hand &hand = hands.get_hand();
-
-  if (action == SPLIT) {
-    return play_split_hand(hand);
+BlackjackVecEnv::BlackjackVecEnv(int num_envs, int seed, const Rules &rules) {
+  if (num_envs < 1)
+    throw std::invalid_argument("Need at least one environment");
+  envs.reserve(num_envs);
+  for (int i = 0; i < num_envs; i++) {
+    envs.emplace_back(seed, rules);
+    envs.back().new_game();
   }
+}
 
-  if (action == DOUBLE_DOWN) {
-    deal_hand(hand);
-    hand.bet *= 2;
-  }
+py::array_t<int> BlackjackVecEnv::get_states() {
+  py::array_t<int> states(envs.size());
+  int *out = states.mutable_data();
+  for (size_t i = 0; i < envs.size(); i++)
+    out[i] = envs[i].get_state();
+  return states;
+}
 
-  if (action == HIT) {
-    deal_hand(hand);
-    HandInfo hand_info = hand.get_info();
-    if (!hand_info.bust()) {
-      return {
-          0,
-          get_hand_state(hand),
-          -1,
-          false,
-      };
+py::tuple BlackjackVecEnv::step(
+    py::array_t<int, py::array::c_style | py::array::forcecast> actions) {
+  if (actions.ndim() != 1 || actions.shape(0) != py::ssize_t(envs.size()))
+    throw std::invalid_argument("Need one action per environment");
+
+  py::ssize_t size = envs.size();
+  py::array_t<float> rewards(size);
+  py::array_t<int> next_states(size);
+  py::array_t<int> split_states(size);
+  py::array_t<bool> terminated(size);
+  const int *action = actions.data();
+  float *reward = rewards.mutable_data();
+  int *next_state = next_states.mutable_data();
+  int *split_state = split_states.mutable_data();
+  bool *done = terminated.mutable_data();
+
+  {
+    py::gil_scoped_release release;
+    for (py::ssize_t i = 0; i < size; i++) {
+      // A negative action leaves the env waiting where it is
+      if (action[i] < 0) {
+        reward[i] = 0.0f;
+        next_state[i] = split_state[i] = -1;
+        done[i] = false;
+        continue;
+      }
+      Result result = envs[i].play_hand(action[i]);
+      reward[i] = result.reward;
+      next_state[i] = result.next_state;
+      split_state[i] = result.split_state;
+      done[i] = result.terminated;
+      if (result.terminated)
+        envs[i].new_game();
     }
   }
-
-  // Player stands or has gone bust
-  float reward = calculate_reward(hand.get_info());
-  // Remove hand since hand is finished
-  hands.pop_hand();
-  return {
-      reward,
-      -1,
-      -1,
-      (hands.hand_size == 0),
-  };
+  return py::make_tuple(rewards, next_states, split_states, terminated);
 }
 
 PYBIND11_MODULE(blackjack_env, m) {
   m.doc() = "Blackjack engine optimized with C++";
+  m.attr("NUM_STATES") = NUM_STATES;
+  m.def("encode_state", py::vectorize(encode_state), py::arg("hand_value"),
+        py::arg("upcard"), py::arg("useable_ace"), py::arg("can_double"),
+        py::arg("can_split"));
   // 1. Bind the Result struct so Python can access .reward, .state, etc.
   py::class_<Result>(m, "Result")
       .def_readonly("reward", &Result::reward)
@@ -134,11 +154,58 @@ PYBIND11_MODULE(blackjack_env, m) {
       .def_readonly("split_state", &Result::split_state)
       .def_readonly("terminated", &Result::terminated);
 
+  py::enum_<DoubleRule>(m, "DoubleRule")
+      .value("ANY", DoubleRule::ANY)
+      .value("NINE_TO_ELEVEN", DoubleRule::NINE_TO_ELEVEN)
+      .value("TEN_OR_ELEVEN", DoubleRule::TEN_OR_ELEVEN);
+
+  py::class_<Rules>(m, "Rules")
+      .def(py::init([](bool hit_soft_17, double blackjack_payout,
+                       bool double_after_split, int max_hands,
+                       bool resplit_aces, DoubleRule double_on) {
+             return Rules{hit_soft_17,  blackjack_payout, double_after_split,
+                          max_hands,    resplit_aces,     double_on};
+           }),
+           py::kw_only(), py::arg("hit_soft_17") = true,
+           py::arg("blackjack_payout") = 1.5,
+           py::arg("double_after_split") = true,
+           py::arg("max_hands") = MAX_HANDS, py::arg("resplit_aces") = false,
+           py::arg("double_on") = DoubleRule::ANY)
+      .def_readwrite("hit_soft_17", &Rules::hit_soft_17)
+      .def_readwrite("blackjack_payout", &Rules::blackjack_payout)
+      .def_readwrite("double_after_split", &Rules::double_after_split)
+      .def_readwrite("max_hands", &Rules::max_hands)
+      .def_readwrite("resplit_aces", &Rules::resplit_aces)
+      .def_readwrite("double_on", &Rules::double_on)
+      .def("__repr__", [](const Rules &rules) {
+        return py::str("Rules(hit_soft_17={}, blackjack_payout={}, "
+                       "double_after_split={}, max_hands={}, "
+                       "resplit_aces={}, double_on={})")
+            .format(rules.hit_soft_17, rules.blackjack_payout,
+                    rules.double_after_split, rules.max_hands,
+                    rules.resplit_aces, py::cast(rules.double_on));
+      });
+
   // 2. Bind the main Environment
   py::class_<BlackjackEnv>(m, "BlackjackEnv")
-      .def(py::init<int>(), py::arg("seed"))
+      .def(py::init<int, const Rules &>(), py::arg("seed"),
+           py::arg("rules") = Rules())
+      .def_property_readonly("rules", &BlackjackEnv::get_rules)
+      .def_property("rng_state", &BlackjackEnv::get_rng_state,
+                    &BlackjackEnv::set_rng_state)
       .def("new_game", &BlackjackEnv::new_game)
       // Ensure get_state is defined in your header!
       .def("get_state", &BlackjackEnv::get_state)
-      .def("play_hand", &BlackjackEnv::play_hand, py::arg("action"));
+      .def("play_hand", &BlackjackEnv::play_hand, py::arg("action"))
+      .def("evaluate", &BlackjackEnv::evaluate, py::arg("actions"),
+           py::arg("num_episodes"))
+      .def("evaluate_paired", &BlackjackEnv::evaluate_paired,
+           py::arg("actions"), py::arg("num_episodes"));
+
+  py::class_<BlackjackVecEnv>(m, "BlackjackVecEnv")
+      .def(py::init<int, int, const Rules &>(), py::arg("num_envs"),
+           py::arg("seed"), py::arg("rules") = Rules())
+      .def_property_readonly("num_envs", &BlackjackVecEnv::num_envs)
+      .def("get_states", &BlackjackVecEnv::get_states)
+      .def("step", &BlackjackVecEnv::step, py::arg("actions"));
 }
\ No newline at end of file
@@ -1,45 +1,72 @@
 #pragma once
+#include "engine.hpp"
 #include "hand.hpp"
-#include "random"
+#include "rules.hpp"
+#include <cstdint>
+#include <memory>
+#include <stdexcept>
+#include <string>
+#include <vector>
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 
-constexpr int MAX_VALUE = 21;
-constexpr int MIN_VALUE = 4;
-constexpr int NUM_HAND_VALUES = (MAX_VALUE - MIN_VALUE) + 1;
-constexpr int NUM_UPCARDS = 10;
-
-constexpr int HIT = 0;
-constexpr int STAND = 1;
-constexpr int DOUBLE_DOWN = 2;
-constexpr int SPLIT = 3;
-
-using State = int;
-
-struct Result {
-  float reward;
-  State next_state;
-  State split_state; // -1 if no extra hand is made
-  bool terminated;
-};
-
 class BlackjackEnv {
 public:
-  BlackjackEnv(int seed) : rng(seed), dist(1, int(CARD_VALUES.size())) {};
-  void new_game();
-  State get_state() { return get_hand_state(hands.get_hand()); }
+  BlackjackEnv(int seed, const Rules &rules = Rules())
+      : rules(rules), engine(make_engine(rules, seed)) {};
+  void new_game() { engine->new_game(); }
+  State get_state() {
+    check_in_play();
+    return engine->get_state();
+  }
   // Action given by policy in python script
-  Result play_hand(int action);
+  Result play_hand(int action) {
+    check_in_play();
+    return engine->play_hand(action);
+  }
+  const Rules &get_rules() const { return rules; }
+  std::string get_rng_state() const { return engine->get_rng_state(); }
+  void set_rng_state(const std::string &state) { engine->set_rng_state(state); }
+  // Plays whole episodes natively from a per-state action table
+  pybind11::array_t<float>
+  evaluate(pybind11::array_t<int8_t, pybind11::array::c_style |
+                                         pybind11::array::forcecast>
+               actions,
+           int num_episodes);
+  // Every policy (row of actions) plays the same cards in each episode
+  pybind11::array_t<float>
+  evaluate_paired(pybind11::array_t<int8_t, pybind11::array::c_style |
+                                                pybind11::array::forcecast>
+                      actions,
+                  int num_episodes);
 
 private:
-  void deal_hand(Hand &hand) { hand.add_card(dist(rng)); }
-  Result play_split_hand(Hand &hand);
-  void play_dealer_hand();
-  State get_hand_state(const Hand& hand);
-  float calculate_reward(const HandInfo &hand_info);
+  void check_in_play() const {
+    // Stepping a finished game would read past the bottom of the hand stack
+    if (!engine->in_play())
+      throw std::runtime_error("No hand in play, call new_game first");
+  }
 
-  HandStack hands; // Stack to store hands
-  Hand dealer_hand;
+  Rules rules;
+  std::unique_ptr<Engine> engine;
+};
+
+// Independent environments stepped together, for training agents in lockstep
+class BlackjackVecEnv {
+public:
+  // Every env is seeded with seed, as a lone BlackjackEnv(seed) would be
+  BlackjackVecEnv(int num_envs, int seed, const Rules &rules = Rules());
+  int num_envs() const { return int(envs.size()); }
+  // State of the hand each env is waiting on
+  pybind11::array_t<int> get_states();
+  // One action per env, envs whose game ends start the next one straight away
+  // and envs given a negative action are skipped.
+  // Returns (rewards, next_states, split_states, terminated)
+  pybind11::tuple
+  step(pybind11::array_t<int, pybind11::array::c_style |
+                                  pybind11::array::forcecast>
+           actions);
 
-  std::mt19937 rng;
-  std::uniform_int_distribution<int> dist;
-};
\ No newline at end of file
+private:
+  std::vector<BlackjackEnv> envs;
+};
@@ -0,0 +1,27 @@
+#pragma once
+#include "hand.hpp"
+
+enum class DoubleRule {
+  ANY,           // Any two cards
+  NINE_TO_ELEVEN, // Hard 9, 10 or 11
+  TEN_OR_ELEVEN,  // Hard 10 or 11
+};
+
+// Table rules chosen at runtime, the defaults are the original fixed rules
+struct Rules {
+  bool hit_soft_17 = true;
+  double blackjack_payout = 1.5;
+  bool double_after_split = true;
+  int max_hands = MAX_HANDS; // Most hands splitting can leave the player with
+  bool resplit_aces = false;
+  DoubleRule double_on = DoubleRule::ANY;
+};
+
+// The rules that change control flow, fixed at compile time so each
+// combination gets its own engine without branching on them every step
+template <bool H17, bool DAS, bool RSA, DoubleRule DOUBLE> struct RuleSet {
+  static constexpr bool hit_soft_17 = H17;
+  static constexpr bool double_after_split = DAS;
+  static constexpr bool resplit_aces = RSA;
+  static constexpr DoubleRule double_on = DOUBLE;
+};
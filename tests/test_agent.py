@@ -1,7 +1,21 @@
 import numpy as np
 import pytest
 
-from blackjack.agent import Agent, evaluate_policy
+from blackjack.agent import (
+    Z_95,
+    Agent,
+    EvaluationResult,
+    TrainingCallback,
+    evaluate_policy,
+    play_returns,
+    summarize_returns,
+)
+from blackjack.basic_strategy import (
+    BASIC_STRATEGY_ACTIONS,
+    basic_strategy,
+    basic_strategy_Q,
+)
+from blackjack.policy import compile_greedy, compile_policy
 
 
 class TestAgent:
@@ -15,6 +29,7 @@ class TestAgent:
         assert agent.seed == 42
         assert agent.train_returns is None
         assert agent.test_returns is None
+        assert agent.test_result is None
 
     def test_agent_init_sarsa_requires_decay(self):
         """Test that epsilon algorithms require decay_factor."""
@@ -32,15 +47,46 @@ class TestAgent:
         # Q and N should have been updated (at least some entries > 0)
         assert np.any(agent.N > 0)
 
+    def test_agent_train_callbacks(self):
+        """Test that callbacks run on schedule and see every episode once."""
+
+        class Recorder(TrainingCallback):
+            interval = 4
+
+            def __init__(self):
+                self.calls = []
+
+            def __call__(self, agent, episode, returns):
+                self.calls.append((episode, len(returns)))
+
+        recorder = Recorder()
+        agent = Agent("Q Learning", Q_init=0.0, decay_factor=None, seed=42)
+        agent.train(num_episodes=10, callbacks=[recorder])
+        agent.train(num_episodes=3, callbacks=[recorder])
+
+        assert recorder.calls == [(4, 4), (8, 4), (10, 2), (12, 2), (13, 1)]
+        assert agent.episodes_trained == 13
+
+    def test_training_callback_needs_call(self):
+        """Test that a callback without __call__ fails when it is created."""
+
+        class Incomplete(TrainingCallback):
+            interval = 4
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
     def test_agent_evaluate(self):
-        """Test that evaluate runs and returns test rewards."""
+        """Test that evaluate summarizes the test rewards and keeps them."""
         agent = Agent("Q Learning", Q_init=0.0, decay_factor=None, seed=42)
         agent.train(num_episodes=10)
-        test_returns = agent.evaluate(num_episodes=5)
+        result = agent.evaluate(num_episodes=5)
 
-        assert test_returns is not None
-        assert len(test_returns) == 5
-        assert agent.test_returns is not None
+        assert isinstance(result, EvaluationResult)
+        assert result.num_episodes == 5
+        assert agent.test_result is result
+        assert len(agent.test_returns) == 5
+        assert result.mean == pytest.approx(agent.test_returns.mean())
 
     def test_agent_with_sarsa(self):
         """Test Agent with SARSA algorithm and decay factor."""
@@ -67,36 +113,175 @@ class TestAgent:
         assert returns is not None
         assert len(returns) == 5
 
+    def test_agent_with_double_q_learning(self):
+        """Test that Double Q Learning trains two tables and Q is their mean."""
+        agent = Agent("Double Q Learning", Q_init=0.0, decay_factor=None, seed=42)
+        agent.train(num_episodes=2000)
+
+        assert agent.Q_pair.shape == (*agent.Q.shape[:-1], 2, 4)
+        assert agent.N.shape == agent.Q_pair.shape
+        np.testing.assert_array_equal(agent.Q, agent.Q_pair.mean(axis=-2))
+        assert np.all(agent.Q[agent.Q_pair[..., 0, :] == -np.inf] == -np.inf)
+        assert agent.evaluate(num_episodes=1000).num_episodes == 1000
+        assert agent.test_returns.shape == (1000,)
+
+    def test_agent_with_dyna_q(self):
+        """Test that Dyna Q keeps its model between train calls."""
+        agent = Agent("Dyna Q", Q_init=0.0, decay_factor=None, seed=42)
+        agent.train(num_episodes=150)
+        size = agent.model.size
+        agent.train(num_episodes=150)
+
+        assert agent.model.episodes == 300
+        assert agent.model.size > size
+
+    def test_agent_Q_pair_only_for_double_algorithms(self):
+        """Test that other algorithms keep a single table."""
+        agent = Agent("Q Learning", Q_init=0.0, decay_factor=None, seed=42)
+        assert agent.Q_pair is None
+        assert agent.N.shape == agent.Q.shape
+
+
+class TestWarmStart:
+    """Test starting training from given tables."""
+
+    def test_copies_tables_and_scales_prior(self):
+        """Test that Q is copied and N scaled, illegal actions stay excluded."""
+        trained = Agent("SARSA", Q_init=0.0, decay_factor=10, seed=1)
+        trained.train(num_episodes=1000)
+        agent = Agent("SARSA", Q_init=0.0, decay_factor=10, seed=2)
+        agent.warm_start(trained.Q, trained.N, prior_weight=0.5)
+
+        np.testing.assert_array_equal(agent.Q, trained.Q)
+        np.testing.assert_array_equal(agent.N, np.rint(trained.N * 0.5))
+        assert agent.warm_start_digest is not None
+
+    def test_one_count_for_every_legal_pair(self):
+        """Test that a single prior count is given to legal actions only."""
+        agent = Agent("Q Learning", Q_init=0.0, decay_factor=None, seed=1)
+        agent.warm_start(basic_strategy_Q(0.0), 7)
+        legal = np.isfinite(agent.Q)
+        assert (agent.N[legal] == 7).all()
+        assert (agent.N[~legal] == 0).all()
+
+    def test_double_algorithms_start_both_tables(self):
+        """Test that both estimates of a double algorithm start from Q."""
+        agent = Agent("Double Q Learning", Q_init=0.0, decay_factor=None, seed=1)
+        Q = basic_strategy_Q(0.0)
+        agent.warm_start(Q, 3)
+        for table in range(2):
+            np.testing.assert_array_equal(agent.Q_pair[..., table, :], Q)
+        assert agent.N[np.isfinite(agent.Q_pair)].min() == 3
+
+    def test_strong_prior_keeps_basic_strategy(self):
+        """Test that a prior worth many visits is barely moved by training."""
+        agent = Agent("SARSA", Q_init=0.0, decay_factor=10, seed=1)
+        agent.warm_start(basic_strategy_Q(0.0, margin=0.5), 10**6)
+        agent.train(num_episodes=2000)
+        valid = BASIC_STRATEGY_ACTIONS >= 0
+        actions = compile_greedy(agent.Q).actions
+        np.testing.assert_array_equal(actions[valid], BASIC_STRATEGY_ACTIONS[valid])
+
+    def test_only_before_training(self):
+        """Test that a trained agent can't be warm started."""
+        agent = Agent("Q Learning", Q_init=0.0, decay_factor=None, seed=1)
+        agent.train(num_episodes=10)
+        with pytest.raises(ValueError, match="before training"):
+            agent.warm_start(basic_strategy_Q(0.0))
+
 
 class TestPolicy:
     """Test the test_policy function."""
 
     def test_policy_runs(self):
-        """Test that evaluate_policy runs without error."""
+        """Test that play_returns runs without error."""
 
         def dummy_policy(state):
             return 0
 
-        returns = evaluate_policy(dummy_policy, num_episodes=3, seed=42)
+        returns = play_returns(dummy_policy, num_episodes=3, seed=42)
 
         assert returns is not None
         assert len(returns) == 3
 
     def test_policy_reproducibility(self):
-        """Test that evaluate_policy with same seed produces same returns."""
+        """Test that play_returns with same seed produces same returns."""
 
         def dummy_policy(state):
             return 0
 
-        returns1 = evaluate_policy(dummy_policy, num_episodes=5, seed=42)
-        returns2 = evaluate_policy(dummy_policy, num_episodes=5, seed=42)
+        returns1 = play_returns(dummy_policy, num_episodes=5, seed=42)
+        returns2 = play_returns(dummy_policy, num_episodes=5, seed=42)
 
         assert np.allclose(returns1, returns2)
 
+    def test_compiled_policy_matches_python_loop(self):
+        """Test that native evaluation plays the same cards as the Python loop."""
+        returns = play_returns(basic_strategy, num_episodes=2000, seed=42)
+        compiled = compile_policy(basic_strategy)
+        native = play_returns(compiled, num_episodes=2000, seed=42)
+
+        assert np.array_equal(returns, native)
+
+    def test_evaluate_policy_summarizes_returns(self):
+        """Test that evaluate_policy summarizes the games play_returns plays."""
+        policy = compile_policy(basic_strategy)
+        result = evaluate_policy(policy, num_episodes=2000, seed=42)
+        returns = play_returns(policy, num_episodes=2000, seed=42)
+
+        assert isinstance(result, EvaluationResult)
+        assert result == summarize_returns(returns)
+
     def test_greedy_policy_in_agent(self):
         """Test that greedy policy works within agent evaluation."""
         agent = Agent("Q Learning", Q_init=0.0, decay_factor=None, seed=42)
         agent.train(num_episodes=10)
-        test_returns = agent.evaluate(num_episodes=3)
+        agent.evaluate(num_episodes=3)
+
+        assert len(agent.test_returns) == 3
+
+
+class TestAdaptiveEvaluation:
+    """Test evaluation that stops at a target confidence interval."""
 
-        assert len(test_returns) == 3
+    def test_stops_at_target(self):
+        """Test that evaluation stops once the target half width is reached."""
+        policy = compile_policy(basic_strategy)
+        result = evaluate_policy(
+            policy, 1_000_000, seed=42, target_ci=0.02, chunk_size=1000
+        )
+
+        assert isinstance(result, EvaluationResult)
+        assert result.half_width <= 0.02
+        assert result.num_episodes < 1_000_000
+
+    def test_matches_fixed_evaluation(self):
+        """Test that the running mean matches a fixed run of the same length."""
+        policy = compile_policy(basic_strategy)
+        result = evaluate_policy(
+            policy, 1_000_000, seed=42, target_ci=0.02, chunk_size=1000
+        )
+        returns = play_returns(policy, result.num_episodes, seed=42)
+
+        assert result.mean == pytest.approx(returns.mean(dtype=np.float64))
+        expected = Z_95 * returns.std(ddof=1, dtype=np.float64) / np.sqrt(len(returns))
+        assert result.half_width == pytest.approx(expected)
+
+    def test_budget_limits_episodes(self):
+        """Test that the budget caps the episodes when the target isn't reached."""
+        result = evaluate_policy(
+            lambda state: 1, 500, seed=42, target_ci=1e-6, chunk_size=200
+        )
+
+        assert result.num_episodes == 500
+        assert result.half_width > 1e-6
+
+    def test_agent_evaluate_with_target(self):
+        """Test that Agent.evaluate forwards the target."""
+        agent = Agent("Q Learning", Q_init=0.0, decay_factor=None, seed=42)
+        agent.train(num_episodes=10)
+        result = agent.evaluate(num_episodes=100_000, target_ci=0.05)
+
+        assert result.half_width <= 0.05
+        assert agent.test_result is result
+        assert agent.test_returns is None
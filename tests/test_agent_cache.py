@@ -0,0 +1,144 @@
+import inspect
+import os
+
+import numpy as np
+import pytest
+
+from blackjack.agent import Agent
+from blackjack.agent_cache import AgentCache, agent_config
+from blackjack.basic_strategy import basic_strategy_Q
+from blackjack.multi_agent import MultiAgent
+from blackjack_env import BlackjackEnv, Rules
+
+
+class TestAgentCache:
+    """Test caching trained agents by configuration."""
+
+    @pytest.mark.parametrize(
+        "algo, decay_factor",
+        [("SARSA", 100), ("Double Q Learning", None), ("Dyna Q", None)],
+    )
+    def test_continued_run_matches_full_run(self, tmp_path, algo, decay_factor):
+        """Test that carrying on from a cached run gives the uninterrupted tables."""
+        cache = AgentCache(tmp_path)
+        Agent(algo, 0.0, decay_factor, seed=3, cache=cache).train(500)
+
+        agent = Agent(algo, 0.0, decay_factor, seed=3, cache=cache)
+        returns = agent.train(1500)
+        reference = Agent(algo, 0.0, decay_factor, seed=3)
+        reference.train(1500)
+
+        assert np.isnan(returns[:500]).all()
+        assert not np.isnan(returns[500:]).any()
+        assert np.array_equal(agent.Q, reference.Q)
+        assert np.array_equal(agent.N, reference.N)
+
+    def test_exact_hit_skips_training(self, tmp_path):
+        """Test that a cached run of the same length is loaded without training."""
+        cache = AgentCache(tmp_path)
+        trained = Agent("Q Learning", 0.0, None, seed=1, cache=cache)
+        trained.train(200)
+
+        agent = Agent("Q Learning", 0.0, None, seed=1, cache=cache)
+        agent.run_episode = None  # Would fail if called
+        agent.train(200)
+        assert agent.episodes_trained == 200
+        assert np.array_equal(agent.Q, trained.Q)
+
+    def test_different_configuration_misses(self, tmp_path):
+        """Test that the seed, decay factor and rules are part of the key."""
+        cache = AgentCache(tmp_path)
+        Agent("SARSA", 0.0, 10, seed=1, cache=cache).train(100)
+        for agent in [
+            Agent("SARSA", 0.0, 10, seed=2),
+            Agent("SARSA", 0.0, 20, seed=1),
+            Agent("SARSA", 0.0, 10, seed=1, rules=Rules(hit_soft_17=False)),
+        ]:
+            assert cache.restore(agent, 100) == 0
+        assert cache.restore(Agent("SARSA", 0.0, 10, seed=1), 100) == 100
+
+    def test_warm_start_misses(self, tmp_path):
+        """Test that a warm started agent doesn't reuse a cold run."""
+        cache = AgentCache(tmp_path)
+        Agent("Q Learning", 0.0, None, seed=1, cache=cache).train(100)
+        agent = Agent("Q Learning", 0.0, None, seed=1)
+        agent.warm_start(basic_strategy_Q(0.0), 5)
+        assert cache.restore(agent, 100) == 0
+
+    def test_engine_change_misses(self, tmp_path, monkeypatch):
+        """Test that runs from an engine that plays differently aren't reused."""
+        cache = AgentCache(tmp_path)
+        agent = Agent("Q Learning", 0.0, None, seed=1, cache=cache)
+        agent.train(100)
+        monkeypatch.setattr(
+            "blackjack.agent_cache.engine_version", lambda rules: "changed"
+        )
+        assert cache.restore(Agent("Q Learning", 0.0, None, seed=1), 100) == 0
+
+    def test_helper_change_misses(self, tmp_path, monkeypatch):
+        """Test that editing a helper the episodes call isn't served old runs."""
+        cache = AgentCache(tmp_path)
+        Agent("SARSA Lambda", 0.0, 10, seed=1, cache=cache).train(100)
+        getsource = inspect.getsource
+
+        def edited_getsource(module):
+            source = getsource(module)
+            if module.__name__ == "blackjack.policy":
+                source += "\n# epsilon_greedy edited\n"
+            return source
+
+        monkeypatch.setattr(inspect, "getsource", edited_getsource)
+        assert cache.restore(Agent("SARSA Lambda", 0.0, 10, seed=1), 100) == 0
+
+    def test_longer_runs_are_not_used(self, tmp_path):
+        """Test that a cached run past the episodes asked for is ignored."""
+        cache = AgentCache(tmp_path)
+        Agent("Q Learning", 0.0, None, seed=1, cache=cache).train(300)
+        agent = Agent("Q Learning", 0.0, None, seed=1)
+        assert cache.restore(agent, 200) == 0
+        assert agent.episodes_trained == 0
+
+    def test_least_recently_used_are_evicted(self, tmp_path):
+        """Test that the oldest entries go first once the cache is too large."""
+        cache = AgentCache(tmp_path)
+        agents = [Agent("Q Learning", 0.0, None, seed=seed) for seed in range(3)]
+        paths = [cache.save(agent) for agent in agents]
+        for age, path in enumerate(paths):
+            os.utime(path, (age, age))
+        # Reading the first makes it the most recently used
+        cache.get(agent_config(agents[0]), 0, 0)
+
+        cache.max_bytes = sum(path.stat().st_size for path in paths) - 1
+        assert cache.evict() == [paths[1]]
+        assert paths[0].exists() and paths[2].exists()
+
+    def test_lockstep_exact_hit(self, tmp_path):
+        """Test that a lockstep group is only loaded for the same episodes."""
+        cache = AgentCache(tmp_path)
+        trained = MultiAgent("SARSA", 0.0, [10, 20], seed=1)
+        trained.train(200)
+        cache.save_lockstep(trained)
+
+        agents = MultiAgent("SARSA", 0.0, [10, 20], seed=1)
+        assert not cache.restore_lockstep(agents, 300)
+        assert cache.restore_lockstep(agents, 200)
+        assert np.array_equal(agents.Q, trained.Q)
+        assert agents.episodes_trained == 200
+        assert not cache.restore_lockstep(MultiAgent("SARSA", 0.0, [10, 30]), 200)
+
+
+class TestRngState:
+    """Test saving and restoring the engine's random generator."""
+
+    def test_round_trip(self):
+        """Test that a restored generator deals the same cards again."""
+        env = BlackjackEnv(5)
+        state = env.rng_state
+        first = env.evaluate(np.zeros(1440, dtype=np.int8), 100)
+        env.rng_state = state
+        assert np.array_equal(env.evaluate(np.zeros(1440, dtype=np.int8), 100), first)
+
+    def test_invalid_state(self):
+        """Test that a string that isn't a generator state is rejected."""
+        with pytest.raises(ValueError, match="Not a generator state"):
+            BlackjackEnv(5).rng_state = "not a state"
@@ -2,13 +2,26 @@ import numpy as np
 import pytest
 
 from blackjack.algorithms import (
+    double_q_learning_episode,
+    dyna_q_episode,
     expected_sarsa_episode,
     monte_carlo_episode,
+    n_step_sarsa_episode,
+    q_lambda_episode,
     q_learning_episode,
     sarsa_episode,
+    sarsa_lambda_episode,
 )
-from blackjack.state_space import flatten_Q, initialize_Q
-from blackjack_env import BlackjackEnv
+from blackjack.dyna import TransitionModel
+from blackjack.state_space import (
+    Action,
+    decode_state,
+    flatten_Q,
+    flatten_Q_pair,
+    initialize_N,
+    initialize_Q,
+)
+from blackjack_env import BlackjackEnv, Rules
 
 
 class TestQLearning:
@@ -23,7 +36,7 @@ class TestQLearning:
     def Q_table(self):
         """Create Q-value table and visit count table."""
         Q = initialize_Q(0.0)
-        N = np.zeros_like(Q)
+        N = initialize_N()
         flat_Q = flatten_Q(Q)
         flat_N = flatten_Q(N)
         return flat_Q, flat_N
@@ -81,6 +94,156 @@ class TestQLearning:
         # Visit counts should increase
         assert count_after_two > count_after_one
 
+    def test_q_learning_counts_past_float32_precision(self, env, Q_table):
+        """Test that visit counts and updates don't stall after 2^24 visits."""
+        Q, N = Q_table
+        N[:] = 2**24
+        start = N.copy()
+
+        q_learning_episode(Q, N, env)
+
+        # In float32 2^24 + 1 rounds back to 2^24 and nothing would change
+        visited = N != start
+        assert visited.any()
+        assert (Q[visited] != 0).any()
+
+
+class TestDynaQ:
+    """Test suite for Dyna-Q and its transition model."""
+
+    @pytest.fixture
+    def Q_table(self):
+        """Create Q-value table and visit count table."""
+        return flatten_Q(initialize_Q(0.0)), flatten_Q(initialize_N())
+
+    def test_model_counts_every_step(self, Q_table):
+        """Test that the model counts one outcome per real step."""
+        Q, N = Q_table
+        model = TransitionModel(capacity=8, planning_interval=10**9)
+        env = BlackjackEnv(seed=42)
+        for _ in range(2000):
+            dyna_q_episode(Q, N, env, model)
+
+        assert model.count[: model.size].sum() == N.sum()
+        # Each outcome has a row of its own
+        rows = zip(
+            model.pair[: model.size],
+            model.reward[: model.size],
+            model.next_state[: model.size],
+            model.split_state[: model.size],
+        )
+        assert len(set(rows)) == model.size
+
+    def test_real_steps_match_q_learning(self, Q_table):
+        """Test that without planning Dyna-Q learns exactly like Q-learning."""
+        Q, N = Q_table
+        model = TransitionModel(planning_interval=10**9)
+        np.random.seed(0)
+        env = BlackjackEnv(seed=42)
+        for _ in range(500):
+            dyna_q_episode(Q, N, env, model)
+
+        ref_Q, ref_N = flatten_Q(initialize_Q(0.0)), flatten_Q(initialize_N())
+        np.random.seed(0)
+        env = BlackjackEnv(seed=42)
+        for _ in range(500):
+            q_learning_episode(ref_Q, ref_N, env)
+
+        np.testing.assert_array_equal(Q, ref_Q)
+        np.testing.assert_array_equal(N, ref_N)
+
+    def test_planning_reaches_model_fixed_point(self, Q_table):
+        """Test that planning until converged leaves no Bellman error."""
+        Q, N = Q_table
+        model = TransitionModel(planning_interval=10**9)
+        env = BlackjackEnv(seed=42)
+        for _ in range(5000):
+            dyna_q_episode(Q, N, env, model)
+
+        model.plan(Q, num_sweeps=100, num_updates=Q.size)
+        seen, expected = model.expected_returns(Q)
+        errors = np.abs(expected - Q.reshape(-1)[seen])
+        assert errors[~model.loops[seen]].max() < 1e-3
+        assert np.all(np.isfinite(Q[Q != -np.inf]))
+
+    def test_split_loops_stay_bounded(self, Q_table):
+        """Test that pairs whose split deals the same pair don't diverge."""
+        Q, N = Q_table
+        model = TransitionModel(planning_interval=10)
+        env = BlackjackEnv(seed=0)
+        for _ in range(5000):
+            dyna_q_episode(Q, N, env, model)
+
+        assert model.loops.any()
+        # No hand can win more than double its bet, twelve times over
+        assert np.max(Q) <= 24
+
+    def test_planning_updates_unvisited_parents(self, Q_table):
+        """Test that planning changes Q without any more episodes."""
+        Q, N = Q_table
+        model = TransitionModel(planning_interval=10**9)
+        env = BlackjackEnv(seed=42)
+        for _ in range(1000):
+            dyna_q_episode(Q, N, env, model)
+
+        before = Q.copy()
+        assert model.plan(Q) > 0
+        assert not np.array_equal(Q, before)
+
+
+class TestDoubleQLearning:
+    """Test suite for Double Q-learning."""
+
+    @pytest.fixture
+    def Q_table(self):
+        """Create the two interleaved Q-value and visit count tables."""
+        Q = initialize_Q(0.0)
+        N = initialize_N()
+        Q_pair = np.stack([Q, Q], axis=-2)
+        N_pair = np.stack([N, N], axis=-2)
+        return flatten_Q_pair(Q_pair), flatten_Q_pair(N_pair)
+
+    def test_each_step_updates_one_table(self, Q_table):
+        """Test that every step counts towards exactly one of the tables."""
+        Q, N = Q_table
+        env = BlackjackEnv(seed=42)
+        np.random.seed(0)
+        for _ in range(5000):
+            double_q_learning_episode(Q, N, env)
+
+        assert N[:, 0].sum() > 0 and N[:, 1].sum() > 0
+        # Each table only moves where it was updated itself
+        never_updated = (N == 0) & (Q != -np.inf)
+        assert np.all(Q[never_updated] == 0.0)
+        assert not np.array_equal(Q[:, 0], Q[:, 1])
+
+    def test_only_updates_legal_actions(self, Q_table):
+        """Test that illegal actions stay -inf in both tables."""
+        Q, N = Q_table
+        illegal = Q == -np.inf
+        env = BlackjackEnv(seed=42)
+        for _ in range(2000):
+            double_q_learning_episode(Q, N, env)
+
+        assert np.all(Q[illegal] == -np.inf)
+        assert np.all(np.isfinite(Q[~illegal]))
+
+    def test_less_optimistic_than_q_learning(self):
+        """Test that the max bias makes Q learning value states above Double Q."""
+        Q, N = flatten_Q(initialize_Q(0.0)), flatten_Q(initialize_N())
+        Q_pair = flatten_Q_pair(np.stack([initialize_Q(0.0)] * 2, axis=-2))
+        N_pair = flatten_Q_pair(np.stack([initialize_N()] * 2, axis=-2))
+        env, env_double = BlackjackEnv(seed=1), BlackjackEnv(seed=1)
+        np.random.seed(1)
+        for _ in range(20_000):
+            q_learning_episode(Q, N, env)
+            double_q_learning_episode(Q_pair, N_pair, env_double)
+
+        visited = (N > 0).any(axis=1) & (N_pair > 0).all(axis=(1, 2))
+        max_Q = np.max(Q[visited], axis=1)
+        max_Q_double = np.max(Q_pair[visited].mean(axis=1), axis=1)
+        assert max_Q.mean() > max_Q_double.mean()
+
 
 class TestSARSA:
     """Test suite for SARSA algorithm."""
@@ -94,7 +257,7 @@ class TestSARSA:
     def Q_table(self):
         """Create Q-value table and visit count table."""
         Q = initialize_Q(0.0)
-        N = np.zeros_like(Q)
+        N = initialize_N()
         flat_Q = flatten_Q(Q)
         flat_N = flatten_Q(N)
         return flat_Q, flat_N
@@ -147,7 +310,7 @@ class TestSARSA:
     def test_sarsa_decay_factor_affects_exploration(self, env, Q_table):
         """Test that different decay factors affect exploration."""
         Q1, N1 = Q_table
-        Q2, N2 = initialize_Q(0.0), np.zeros_like(Q_table[0])
+        Q2, N2 = initialize_Q(0.0), initialize_N()
         Q2, N2 = flatten_Q(Q2), flatten_Q(N2)
 
         # Low decay factor - more exploitation
@@ -193,7 +356,7 @@ class TestExpectedSARSA:
     def Q_table(self):
         """Create Q-value table and visit count table."""
         Q = initialize_Q(0.0)
-        N = np.zeros_like(Q)
+        N = initialize_N()
         flat_Q = flatten_Q(Q)
         flat_N = flatten_Q(N)
         return flat_Q, flat_N
@@ -269,7 +432,7 @@ class TestMonteCarlo:
     def Q_table(self):
         """Create Q-value table and visit count table."""
         Q = initialize_Q(0.0)
-        N = np.zeros_like(Q)
+        N = initialize_N()
         flat_Q = flatten_Q(Q)
         flat_N = flatten_Q(N)
         return flat_Q, flat_N
@@ -356,3 +519,108 @@ class TestMonteCarlo:
         # Run multiple episodes - some will include splits
         for _ in range(1000):
             monte_carlo_episode(Q, N, env, decay_factor)
+
+    def test_monte_carlo_learns_split_aces(self, env, Q_table):
+        """Test that the reward for settling split aces reaches the split."""
+        Q, N = Q_table
+        ace_pairs = []
+        for state in range(len(Q)):
+            info = decode_state(state)
+            if info.hand_value == 12 and info.useable_ace and info.can_split:
+                ace_pairs.append(state)
+        # Greedy play splits aces, so their value must come from the rewards
+        Q[ace_pairs, Action.SPLIT] = 10.0
+
+        for _ in range(2000):
+            monte_carlo_episode(Q, N, env, decay_factor=1)
+
+        visited = N[ace_pairs, Action.SPLIT] > 0
+        assert visited.any()
+        assert np.all(Q[ace_pairs, Action.SPLIT][visited] <= 2.0)
+
+
+class TestMultiStep:
+    """Test suite for SARSA Lambda, Q Lambda and n-step SARSA."""
+
+    ALGORITHMS = [sarsa_lambda_episode, q_lambda_episode, n_step_sarsa_episode]
+
+    @pytest.fixture
+    def Q_table(self):
+        """Create Q-value table and visit count table."""
+        return flatten_Q(initialize_Q(0.0)), flatten_Q(initialize_N())
+
+    @pytest.mark.parametrize("run_episode", ALGORITHMS)
+    def test_updates_only_legal_actions(self, run_episode, Q_table):
+        """Test that episodes update Q and N and leave illegal actions alone."""
+        Q, N = Q_table
+        illegal = Q == -np.inf
+        env = BlackjackEnv(seed=42)
+        for _ in range(2000):
+            run_episode(Q, N, env, 100)
+
+        assert np.all(Q[illegal] == -np.inf)
+        assert np.all(np.isfinite(Q[~illegal]))
+        assert np.any(Q[~illegal] != 0.0)
+        assert N.sum() > 2000
+
+    @pytest.mark.parametrize("run_episode", ALGORITHMS)
+    def test_resplits_at_hand_limit(self, run_episode, Q_table):
+        """Test that a waiting hand that can no longer split isn't split."""
+        Q, N = Q_table
+        env = BlackjackEnv(42, Rules(max_hands=3, resplit_aces=True))
+        for _ in range(5000):
+            run_episode(Q, N, env, 1)
+
+    def test_one_step_variants_agree(self, Q_table):
+        """Test that no trace decay and one step are both one-step SARSA."""
+        Q, N = Q_table
+        Q_steps, N_steps = Q.copy(), N.copy()
+        env, env_steps = BlackjackEnv(seed=3), BlackjackEnv(seed=3)
+
+        np.random.seed(0)
+        for _ in range(3000):
+            sarsa_lambda_episode(Q, N, env, 100, trace_decay=0.0)
+        np.random.seed(0)
+        for _ in range(3000):
+            n_step_sarsa_episode(Q_steps, N_steps, env_steps, 100, num_steps=1)
+
+        np.testing.assert_array_equal(N, N_steps)
+        np.testing.assert_allclose(Q, Q_steps)
+
+    def test_long_returns_reach_first_step(self, Q_table):
+        """Test that with enough steps the first action learns the whole return,
+        including both hands of a split."""
+        splits = 0
+        for seed in range(500):
+            Q, N = flatten_Q(initialize_Q(0.0)), flatten_Q(initialize_N())
+            first_hand = BlackjackEnv(seed)
+            first_hand.new_game()
+            state = first_hand.get_state()
+
+            np.random.seed(seed)
+            episode_return = n_step_sarsa_episode(
+                Q, N, BlackjackEnv(seed), 1, num_steps=100
+            )
+            if N.max() > 1 or N[state].sum() > 1:
+                continue  # A split hand came back to a state already played
+            action = np.flatnonzero(N[state])[0]
+            assert Q[state, action] == pytest.approx(episode_return)
+            splits += action == 3
+        assert splits > 0
+
+    def test_full_traces_reach_first_step(self, Q_table):
+        """Test that undecayed traces give the first action the whole return."""
+        for seed in range(100):
+            Q, N = flatten_Q(initialize_Q(0.0)), flatten_Q(initialize_N())
+            first_hand = BlackjackEnv(seed)
+            first_hand.new_game()
+            state = first_hand.get_state()
+
+            np.random.seed(seed)
+            episode_return = sarsa_lambda_episode(
+                Q, N, BlackjackEnv(seed), 1, trace_decay=1.0
+            )
+            if N.max() > 1 or N[state].sum() > 1:
+                continue  # A split hand came back to a state already played
+            action = np.flatnonzero(N[state])[0]
+            assert Q[state, action] == pytest.approx(episode_return)
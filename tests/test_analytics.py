@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from blackjack.analytics import (
+    REGIONS,
+    disagreements,
+    greedy_actions,
+    policy_agreement,
+    q_gaps,
+)
+from blackjack.basic_strategy import BASIC_STRATEGY_ACTIONS, basic_strategy
+from blackjack.state_space import VALID_STATES, Action, flatten_Q, initialize_Q
+
+
+@pytest.fixture
+def basic_Q():
+    """Q table whose greedy policy is exactly basic strategy."""
+    Q = flatten_Q(initialize_Q(0.0)).copy()
+    states = np.flatnonzero(VALID_STATES)
+    Q[states, BASIC_STRATEGY_ACTIONS[states]] = 1.0
+    return Q
+
+
+class TestBasicStrategyTable:
+    """Test the tabulated basic strategy."""
+
+    def test_table_matches_function(self):
+        """Test that every valid state matches basic_strategy(state)."""
+        for state in np.flatnonzero(VALID_STATES):
+            assert BASIC_STRATEGY_ACTIONS[state] == basic_strategy(int(state))
+
+    def test_invalid_states_marked(self):
+        """Test that unreachable states are marked with -1."""
+        assert np.all(BASIC_STRATEGY_ACTIONS[~VALID_STATES] == -1)
+
+    def test_regions_partition_valid_states(self):
+        """Test that hard, soft and pair regions cover each valid state once."""
+        counts = sum(region.astype(int) for region in REGIONS.values())
+        assert np.array_equal(counts, VALID_STATES.astype(int))
+
+
+class TestAgreement:
+    """Test the vectorized agreement analytics."""
+
+    def test_full_agreement(self, basic_Q):
+        """Test that basic strategy agrees with itself everywhere."""
+        report = policy_agreement(basic_Q)
+        assert report.overall[0] == 1.0
+        assert report.pair[0] == 1.0
+        assert report.weighted_disagreement is None
+        assert disagreements(basic_Q) == []
+
+    def test_single_disagreement(self, basic_Q):
+        """Test that a changed decision is reported with its Q gap."""
+        Q = basic_Q.copy()
+        state = int(np.flatnonzero(REGIONS["soft"])[0])
+        other = Action.STAND if BASIC_STRATEGY_ACTIONS[state] != Action.STAND else Action.HIT
+        Q[state, other] = 1.5
+
+        found = disagreements(Q)
+        assert len(found) == 1
+        assert found[0].learned == other
+        assert found[0].q_gap == pytest.approx(0.5)
+        assert policy_agreement(Q).soft[0] < 1.0
+        assert policy_agreement(Q).hard[0] == 1.0
+
+    def test_stacked_tables(self, basic_Q):
+        """Test that many tables are analysed in one call."""
+        Qs = np.stack([basic_Q, flatten_Q(initialize_Q(0.0))])
+        report = policy_agreement(Qs)
+        assert report.overall.shape == (2,)
+        assert report.overall[0] > report.overall[1]
+        assert greedy_actions(Qs).shape == (2, len(VALID_STATES))
+        assert np.all(q_gaps(Qs)[0] == 0)
+
+    def test_visit_weighted_disagreement(self, basic_Q):
+        """Test that disagreement is weighted by state visits."""
+        Q = basic_Q.copy()
+        state = int(np.flatnonzero(REGIONS["hard"])[0])
+        other = Action.STAND if BASIC_STRATEGY_ACTIONS[state] != Action.STAND else Action.HIT
+        Q[state, other] = 2.0
+
+        N = np.zeros_like(Q)
+        N[state, other] = 3
+        N[int(np.flatnonzero(REGIONS["pair"])[0]), Action.HIT] = 1
+        report = policy_agreement(Q, N)
+        assert report.weighted_disagreement[0] == pytest.approx(0.75)
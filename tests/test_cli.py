@@ -0,0 +1,161 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from blackjack.cli import build_parser, main
+from blackjack.state_space import initialize_Q
+
+
+class TestCLI:
+    """Test suite for the python -m blackjack entry point."""
+
+    def test_unset_flags_use_script_defaults(self):
+        """Test that flags that aren't given are left out of the namespace."""
+        args = build_parser().parse_args(["train", "--episodes", "10"])
+        assert args.num_episodes == 10
+        assert not hasattr(args, "seed")
+        assert not hasattr(args, "decay_factor")
+
+    def test_help_skips_heavy_imports(self):
+        """Test that building the parser imports no numerical or plotting modules."""
+        code = (
+            "import sys; from blackjack.cli import build_parser; build_parser(); "
+            "print([m for m in ('numpy', 'polars', 'plotly', 'sqlite3') if m in sys.modules])"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        assert output.strip() == "[]"
+
+    def test_train_saves_Q_table(self, tmp_path, capsys, monkeypatch):
+        """Test that train saves a Q table to the given directory."""
+        monkeypatch.chdir(tmp_path)
+        main(["train", "--episodes", "20", "--save-dir", str(tmp_path)])
+        Q = np.load(tmp_path / "Q_Learning__20.npy")
+        assert Q.shape[-1] == 4
+        assert "Saved" in capsys.readouterr().out
+
+    def test_double_q_saves_one_table(self, tmp_path, capsys, monkeypatch):
+        """Test that Double Q Learning saves the mean table in the usual format."""
+        monkeypatch.chdir(tmp_path)
+        main(
+            [
+                "train",
+                "--algo",
+                "Double Q Learning",
+                "--episodes",
+                "20",
+                "--save-dir",
+                str(tmp_path),
+            ]
+        )
+        Q = np.load(tmp_path / "Double_Q_Learning__20.npy")
+        assert Q.shape == initialize_Q(0.0).shape
+
+    def test_train_caches_agent(self, tmp_path, capsys, monkeypatch):
+        """Test that train caches the agent unless --no-cache is given."""
+        monkeypatch.chdir(tmp_path)
+        main(["train", "--episodes", "20", "--save-dir", "agents", "--no-cache"])
+        assert not (tmp_path / "agent_cache").exists()
+        main(["train", "--episodes", "20", "--save-dir", "agents"])
+        assert len(list((tmp_path / "agent_cache").glob("*-20.npz"))) == 1
+
+    def test_train_milestones(self, tmp_path, capsys):
+        """Test that --milestones saves a snapshot at each count in one run."""
+        main(
+            [
+                "train",
+                "--episodes",
+                "50",
+                "--milestones",
+                "10",
+                "30",
+                "--save-dir",
+                str(tmp_path),
+            ]
+        )
+        milestones = tmp_path / "Q_Learning__50_milestones"
+        assert sorted(path.name for path in milestones.iterdir()) == [
+            "10.npz",
+            "30.npz",
+        ]
+        with pytest.raises(SystemExit):
+            main(["train", "--episodes", "50", "--milestones", "60"])
+
+    def test_train_warm_start(self, tmp_path, capsys):
+        """Test that --warm-start basic starts from basic strategy's table."""
+        main(
+            [
+                "train",
+                "--episodes",
+                "20",
+                "--warm-start",
+                "basic",
+                "--prior-visits",
+                "1000000",
+                "--no-cache",
+                "--save-dir",
+                str(tmp_path),
+            ]
+        )
+        Q = np.load(tmp_path / "Q_Learning__20.npy")
+        assert Q.shape == initialize_Q(0.0).shape
+        # A prior this strong keeps Q near basic strategy's 0 and -0.1
+        assert np.abs(Q[np.isfinite(Q)]).max() < 0.2
+
+    def test_bench_target_return(self, capsys):
+        """Test that --target-return runs after the lockstep bench."""
+        main(
+            [
+                "bench",
+                "--episodes",
+                "200",
+                "--algorithms",
+                "Q Learning",
+                "SARSA",
+                "--lockstep-agents",
+                "4",
+                "--threads",
+                "1",
+                "--target-return",
+                "-0.5",
+                "--target-max-episodes",
+                "400",
+            ]
+        )
+        output = capsys.readouterr().out
+        assert "train SARSA x4" in output
+        assert output.count("to -0.5000") == 2
+        assert "(s17-bj1.2-ndas-4hands-rsa-ten_or_eleven)" in output
+
+    def test_train_profile(self, tmp_path, capsys):
+        """Test that --profile trains a short run and saves its stats beside it."""
+        main(["train", "--profile", "50", "--save-dir", str(tmp_path)])
+        assert (tmp_path / "Q_Learning__50.npy").exists()
+        assert (tmp_path / "Q_Learning__50.prof").exists()
+        output = capsys.readouterr().out
+        assert "profiled 50 training episodes" in output
+        assert "engine (C++)" in output
+
+    def test_solve_exports_charts(self, tmp_path, capsys, monkeypatch):
+        """Test that solve writes a chart and Q table per variant and caches them."""
+        monkeypatch.chdir(tmp_path)
+        grid = ["--soft-17", "hit", "stand", "--payout", "1.5", "--das", "yes"]
+        grid += ["--double-on", "any", "--max-hands", "2"]
+        main(["solve", *grid, "--save-dir", "charts"])
+        for name in ("h17-bj1.5-das-2hands-nrsa-any", "s17-bj1.5-das-2hands-nrsa-any"):
+            namespace = {}
+            exec((tmp_path / "charts" / f"{name}.py").read_text(), namespace)
+            assert len(namespace["STRATEGY_PAIR"]["A"]) == 10
+            assert np.load(tmp_path / "charts" / f"{name}.npy").shape == (
+                initialize_Q(0.0).shape
+            )
+        assert len(list((tmp_path / "strategy_cache").glob("*.npz"))) == 2
+        assert "house edge" in capsys.readouterr().out
+
+    def test_unknown_algorithm(self):
+        """Test that unknown algorithms are rejected."""
+        with pytest.raises(SystemExit):
+            main(["train", "--algo", "Not An Algorithm"])
@@ -0,0 +1,122 @@
+import json
+
+import compare_algos
+from blackjack.agent import Agent
+from blackjack.results import ResultsStore
+
+
+class TestSuccessiveHalving:
+    """Test the successive halving decay factor search."""
+
+    def test_rung_budgets(self):
+        """Test that budgets grow by eta and end at the full training budget."""
+        assert compare_algos.rung_budgets(810, 4, 3) == [30, 90, 270, 810]
+
+    def test_survivors_continue_training(self, tmp_path, monkeypatch):
+        """Test that each rung keeps 1 / eta of the candidates and records them."""
+        monkeypatch.setattr(compare_algos, "CURVES_PATH", tmp_path / "curves")
+        decay_factors = list(range(10, 100, 10))
+
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            experiment_id = store.create_experiment("compare_algos")
+            best = compare_algos.successive_halving(
+                store,
+                experiment_id,
+                1,
+                "SARSA",
+                decay_factors,
+                train_episodes=900,
+                test_episodes=2_000,
+                num_rungs=3,
+                eta=3,
+            )
+            rows = store.fetch_metrics(experiment_id, name="rung")
+
+        assert best in decay_factors
+        # 9 candidates, then 3, then 1, evaluated after 100, 300 and 900 episodes
+        steps = [row[5] for row in rows]
+        assert len(rows) == 9 + 3 + 1
+        assert sorted(set(steps)) == [100, 300, 900]
+        assert steps.count(900) == 1
+
+    def test_cached_rerun_matches(self, tmp_path, monkeypatch):
+        """Test that a rerun loading every agent from the cache ranks them the same."""
+        monkeypatch.setattr(compare_algos, "CURVES_PATH", tmp_path / "curves")
+        cache = compare_algos.AgentCache(tmp_path / "cache")
+        runs = []
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            for _ in range(2):
+                experiment_id = store.create_experiment("compare_algos")
+                best = compare_algos.successive_halving(
+                    store,
+                    experiment_id,
+                    1,
+                    "SARSA",
+                    [10, 20, 30, 40],
+                    train_episodes=400,
+                    test_episodes=2_000,
+                    num_rungs=2,
+                    eta=2,
+                    cache=cache,
+                )
+                rows = store.fetch_metrics(experiment_id, name="mean_return")
+                runs.append((best, [(row[3], row[5], row[6]) for row in rows]))
+        assert runs[0] == runs[1]
+
+    def test_chained_trials(self, tmp_path, monkeypatch):
+        """Test that chained grid trials start from the previous decay factor."""
+        monkeypatch.setattr(compare_algos, "CURVES_PATH", tmp_path / "curves")
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            experiment_id = store.create_experiment("compare_algos")
+            compare_algos.run_experiment(
+                store,
+                experiment_id,
+                ["SARSA"],
+                decay_factor_step_size=10,
+                decay_factor_max=30,
+                chain_trials=True,
+                train_episodes=200,
+                test_episodes=1_000,
+            )
+            params = store.conn.execute(
+                "SELECT params FROM trials ORDER BY trial_id"
+            ).fetchall()
+        assert [json.loads(p) if p else None for (p,) in params] == [
+            None,
+            {"warm_start_decay_factor": 10},
+            {"warm_start_decay_factor": 20},
+        ]
+
+    def test_one_trial_without_decay_factor(self, tmp_path, monkeypatch):
+        """Test that algorithms ignoring the decay factor are trained once."""
+        monkeypatch.setattr(compare_algos, "CURVES_PATH", tmp_path / "curves")
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            experiment_id = store.create_experiment("compare_algos")
+            compare_algos.run_experiment(
+                store,
+                experiment_id,
+                ["Q Learning", "Double Q Learning", "Dyna Q", "SARSA"],
+                decay_factor_step_size=10,
+                decay_factor_max=30,
+                train_episodes=200,
+                test_episodes=1_000,
+            )
+            trials = store.conn.execute(
+                "SELECT algorithm, decay_factor FROM trials ORDER BY trial_id"
+            ).fetchall()
+        assert trials == [
+            ("Q Learning", None),
+            ("Double Q Learning", None),
+            ("Dyna Q", None),
+            ("SARSA", 10),
+            ("SARSA", 20),
+            ("SARSA", 30),
+        ]
+
+    def test_agent_training_continues(self):
+        """Test that training twice continues rather than replaying the same cards."""
+        agent = Agent("Q Learning", Q_init=0, decay_factor=None, seed=3)
+        first = agent.train(2_000).copy()
+        second = agent.train(2_000)
+        assert agent.episodes_trained == 4_000
+        assert not (first == second).all()
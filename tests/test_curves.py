@@ -0,0 +1,54 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from blackjack.agent import Agent
+from blackjack.curves import LearningCurveWriter, aggregate_curves, scan_curves
+
+
+class TestLearningCurves:
+    """Test suite for Parquet learning curve storage."""
+
+    @pytest.fixture
+    def trained(self, tmp_path):
+        """Train two agents while writing their learning curves."""
+        returns = {}
+        for trial, algo, decay_factor in [(1, "Q Learning", None), (2, "SARSA", 10)]:
+            agent = Agent(algo, Q_init=0.0, decay_factor=decay_factor, seed=trial)
+            writer = LearningCurveWriter(
+                tmp_path,
+                trial=trial,
+                partitions={"algorithm": algo, "decay_factor": decay_factor},
+                bucket_size=10,
+                buckets_per_file=3,
+            )
+            with writer:
+                returns[algo] = agent.train(num_episodes=95, callbacks=[writer])
+            assert writer.num_files == 4  # Three files of 30 episodes and the rest
+        return tmp_path, returns
+
+    def test_buckets_match_returns(self, trained):
+        """Test that bucket statistics match the raw training returns."""
+        root, returns = trained
+        curve = (
+            scan_curves(root)
+            .filter(pl.col("algorithm") == "Q Learning")
+            .sort("episode")
+            .collect()
+        )
+        assert curve["decay_factor"].null_count() == len(curve)
+        assert curve["count"].to_list() == [10] * 9 + [5]
+        assert curve["mean"][0] == pytest.approx(returns["Q Learning"][:10].mean())
+        assert curve["variance"][-1] == pytest.approx(returns["Q Learning"][90:].var())
+
+    def test_aggregate_pools_buckets(self, trained):
+        """Test that coarser buckets pool means and variances exactly."""
+        root, returns = trained
+        pooled = aggregate_curves(scan_curves(root), bucket_size=50).collect()
+
+        sarsa = pooled.filter(pl.col("algorithm") == "SARSA").sort("episode")
+        assert sarsa["episode"].to_list() == [0, 50]
+        assert sarsa["decay_factor"].to_list() == [10, 10]
+        assert sarsa["count"].to_list() == [50, 45]
+        assert sarsa["mean"][1] == pytest.approx(returns["SARSA"][50:].mean())
+        assert sarsa["variance"][0] == pytest.approx(np.var(returns["SARSA"][:50]))
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from blackjack.policy import compile_policy
+from blackjack.state_space import Action, decode_state
+from blackjack_env import BlackjackEnv
+
+
+def deal_pair(env: BlackjackEnv, hand_value: int, soft: bool = False) -> int:
+    # Starts games until the player is dealt the pair making hand_value
+    while True:
+        env.new_game()
+        state = env.get_state()
+        info = decode_state(state)
+        if (
+            info.can_split
+            and info.hand_value == hand_value
+            and info.useable_ace == soft
+        ):
+            return state
+
+
+class TestEngine:
+    """Test suite for the game logic in the native engine."""
+
+    def test_split_sixes_play_on(self):
+        """Test that a pair of 6s isn't settled after one card like aces."""
+        env = BlackjackEnv(seed=0)
+        for _ in range(200):
+            deal_pair(env, 12)
+            result = env.play_hand(Action.SPLIT)
+            assert not result.terminated
+            assert result.next_state >= 0
+            assert result.split_state >= 0
+
+    def test_split_21_is_not_a_natural(self):
+        """Test that 21 in two cards on a split hand pays even money."""
+        env = BlackjackEnv(seed=0)
+        num_21s = 0
+        for _ in range(500):
+            deal_pair(env, 20)
+            terminated = env.play_hand(Action.SPLIT).terminated
+            while not terminated:
+                info = decode_state(env.get_state())
+                result = env.play_hand(Action.STAND)
+                terminated = result.terminated
+                if info.hand_value == 21:
+                    num_21s += 1
+                    assert result.reward in (0.0, 1.0)
+        assert num_21s > 0
+
+    def test_split_aces_settle_both_hands(self):
+        """Test that split aces end the game when they were the only hand."""
+        env = BlackjackEnv(seed=0)
+        for _ in range(50):
+            deal_pair(env, 12, soft=True)
+            result = env.play_hand(Action.SPLIT)
+            assert result.terminated
+            assert result.next_state == result.split_state == -1
+            assert -2.0 <= result.reward <= 2.0
+            with pytest.raises(RuntimeError):
+                env.get_state()
+
+    def test_no_hand_in_play(self):
+        """Test that a settled game raises instead of reading an empty stack."""
+        env = BlackjackEnv(seed=0)
+        with pytest.raises(RuntimeError):
+            env.get_state()
+        env.new_game()
+        while not env.play_hand(Action.STAND).terminated:
+            pass
+        with pytest.raises(RuntimeError):
+            env.get_state()
+        with pytest.raises(RuntimeError):
+            env.play_hand(Action.HIT)
+
+    def test_always_splitting_stays_under_max_hands(self):
+        """Test that splitting every pair never asks for a hand past the limit."""
+        policy = compile_policy(
+            lambda state: (
+                Action.SPLIT if decode_state(state).can_split else Action.STAND
+            )
+        )
+        returns = BlackjackEnv(seed=0).evaluate(policy.actions, 200_000)
+        assert np.all(np.isfinite(returns))
@@ -0,0 +1,221 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from blackjack.agent import evaluate_policy
+from blackjack.basic_strategy import basic_strategy
+from blackjack.evaluation import (
+    RunningMoments,
+    evaluate_controlled,
+    evaluate_memoized,
+    evaluate_paired,
+    evaluate_threaded,
+    thread_seeds,
+)
+from blackjack.policy import compile_policy
+from blackjack.results import ResultsStore
+from blackjack.solver import exact_return
+from blackjack.state_space import Action
+from blackjack_env import BlackjackEnv, Rules
+
+BASIC = compile_policy(basic_strategy)
+BASIC_RETURN = exact_return(BASIC.actions)
+
+
+def never_double(state: int) -> int:
+    """Basic strategy with doubles replaced by hits."""
+    action = basic_strategy(state)
+    return Action.HIT.value if action == Action.DOUBLE.value else action
+
+
+class TestRunningMoments:
+    """Test the chunked mean and covariance."""
+
+    def test_matches_numpy(self):
+        """Merged chunks give the same moments as one pass over all returns."""
+        rng = np.random.default_rng(0)
+        returns = rng.normal(size=(3, 1000))
+        returns[1] += returns[0]
+
+        moments = RunningMoments(3)
+        for chunk in np.array_split(returns, [10, 11, 400], axis=1):
+            moments.update(chunk)
+
+        assert moments.count == 1000
+        np.testing.assert_allclose(moments.mean, returns.mean(axis=1))
+        np.testing.assert_allclose(moments.covariance(), np.cov(returns))
+
+
+class TestEvaluatePaired:
+    """Test common random number evaluation."""
+
+    def test_identical_policies_have_no_difference(self):
+        """A policy paired with itself plays the same hands."""
+        result = evaluate_paired([BASIC, BASIC], 20_000, seed=1)
+        assert result.means[0] == result.means[1]
+        assert result.difference_half_widths[0, 1] == 0
+
+    def test_difference_is_tighter_than_independent(self):
+        """Shared cards cancel most of the noise in a difference."""
+        result = evaluate_paired([BASIC, never_double], 200_000, seed=2)
+        independent = np.hypot(*result.half_widths)
+        assert result.difference_half_widths[0, 1] < independent / 2
+        # Doubling is worth something, never doing it should cost
+        assert result.differences[0, 1] > 0
+
+    def test_chunking_does_not_change_cards(self):
+        """Episodes draw from the seed alone, not from the chunk boundaries."""
+        whole = evaluate_paired([BASIC, never_double], 30_000, seed=3)
+        chunked = evaluate_paired(
+            [BASIC, never_double], 30_000, seed=3, chunk_size=7_000
+        )
+        np.testing.assert_allclose(chunked.means, whole.means)
+
+    def test_target_ci_stops_early(self):
+        """Play stops once every pairwise difference is known to target_ci."""
+        result = evaluate_paired(
+            [BASIC, never_double], 10_000_000, 4, target_ci=0.005, chunk_size=50_000
+        )
+        assert result.num_episodes < 10_000_000
+        assert result.difference_half_widths.max() <= 0.005
+
+    def test_repeated_policies_are_played_once(self, monkeypatch):
+        """A table given twice is played once and reported for both."""
+        tables = []
+        evaluate = BlackjackEnv.evaluate_paired
+
+        class Recording(BlackjackEnv):
+            def evaluate_paired(self, actions, num_episodes):
+                tables.append(len(actions))
+                return evaluate(self, actions, num_episodes)
+
+        monkeypatch.setattr("blackjack.evaluation.BlackjackEnv", Recording)
+        result = evaluate_paired([BASIC, never_double, BASIC], 20_000, seed=6)
+        reference = evaluate_paired([BASIC, never_double], 20_000, seed=6)
+
+        assert tables == [2, 2]
+        np.testing.assert_allclose(result.means[:2], reference.means)
+        assert result.means[2] == result.means[0]
+        assert result.differences[2, 0] == 0
+
+    def test_no_episodes(self):
+        """An empty budget is rejected before anything is played."""
+        with pytest.raises(ValueError):
+            evaluate_paired([BASIC, never_double], 0, seed=5)
+        with pytest.raises(ValueError):
+            evaluate_controlled([never_double], 0, seed=5)
+
+    def test_same_seed_same_result(self):
+        """Evaluations are reproducible from the seed."""
+        first = evaluate_paired([BASIC, never_double], 10_000, seed=5)
+        second = evaluate_paired([BASIC, never_double], 10_000, seed=5)
+        np.testing.assert_array_equal(first.means, second.means)
+
+
+class TestEvaluateControlled:
+    """Test control variate evaluation with basic strategy as the control."""
+
+    def test_control_itself_is_exact(self):
+        """Correcting the control by itself returns its known mean."""
+        result = evaluate_controlled([BASIC], 10_000, seed=6)
+        np.testing.assert_allclose(result.means, [BASIC_RETURN])
+        np.testing.assert_allclose(result.coefficients, [1])
+        assert result.half_widths[0] < 1e-9
+
+    def test_control_mean_follows_rules(self):
+        """The default known mean is the control's exact return under the rules."""
+        rules = Rules(hit_soft_17=False)
+        control = compile_policy(basic_strategy, rules)
+        result = evaluate_controlled([control], 10_000, seed=6, rules=rules)
+        expected = exact_return(control.actions, rules)
+        assert abs(expected - BASIC_RETURN) > 0.001
+        np.testing.assert_allclose(result.means, [expected])
+
+    def test_reduces_variance_of_similar_policy(self):
+        """A policy close to basic strategy is mostly explained by it."""
+        result = evaluate_controlled([never_double], 200_000, seed=7)
+        assert result.variance_reductions[0] > 4
+        assert result.half_widths[0] < result.raw_half_widths[0] / 2
+        # The correction moves the estimate by the control's luck
+        shift = result.means[0] - result.raw_means[0]
+        luck = result.control_sample_mean - BASIC_RETURN
+        np.testing.assert_allclose(shift, -result.coefficients[0] * luck)
+
+    def test_target_ci_uses_corrected_width(self):
+        """Play stops on the corrected CI, well before the raw one would."""
+        result = evaluate_controlled(
+            [never_double], 10_000_000, 8, target_ci=0.005, chunk_size=50_000
+        )
+        assert result.half_widths[0] <= 0.005
+        assert result.raw_half_widths[0] > 0.005
+
+
+class TestEvaluateMemoized:
+    """Test evaluations reused from the results store."""
+
+    def test_matches_plain_evaluation(self, tmp_path):
+        """The first evaluation plays the policy like evaluate_policy does."""
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            result = evaluate_memoized(BASIC, 20_000, seed=7, store=store)
+        assert result == evaluate_policy(BASIC, 20_000, seed=7)
+
+    def test_same_policy_is_read_back(self, tmp_path, monkeypatch):
+        """A policy with the same action table is not played again."""
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            first = evaluate_memoized(BASIC, 20_000, seed=7, store=store)
+            monkeypatch.setattr("blackjack.evaluation.evaluate_policy", None)
+            assert evaluate_memoized(basic_strategy, 20_000, 7, store=store) == first
+
+    def test_settings_are_part_of_the_key(self, tmp_path):
+        """A different seed, budget or target_ci plays the policy again."""
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            first = evaluate_memoized(BASIC, 20_000, seed=7, store=store)
+            assert evaluate_memoized(BASIC, 20_000, seed=8, store=store) != first
+            assert evaluate_memoized(BASIC, 10_000, seed=7, store=store) != first
+            ci = evaluate_memoized(
+                BASIC, 20_000, 7, target_ci=0.05, chunk_size=1_000, store=store
+            )
+            assert ci.num_episodes < 20_000
+            rows = store.conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()
+        assert rows[0] == 4
+
+
+class TestEvaluateThreaded:
+    """Test evaluation on a thread pool."""
+
+    def test_matches_one_env_per_thread(self):
+        """Each thread plays its share on its own seeded env."""
+        returns = evaluate_threaded(BASIC, 10_001, seed=3, num_threads=3)
+        seeds = thread_seeds(3, 3)
+        expected = [
+            BlackjackEnv(seed).evaluate(BASIC.actions, share)
+            for seed, share in zip(seeds, (3334, 3334, 3333))
+        ]
+        np.testing.assert_array_equal(returns, np.concatenate(expected))
+
+    def test_same_seed_same_result(self):
+        """Scheduling doesn't change the returns."""
+        first = evaluate_threaded(BASIC, 20_000, seed=1, num_threads=4)
+        second = evaluate_threaded(BASIC, 20_000, seed=1, num_threads=4)
+        np.testing.assert_array_equal(first, second)
+
+    def test_evaluate_releases_gil(self):
+        """Python keeps its pace while another thread evaluates natively."""
+
+        def spin_rate(target, *args) -> float:
+            # Loops per second this thread manages while target runs in another
+            thread = threading.Thread(target=target, args=args)
+            loops = 0
+            start = time.perf_counter()
+            thread.start()
+            while thread.is_alive():
+                loops += 1
+            return loops / (time.perf_counter() - start)
+
+        # Sleeping releases the GIL, so it sets the pace to compare against
+        released = spin_rate(time.sleep, 0.3)
+        evaluating = spin_rate(BlackjackEnv(0).evaluate, BASIC.actions, 2_000_000)
+        # Holding the GIL stalls the loop for the whole call, about 1/50 of the
+        # pace, releasing it gives 1/3 or more even on a single core
+        assert evaluating > released / 10
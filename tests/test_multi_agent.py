@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from blackjack.multi_agent import MultiAgent
+from blackjack.state_space import VALID_STATES, flatten_Q, initialize_Q
+from blackjack_env import BlackjackVecEnv
+
+
+class TestBlackjackVecEnv:
+    """Test suite for the vectorized environment."""
+
+    def test_envs_share_the_seed(self):
+        """Test that every env starts like a lone env with the same seed."""
+        env = BlackjackVecEnv(4, seed=7)
+        states = env.get_states()
+        assert env.num_envs == 4
+        assert len(set(states)) == 1
+        assert VALID_STATES[states].all()
+
+    def test_negative_action_skips_env(self):
+        """Test that envs given a negative action are left waiting."""
+        env = BlackjackVecEnv(2, seed=7)
+        before = env.get_states()
+        rewards, next_states, split_states, terminated = env.step(np.array([1, -1]))
+        assert terminated[0]
+        assert not terminated[1] and rewards[1] == 0
+        assert env.get_states()[1] == before[1]
+
+    def test_wrong_number_of_actions(self):
+        """Test that step needs one action per env."""
+        with pytest.raises(ValueError):
+            BlackjackVecEnv(2, seed=7).step(np.array([1]))
+
+
+class TestMultiAgent:
+    """Test suite for training agents in lockstep."""
+
+    def test_train_shapes(self):
+        """Test that each agent trains for the requested episodes."""
+        agents = MultiAgent("SARSA", Q_init=0, decay_factors=[10, 100, 1000], seed=1)
+        returns = agents.train(200)
+        assert agents.Q.shape == (3, VALID_STATES.sum(), 4)
+        assert returns.shape == (3, 200)
+        assert agents.episodes_trained == 200
+        assert agents.agent_Q(0).shape[:-1] == (18, 10, 2, 2, 2)
+        assert (agents.N.sum(axis=(1, 2)) >= 200).all()
+        assert agents.N.dtype == np.uint64
+
+    def test_mixed_algorithms(self):
+        """Test that agents of different algorithms train side by side."""
+        agents = MultiAgent(
+            ["Q Learning", "SARSA", "Expected SARSA"],
+            Q_init=0,
+            decay_factors=[None, 50, 50],
+            seed=2,
+        )
+        agents.train(500)
+        # Q learning explores uniformly, so it tries doubling and splitting too
+        assert (agents.N[0].sum(axis=0) > 0).all()
+        assert np.isfinite(agents.Q[agents.N > 0]).all()
+
+    def test_only_unvisited_values_untouched(self):
+        """Test that states the engine never deals are never updated."""
+        agents = MultiAgent("Expected SARSA", Q_init=0.5, decay_factors=[20], seed=3)
+        agents.train(2_000)
+        Q = flatten_Q(agents.agent_Q(0))
+        initial_Q = flatten_Q(initialize_Q(0.5))
+        np.testing.assert_array_equal(Q[~VALID_STATES], initial_Q[~VALID_STATES])
+        assert (Q[VALID_STATES] != initial_Q[VALID_STATES]).any()
+
+    def test_training_continues(self):
+        """Test that a second train call carries on from the first."""
+        agents = MultiAgent("SARSA", Q_init=0, decay_factors=[10, 20], seed=4)
+        agents.train(100)
+        visits = agents.N.sum()
+        agents.train(100)
+        assert agents.episodes_trained == 200
+        assert agents.N.sum() > visits
+
+    def test_rejects_unsupported_algorithms(self):
+        """Test that Monte Carlo and missing decay factors are rejected."""
+        with pytest.raises(ValueError, match="lockstep"):
+            MultiAgent("Monte Carlo", Q_init=0, decay_factors=[10])
+        with pytest.raises(ValueError, match="Decay factor"):
+            MultiAgent("SARSA", Q_init=0, decay_factors=[None])
@@ -1,6 +1,18 @@
+from functools import partial
+
+import numpy as np
 import pytest
 
-from blackjack.policy import epsilon_greedy, greedy, random
+from blackjack.basic_strategy import BASIC_STRATEGY_ACTIONS, basic_strategy
+from blackjack.policy import (
+    compile_greedy,
+    compile_policy,
+    epsilon_greedy,
+    greedy,
+    load_compiled_policy,
+    random,
+    save_compiled_policy,
+)
 from blackjack.state_space import Action, flatten_Q, initialize_Q
 
 
@@ -65,3 +77,46 @@ class TestPolicies:
 
         action = epsilon_greedy(state, flat_Q, n, k)
         assert isinstance(action, Action)
+
+    def test_epsilon_greedy_is_greedy_after_many_visits(self, flat_Q):
+        """Test that epsilon decays with visits rather than growing."""
+        Q = flat_Q.copy()
+        Q[0, Action.STAND] = 1.0
+        actions = {epsilon_greedy(0, Q, 10**9, 1) for _ in range(100)}
+        assert actions == {Action.STAND}
+
+
+class TestCompilePolicy:
+    """Test suite for compiling policies into action tables."""
+
+    def test_compile_basic_strategy(self):
+        """Test that basic strategy compiles to the tabulated actions."""
+        compiled = compile_policy(basic_strategy)
+        assert compiled.actions.dtype == np.int8
+        assert np.array_equal(compiled.actions, BASIC_STRATEGY_ACTIONS)
+
+    def test_compile_greedy_matches_callable(self):
+        """Test that compiling greedy directly matches compiling the callable."""
+        Q = flatten_Q(initialize_Q(0.0)).copy()
+        Q[:, Action.STAND] = np.random.rand(len(Q))
+        from_callable = compile_policy(partial(greedy, Q=Q))
+        assert compile_greedy(Q).digest == from_callable.digest
+
+    def test_digest_is_stable(self):
+        """Test that the same table always hashes the same way."""
+        assert compile_policy(basic_strategy).digest == compile_policy(basic_strategy).digest
+        assert compile_policy(lambda state: Action.HIT).digest != compile_policy(
+            basic_strategy
+        ).digest
+
+    def test_illegal_action_rejected(self):
+        """Test that policies choosing illegal actions are rejected."""
+        with pytest.raises(ValueError, match="illegal action"):
+            compile_policy(lambda state: Action.SPLIT)
+
+    def test_disk_cache_round_trip(self, tmp_path):
+        """Test that compiled policies can be saved and reloaded by digest."""
+        compiled = compile_policy(basic_strategy)
+        save_compiled_policy(compiled, tmp_path)
+        loaded = load_compiled_policy(compiled.digest, tmp_path)
+        assert np.array_equal(loaded.actions, compiled.actions)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from blackjack.agent import Agent
+from blackjack.policy import greedy
+from blackjack.profiling import ENGINE, component_times, run_profiled
+from blackjack.state_space import flatten_Q, initialize_Q
+from blackjack_env import BlackjackEnv
+
+
+def play_greedy(num_episodes: int) -> None:
+    # Engine calls and a policy that only calls numpy, from a test module
+    Q = flatten_Q(initialize_Q(0.0))
+    env = BlackjackEnv(0)
+    for _ in range(num_episodes):
+        env.new_game()
+        while not env.play_hand(greedy(env.get_state(), Q)).terminated:
+            pass
+
+
+class TestProfiling:
+    """Test suite for the per component profile breakdown."""
+
+    def test_times_sum_to_total(self):
+        """Test that every second profiled is given to one component."""
+        agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=0)
+        _, stats = run_profiled(agent.train, 2000)
+
+        times = component_times(stats)
+        assert sum(times.values()) == pytest.approx(stats.total_tt)
+        assert {"algorithms.py", "policy.py", "agent.py", ENGINE} <= set(times)
+
+    def test_numpy_time_goes_to_caller(self):
+        """Test that numpy called from policy.py counts as policy.py."""
+        _, stats = run_profiled(play_greedy, 2000)
+
+        times = component_times(stats)
+        numpy_time = sum(
+            stat[2] for func, stat in stats.stats.items() if "argmax" in func[2]
+        )
+        assert numpy_time > 0
+        assert times["policy.py"] >= numpy_time
+        assert times[ENGINE] > 0
+
+    def test_returns_the_result(self):
+        """Test that the profiled function's result is passed back."""
+        result, _ = run_profiled(np.add, 1, 2)
+        assert result == 3
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from blackjack.results import METRIC_COLUMNS, ResultsStore
+
+
+class TestResultsStore:
+    """Test suite for the SQLite results store."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a results store in a temporary directory."""
+        with ResultsStore(tmp_path / "results.sqlite3", batch_size=3) as store:
+            yield store
+
+    def test_uses_wal(self, store):
+        """Test that the database is opened in WAL mode."""
+        mode = store.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+    def test_trial_index_exists(self, store):
+        """Test that trials are indexed by experiment, algorithm and decay factor."""
+        columns = [
+            row[2] for row in store.conn.execute("PRAGMA index_info(trials_by_config)")
+        ]
+        assert columns == ["experiment_id", "algorithm", "decay_factor"]
+
+    def test_cached_evaluation(self, store):
+        """Test that evaluations are found by policy digest and configuration."""
+        config = {"seed": 1, "num_episodes": 100}
+        assert store.cached_evaluation("abc", config) is None
+        store.cache_evaluation("abc", config, -0.01, 0.002, 100)
+        assert store.cached_evaluation("abc", dict(reversed(config.items()))) == (
+            -0.01,
+            0.002,
+            100,
+        )
+        assert store.cached_evaluation("abc", {**config, "seed": 2}) is None
+
+    def test_record_and_fetch(self, store):
+        """Test that recorded trials come back with their metrics."""
+        experiment_id = store.create_experiment("compare_algos", {"seed": 42})
+        store.record_trial(experiment_id, "SARSA", {"mean_return": -0.1}, decay_factor=20)
+        store.record_trial(experiment_id, "SARSA", {"mean_return": -0.2}, decay_factor=10)
+        store.record_trial(experiment_id, "Q Learning", {"mean_return": -0.05})
+
+        rows = store.fetch_metrics(experiment_id)
+        assert len(rows) == 3
+        assert len(rows[0]) == len(METRIC_COLUMNS)
+
+        sarsa = store.fetch_metrics(experiment_id, algorithm="SARSA")
+        assert [row[3] for row in sarsa] == [10, 20]
+
+    def test_writes_are_batched(self, tmp_path):
+        """Test that rows are only committed once a batch fills up."""
+        path = tmp_path / "batched.sqlite3"
+        store = ResultsStore(path, batch_size=4)
+        experiment_id = store.create_experiment("compare_algos")
+        store.record_trial(experiment_id, "SARSA", {"mean_return": 0.0})
+
+        reader = sqlite3.connect(path)
+        assert reader.execute("SELECT COUNT(*) FROM trials").fetchone()[0] == 0
+
+        store.record_trial(experiment_id, "SARSA", {"mean_return": 0.0})
+        assert reader.execute("SELECT COUNT(*) FROM trials").fetchone()[0] == 2
+
+        store.close()
+        reader.close()
+
+    def test_cross_experiment_queries(self, store):
+        """Test that metrics from several experiments are fetched together."""
+        first = store.create_experiment("compare_algos")
+        second = store.create_experiment("compare_algos")
+        store.record_trial(first, "SARSA", {"mean_return": 0.1})
+        store.record_trial(second, "SARSA", {"mean_return": 0.2})
+
+        assert len(store.fetch_metrics([first, second])) == 2
+        assert store.latest_experiment("compare_algos") == second
+        assert len(store.experiments("compare_algos")) == 2
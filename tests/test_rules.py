@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+from blackjack.agent import Agent, evaluate_policy, play_returns
+from blackjack.basic_strategy import basic_strategy
+from blackjack.multi_agent import MultiAgent
+from blackjack.policy import compile_policy, random
+from blackjack.state_space import (
+    VALID_STATES,
+    decode_state,
+    flatten_Q,
+    initialize_Q,
+    valid_states,
+)
+from blackjack_env import BlackjackEnv, BlackjackVecEnv, DoubleRule, Rules
+
+RULE_VARIANTS = [
+    Rules(hit_soft_17=False),
+    Rules(double_after_split=False),
+    Rules(double_on=DoubleRule.NINE_TO_ELEVEN),
+    Rules(double_on=DoubleRule.TEN_OR_ELEVEN, double_after_split=False),
+    Rules(max_hands=1),
+    Rules(max_hands=3, resplit_aces=True),
+    Rules(resplit_aces=True, double_on=DoubleRule.TEN_OR_ELEVEN),
+]
+
+
+def play_random(env: BlackjackEnv, num_episodes: int):
+    # Yields every state a uniformly random player is dealt
+    Q = flatten_Q(initialize_Q(0.0))
+    np.random.seed(0)
+    for _ in range(num_episodes):
+        env.new_game()
+        terminated = False
+        while not terminated:
+            state = env.get_state()
+            yield state
+            terminated = env.play_hand(random(state, Q)).terminated
+
+
+class TestRules:
+    """Test suite for configurable table rules."""
+
+    def test_default_rules(self):
+        """Test that the defaults are the original fixed rules."""
+        rules = BlackjackEnv(seed=0).rules
+        assert rules.hit_soft_17
+        assert rules.blackjack_payout == 1.5
+        assert rules.double_after_split
+        assert rules.max_hands == 12
+        assert not rules.resplit_aces
+        assert rules.double_on == DoubleRule.ANY
+
+    def test_default_rules_valid_states(self):
+        """Test that the default rules reach the same states as before."""
+        assert np.array_equal(valid_states(Rules()), VALID_STATES)
+
+    def test_default_rules_play_the_same_cards(self):
+        """Test that passing the default rules doesn't change any episode."""
+        actions = compile_policy(basic_strategy).actions
+        returns = BlackjackEnv(7).evaluate(actions, 10_000)
+        ruled_returns = BlackjackEnv(7, Rules()).evaluate(actions, 10_000)
+        np.testing.assert_array_equal(returns, ruled_returns)
+
+    @pytest.mark.parametrize("rules", RULE_VARIANTS, ids=repr)
+    def test_valid_states_cover_visited_states(self, rules):
+        """Test that every state reached under the rules is marked as valid."""
+        valid = valid_states(rules)
+        for state in play_random(BlackjackEnv(42, rules), 5000):
+            assert valid[state], decode_state(state)
+
+    def test_no_splits_with_one_hand(self):
+        """Test that a pair can't be split when only one hand is allowed."""
+        rules = Rules(max_hands=1)
+        for state in play_random(BlackjackEnv(42, rules), 2000):
+            assert not decode_state(state).can_split
+
+    def test_no_double_after_split(self):
+        """Test that split hands can't double without double after split."""
+        env = BlackjackEnv(42, Rules(double_after_split=False))
+        for _ in range(2000):
+            env.new_game()
+            state = decode_state(env.get_state())
+            if not state.can_split or state.useable_ace:
+                continue
+            result = env.play_hand(3)
+            assert not decode_state(result.next_state).can_double
+            assert not decode_state(result.split_state).can_double
+
+    @pytest.mark.parametrize(
+        "double_on, totals",
+        [
+            (DoubleRule.NINE_TO_ELEVEN, (9, 10, 11)),
+            (DoubleRule.TEN_OR_ELEVEN, (10, 11)),
+        ],
+    )
+    def test_double_restrictions(self, double_on, totals):
+        """Test that only hard totals allowed by the rule can double."""
+        env = BlackjackEnv(42, Rules(double_on=double_on))
+        for state in play_random(env, 2000):
+            state = decode_state(state)
+            if state.can_double:
+                assert not state.useable_ace and state.hand_value in totals
+
+    def test_resplit_aces(self):
+        """Test that split aces that draw another ace can be split again."""
+        env = BlackjackEnv(42, Rules(resplit_aces=True))
+        resplits = 0
+        for state in play_random(env, 20_000):
+            state = decode_state(state)
+            if state.hand_value == 12 and state.useable_ace and not state.can_double:
+                assert state.can_split
+                resplits += 1
+        assert resplits > 0
+
+    def test_blackjack_payout(self):
+        """Test that naturals pay the configured payout."""
+        actions = compile_policy(basic_strategy).actions
+        returns = BlackjackEnv(3, Rules(blackjack_payout=1.2)).evaluate(actions, 50_000)
+        assert np.float32(1.2) in returns
+        assert np.float32(1.5) not in returns
+
+    def test_stand_on_soft_17_helps_player(self):
+        """Test that S17 is worth about two tenths of a percent to basic strategy."""
+        actions = compile_policy(basic_strategy).actions
+        h17 = BlackjackEnv(5).evaluate_paired(actions[None], 2_000_000)
+        s17 = BlackjackEnv(5, Rules(hit_soft_17=False)).evaluate_paired(
+            actions[None], 2_000_000
+        )
+        assert 0.0005 < s17.mean() - h17.mean() < 0.004
+
+    @pytest.mark.parametrize(
+        "rules",
+        [Rules(max_hands=0), Rules(max_hands=13), Rules(blackjack_payout=-1)],
+        ids=repr,
+    )
+    def test_invalid_rules(self, rules):
+        """Test that rules the engine can't play are rejected."""
+        with pytest.raises(ValueError):
+            BlackjackEnv(0, rules)
+        with pytest.raises(ValueError):
+            BlackjackVecEnv(2, 0, rules)
+
+    def test_rules_repr(self):
+        """Test that the repr shows every rule."""
+        rules = Rules(blackjack_payout=1.2, double_on=DoubleRule.TEN_OR_ELEVEN)
+        assert "blackjack_payout=1.2," in repr(rules)
+        assert "double_on=DoubleRule.TEN_OR_ELEVEN" in repr(rules)
+
+    def test_agent_trains_under_rules(self):
+        """Test that agents play and evaluate under their rules."""
+        rules = Rules(max_hands=1, double_on=DoubleRule.TEN_OR_ELEVEN)
+        agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=1, rules=rules)
+        agent.train(2000)
+        assert agent.env.rules.max_hands == 1
+        assert agent.evaluate(1000).num_episodes == 1000
+
+        agents = MultiAgent("SARSA", Q_init=0, decay_factors=[10, 100], rules=rules)
+        agents.train(500)
+        states = agents.env.get_states()
+        assert not any(decode_state(s).can_split for s in states)
+
+    def test_evaluate_policy_under_rules(self):
+        """Test that a policy compiled for other rules covers their states."""
+        rules = Rules(double_on=DoubleRule.NINE_TO_ELEVEN)
+        with pytest.raises(ValueError):
+            evaluate_policy(compile_policy(basic_strategy), 10_000, 0, rules=rules)
+        policy = compile_policy(basic_strategy, rules)
+        assert play_returns(policy, 10_000, 0, rules=rules).shape == (10_000,)
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from blackjack.agent import Agent, evaluate_Q
+from blackjack.results import ResultsStore
+from blackjack.snapshots import MilestoneSnapshots, SnapshotEvaluator, load_milestone
+from train_agent import warm_start_tables
+
+
+class FailingEvaluator(SnapshotEvaluator):
+    def _evaluate(self, policy):
+        raise RuntimeError("evaluation failed")
+
+
+class TestSnapshotEvaluator:
+    """Test suite for evaluating snapshots while training."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """Create a results store with one trial."""
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            experiment_id = store.create_experiment("train_agent")
+            store.trial_id = store.add_trial(experiment_id, "SARSA", 100, seed=1)
+            yield store
+
+    def test_one_row_per_snapshot(self, store):
+        """Test that every interval gets a mean, CI and episode count."""
+        agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=1)
+        with SnapshotEvaluator(
+            store, store.trial_id, interval=1000, num_episodes=5000, num_workers=2
+        ) as snapshots:
+            agent.train(3500, callbacks=[snapshots])
+
+        rows = store.fetch_metrics(name=None)
+        steps = sorted({row[5] for row in rows})
+        assert steps == [1000, 2000, 3000, 3500]
+        names = {row[4] for row in rows}
+        assert names == {"mean_return", "ci_half_width", "num_episodes"}
+
+    def test_snapshot_matches_evaluation_at_that_point(self, store):
+        """Test that a snapshot is the greedy policy at its episode."""
+        agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=2)
+        with SnapshotEvaluator(
+            store, store.trial_id, interval=2000, num_episodes=5000, seed=7
+        ) as snapshots:
+            agent.train(2000, callbacks=[snapshots])
+
+        reference = Agent("SARSA", Q_init=0, decay_factor=100, seed=2)
+        reference.train(2000)
+        expected = evaluate_Q(reference.Q, 5000, seed=7).mean
+        rows = store.fetch_metrics(name="mean_return")
+        assert rows[0][5] == 2000
+        assert rows[0][6] == pytest.approx(expected)
+
+    def test_training_is_unchanged(self, store):
+        """Test that the workers don't disturb the training random numbers."""
+        agent = Agent("Expected SARSA", Q_init=0, decay_factor=50, seed=3)
+        with SnapshotEvaluator(
+            store, store.trial_id, interval=500, num_episodes=20_000, max_pending=1
+        ) as snapshots:
+            agent.train(3000, callbacks=[snapshots])
+
+        reference = Agent("Expected SARSA", Q_init=0, decay_factor=50, seed=3)
+        reference.train(3000)
+        np.testing.assert_array_equal(agent.Q, reference.Q)
+
+    def test_target_ci(self, store):
+        """Test that snapshots can be evaluated to a target precision."""
+        agent = Agent("Q Learning", Q_init=0, decay_factor=None, seed=4)
+        with SnapshotEvaluator(
+            store, store.trial_id, interval=1000, num_episodes=10**7, target_ci=0.02
+        ) as snapshots:
+            agent.train(1000, callbacks=[snapshots])
+        widths = store.fetch_metrics(name="ci_half_width")
+        assert widths[0][6] <= 0.02
+
+    def test_worker_errors_reach_training(self, store):
+        """Test that a failed evaluation is raised on the training thread."""
+        agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=5)
+        with pytest.raises(RuntimeError, match="evaluation failed"):
+            with FailingEvaluator(store, store.trial_id, interval=100) as snapshots:
+                agent.train(300, callbacks=[snapshots])
+
+
+class TestMilestoneSnapshots:
+    """Test suite for Q and N snapshots at milestone episode counts."""
+
+    @pytest.mark.parametrize(
+        "algo, decay_factor", [("SARSA", 100), ("Double Q Learning", None)]
+    )
+    def test_milestones_match_separate_runs(self, tmp_path, algo, decay_factor):
+        """Test that each rebuilt snapshot equals a run trained to that budget."""
+        milestones = [300, 1000, 2500]
+        agent = Agent(algo, Q_init=0, decay_factor=decay_factor, seed=1)
+        agent.train(3000, callbacks=[MilestoneSnapshots(tmp_path, milestones)])
+
+        for milestone in milestones:
+            Q, N = load_milestone(tmp_path, milestone)
+            reference = Agent(algo, Q_init=0, decay_factor=decay_factor, seed=1)
+            reference.train(milestone)
+            np.testing.assert_array_equal(Q, reference.Q)
+            np.testing.assert_array_equal(N, reference.N)
+
+    def test_later_snapshots_only_hold_changes(self, tmp_path):
+        """Test that snapshots after the first only store changed entries."""
+        agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=1)
+        snapshots = MilestoneSnapshots(tmp_path, [1000, 1010])
+        agent.train(1010, callbacks=[snapshots])
+
+        with np.load(snapshots.saved[0]) as first, np.load(snapshots.saved[1]) as second:
+            assert len(first["Q"]) == agent.Q.size
+            assert 0 < len(second["Q"]) < len(first["Q"]) // 10
+            assert int(second["previous"]) == 1000
+
+    def test_prior_weight_scales_only_snapshots(self, tmp_path):
+        """Test that prior_weight scales a snapshot's N and no other source's."""
+        agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=1)
+        agent.train(500, callbacks=[MilestoneSnapshots(tmp_path, [500])])
+        np.save(tmp_path / "Q.npy", agent.Q)
+
+        _, N = warm_start_tables(tmp_path / "500.npz", prior_weight=0.5)
+        np.testing.assert_array_equal(N, agent.N * 0.5)
+        for source in ["basic", tmp_path / "Q.npy"]:
+            _, N = warm_start_tables(source, prior_visits=10, prior_weight=0.5)
+            assert N == 10
+
+    def test_evaluation_at_milestones(self, tmp_path):
+        """Test that milestones are evaluated into the snapshot and the store."""
+        with ResultsStore(tmp_path / "results.sqlite3") as store:
+            experiment_id = store.create_experiment("train_agent")
+            trial_id = store.add_trial(experiment_id, "SARSA", 100, seed=1)
+            agent = Agent("SARSA", Q_init=0, decay_factor=100, seed=1)
+            snapshots = MilestoneSnapshots(
+                tmp_path / "milestones",
+                [500, 1000],
+                evaluate_episodes=2000,
+                seed=3,
+                store=store,
+                trial_id=trial_id,
+            )
+            agent.train(1500, callbacks=[snapshots])
+            rows = store.fetch_metrics(name="mean_return")
+
+        assert [row[5] for row in rows] == [500, 1000]
+        with np.load(snapshots.saved[1]) as snapshot:
+            assert float(snapshot["mean_return"]) == rows[1][6]
+        Q, _ = load_milestone(tmp_path / "milestones", 1000)
+        expected = evaluate_Q(Q, 2000, 3).mean
+        assert rows[1][6] == pytest.approx(expected)
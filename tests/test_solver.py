@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+from blackjack import solver
+from blackjack.agent_cache import AgentCache
+from blackjack.basic_strategy import (
+    BASIC_STRATEGY_ACTIONS,
+    BASIC_STRATEGY_RETURN,
+    STRATEGY_HARD,
+    STRATEGY_PAIR,
+    STRATEGY_SOFT,
+    D,
+    H,
+    P,
+    S,
+)
+from blackjack.policy import compile_greedy
+from blackjack.solver import (
+    changed_rules_name,
+    dealer_outcomes,
+    exact_return,
+    format_chart,
+    rule_grid,
+    solve,
+    solve_grid,
+    strategy_chart,
+)
+from blackjack.state_space import Action, flatten_Q, initialize_Q
+from blackjack_env import BlackjackEnv, DoubleRule, Rules
+
+
+@pytest.fixture(scope="module")
+def solution():
+    return solve()
+
+
+def _mean_and_error(actions, rules, num_episodes=1_000_000):
+    returns = BlackjackEnv(11, rules).evaluate(actions, num_episodes)
+    return returns.mean(), returns.std() / np.sqrt(num_episodes)
+
+
+class TestExactReturn:
+    """Test exact evaluation of action tables."""
+
+    def test_dealer_outcomes(self):
+        """Test that the dealer's outcomes are a distribution and only an ace
+        or ten can make a natural."""
+        for upcard in range(2, 12):
+            outcomes = dealer_outcomes(upcard, True)
+            assert outcomes.sum() == pytest.approx(1.0)
+            assert (outcomes[solver.NATURAL] > 0) == (upcard in (10, 11))
+
+    def test_basic_strategy_matches_simulation(self):
+        """Test that basic strategy's exact return is the one measured natively."""
+        assert exact_return(BASIC_STRATEGY_ACTIONS) == pytest.approx(
+            BASIC_STRATEGY_RETURN, abs=1e-4
+        )
+
+    def test_random_table_matches_engine(self):
+        """Test a table that splits often under rules with every restriction."""
+        rules = Rules(
+            hit_soft_17=False,
+            blackjack_payout=1.2,
+            double_after_split=False,
+            max_hands=3,
+            resplit_aces=True,
+            double_on=DoubleRule.NINE_TO_ELEVEN,
+        )
+        rng = np.random.default_rng(0)
+        Q = initialize_Q(0.0) + rng.random(initialize_Q(0.0).shape)
+        Q[..., Action.SPLIT] += 0.5
+        actions = compile_greedy(Q, rules).actions
+
+        mean, error = _mean_and_error(actions, rules)
+        assert abs(exact_return(actions, rules) - mean) < 4 * error
+
+    def test_illegal_action(self):
+        """Test that a table doubling where it can't is rejected."""
+        actions = BASIC_STRATEGY_ACTIONS.copy()
+        actions[actions >= 0] = Action.DOUBLE
+        with pytest.raises(ValueError, match="illegal action"):
+            exact_return(actions)
+
+
+class TestSolve:
+    """Test solving the optimal strategy of a rule set."""
+
+    def test_optimal_beats_basic_strategy(self, solution):
+        """Test that the solved table does at least as well as basic strategy
+        and plays as well as knowing every hand's composition."""
+        assert solution.expected_return >= exact_return(BASIC_STRATEGY_ACTIONS)
+        assert solution.expected_return <= solution.optimal_return + 1e-12
+        assert solution.expected_return == pytest.approx(
+            solution.optimal_return, abs=1e-5
+        )
+
+    def test_matches_simulation(self, solution):
+        """Test that the engine's mean return is the exact one."""
+        mean, error = _mean_and_error(solution.actions, Rules())
+        assert abs(solution.expected_return - mean) < 4 * error
+
+    def test_Q_is_greedy_in_actions(self, solution):
+        """Test that Q holds the returns the actions were chosen from."""
+        states = np.flatnonzero(solution.actions >= 0)
+        flat_Q = flatten_Q(solution.Q)
+        best = flat_Q[states, solution.actions[states]]
+        assert np.allclose(best, flat_Q[states].max(axis=1))
+        assert np.isneginf(flat_Q[states, Action.SPLIT]).any()
+
+    def test_chart_layout(self, solution):
+        """Test that charts have basic strategy's rows and play as the table."""
+        chart = strategy_chart(solution.actions)
+        assert chart.hard.keys() == STRATEGY_HARD.keys()
+        assert chart.soft.keys() == STRATEGY_SOFT.keys()
+        assert chart.pair.keys() == STRATEGY_PAIR.keys()
+        rows = [*chart.hard.values(), *chart.soft.values(), *chart.pair.values()]
+        assert all(len(row) == 10 for row in rows)
+        assert solution.chart_return == pytest.approx(solution.expected_return)
+
+    def test_format_chart_round_trip(self, solution):
+        """Test that the exported source defines the same tables."""
+        chart = strategy_chart(solution.actions)
+        namespace = {"H": H, "S": S, "D": D, "P": P}
+        exec(format_chart(chart), namespace)
+        assert namespace["STRATEGY_HARD"] == chart.hard
+        assert namespace["STRATEGY_SOFT"] == chart.soft
+        assert namespace["STRATEGY_PAIR"] == chart.pair
+
+
+class TestSolveGrid:
+    """Test solving many rule variants."""
+
+    def test_rule_grid(self):
+        """Test that every combination of the choices is made."""
+        variants = rule_grid(hit_soft_17=[True, False], max_hands=[1, 2, 4])
+        assert len(variants) == 6
+        assert {(rules.hit_soft_17, rules.max_hands) for rules in variants} == {
+            (h17, max_hands) for h17 in (True, False) for max_hands in (1, 2, 4)
+        }
+        assert all(rules.blackjack_payout == 1.5 for rules in variants)
+
+    def test_changed_rules_name(self):
+        """Only the rules that differ from the defaults are named."""
+        assert changed_rules_name(Rules()) == "default"
+        rules = Rules(hit_soft_17=False, max_hands=4)
+        assert changed_rules_name(rules) == "s17-4hands"
+
+    def test_parallel_matches_serial(self):
+        """Test that worker processes solve the variants as one process would."""
+        variants = rule_grid(blackjack_payout=[1.5, 1.2], max_hands=[2])
+        serial = solve_grid(variants)
+        parallel = solve_grid(variants, workers=2)
+        for expected, solved in zip(serial, parallel):
+            assert np.array_equal(expected.actions, solved.actions)
+            assert expected.expected_return == solved.expected_return
+        # A worse blackjack payout only costs the player
+        assert serial[1].expected_return < serial[0].expected_return
+
+    def test_cached_variants_are_not_solved(self, tmp_path, monkeypatch):
+        """Test that a rerun loads solutions and only solves new variants."""
+        cache = AgentCache(tmp_path)
+        first = solve_grid([Rules(max_hands=1)], cache=cache)[0]
+
+        solved = []
+        original = solver._solve_fields
+        monkeypatch.setattr(
+            solver,
+            "_solve_fields",
+            lambda fields: solved.append(fields) or original(fields),
+        )
+        variants = [Rules(max_hands=1), Rules(max_hands=1, hit_soft_17=False)]
+        cached, new = solve_grid(variants, cache=cache)
+        assert [fields["hit_soft_17"] for fields in solved] == [False]
+        assert np.array_equal(cached.Q, first.Q)
+        assert cached.expected_return == first.expected_return
+        assert new.expected_return > cached.expected_return
@@ -1,12 +1,20 @@
 import numpy as np
 
+from blackjack.policy import random
 from blackjack.state_space import (
     NUM_HAND_VALUES,
+    NUM_STATES,
     NUM_UPCARDS,
+    VALID_STATES,
     Action,
+    STATE_INDEX,
     flatten_Q,
+    initialize_N,
     initialize_Q,
+    state_index,
+    valid_states,
 )
+from blackjack_env import BlackjackEnv, Rules, encode_state
 
 
 class TestStateSpace:
@@ -36,6 +44,15 @@ class TestStateSpace:
         illegal_value = Q[17, 8, 0, 0, 0, Action.DOUBLE]
         assert illegal_value == -np.inf
 
+    def test_initialize_N(self):
+        """Test that visit counts are integers shaped like Q."""
+        N = initialize_N()
+        assert N.shape == initialize_Q(0.0).shape
+        assert N.dtype == np.uint64
+        N[0, 0, 0, 0, 0, 0] = 2**24
+        N[0, 0, 0, 0, 0, 0] += 1
+        assert N[0, 0, 0, 0, 0, 0] == 2**24 + 1
+
     def test_flatten_Q(self):
         """Test that Q-value table is flattened correctly."""
         Q = initialize_Q(0.0)
@@ -48,3 +65,79 @@ class TestStateSpace:
         # Check values match
         state_idx = 0
         assert flat_Q[state_idx, Action.HIT] == Q[0, 0, 0, 0, 0, Action.HIT]
+
+    def test_valid_states_cover_visited_states(self):
+        """Test that every state reached in play is marked as valid."""
+        env = BlackjackEnv(seed=42)
+        Q = flatten_Q(initialize_Q(0.0))
+        np.random.seed(42)
+        for _ in range(2000):
+            env.new_game()
+            terminated = False
+            while not terminated:
+                state = env.get_state()
+                assert VALID_STATES[state]
+                terminated = env.play_hand(random(state, Q)).terminated
+
+    def test_valid_states_count(self):
+        """Test the number of reachable states."""
+        assert VALID_STATES.shape == (NUM_STATES,)
+        assert VALID_STATES.sum() == 600
+
+
+class TestStateIndex:
+    """Test suite for the dense index of reachable states."""
+
+    def test_encoding_matches_table_layout(self):
+        """Test that the engine's state encoding is the flattened Q layout."""
+        shape = (NUM_HAND_VALUES, NUM_UPCARDS, 2, 2, 2)
+        value, upcard, useable_ace, can_double, can_split = np.indices(shape)
+        states = encode_state(value + 4, upcard + 2, useable_ace, can_double, can_split)
+        np.testing.assert_array_equal(states.reshape(-1), np.arange(NUM_STATES))
+
+    def test_maps_are_inverse(self):
+        """Test that dense and engine states map to each other."""
+        index = STATE_INDEX
+        assert index.num_states == VALID_STATES.sum()
+        np.testing.assert_array_equal(index.states, np.flatnonzero(VALID_STATES))
+        np.testing.assert_array_equal(
+            index.dense[index.states], np.arange(index.num_states)
+        )
+        assert (index.dense[~VALID_STATES] == -1).all()
+
+    def test_pairs_are_the_legal_actions(self):
+        """Test that the compact pairs hold every legal reachable Q value."""
+        Q = flatten_Q(initialize_Q(0.0))
+        Q[VALID_STATES] = np.where(np.isinf(Q[VALID_STATES]), -np.inf, 1.0)
+        pairs = STATE_INDEX.compact_pairs(Q)
+        assert len(pairs) == STATE_INDEX.legal.sum()
+        assert (pairs == 1.0).all()
+
+    def test_round_trip(self):
+        """Test that compacting and expanding restores the engine layout."""
+        Q = flatten_Q(initialize_Q(0.0))
+        Q[Q == 0] = np.random.default_rng(0).random((Q == 0).sum())
+        base = flatten_Q(initialize_Q(0.0))
+        dense = STATE_INDEX.compact(Q)
+        assert dense.shape == (STATE_INDEX.num_states, len(Action))
+        expanded = STATE_INDEX.expand(dense, base)
+        np.testing.assert_array_equal(expanded[VALID_STATES], Q[VALID_STATES])
+        np.testing.assert_array_equal(expanded[~VALID_STATES], base[~VALID_STATES])
+        pairs = STATE_INDEX.compact_pairs(Q)
+        np.testing.assert_array_equal(
+            STATE_INDEX.expand_pairs(pairs, base)[VALID_STATES], Q[VALID_STATES]
+        )
+
+    def test_stacked_tables(self):
+        """Test that leading axes, as in stacked agents, are kept."""
+        Q = np.stack([flatten_Q(initialize_Q(value)) for value in (0.0, 1.0)])
+        assert STATE_INDEX.compact(Q).shape == (2, STATE_INDEX.num_states, 4)
+        assert STATE_INDEX.compact_pairs(Q).shape == (2, STATE_INDEX.legal.sum())
+
+    def test_rules_change_the_index(self):
+        """Test that other rules index the states they can reach."""
+        rules = Rules(max_hands=1)
+        index = state_index(rules)
+        np.testing.assert_array_equal(index.states, np.flatnonzero(valid_states(rules)))
+        assert index.num_states < STATE_INDEX.num_states
+        assert not index.legal[:, Action.SPLIT].any()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from blackjack.basic_strategy import BASIC_STRATEGY_ACTIONS
+from blackjack.state_space import VALID_STATES, flatten_Q, initialize_Q
+from blackjack.visualizer import (
+    HAND_HARD,
+    HAND_LABELS,
+    HAND_PAIR,
+    HAND_SOFT,
+    best_actions,
+    render_strategies,
+    strategy_figure,
+    strategy_views,
+)
+
+
+@pytest.fixture
+def basic_Q():
+    """Q table whose greedy policy is exactly basic strategy."""
+    Q = flatten_Q(initialize_Q(0.0)).copy()
+    states = np.flatnonzero(VALID_STATES)
+    Q[states, BASIC_STRATEGY_ACTIONS[states]] = 1.0
+    return Q
+
+
+class TestStrategyViews:
+    """Test suite for headless strategy rendering."""
+
+    def test_view_shapes(self, basic_Q):
+        """Test that every view has one row per label and one column per upcard."""
+        views = strategy_views(best_actions(basic_Q))
+        for hand in (HAND_HARD, HAND_SOFT, HAND_PAIR):
+            assert views[hand].shape == (len(HAND_LABELS[hand]), 10)
+
+    def test_flat_and_full_tables_match(self, basic_Q):
+        """Test that flat and state-shaped Q tables give the same views."""
+        full = basic_Q.reshape(initialize_Q(0.0).shape)
+        assert np.array_equal(best_actions(full), best_actions(basic_Q))
+
+    def test_figure_has_all_views(self, basic_Q):
+        """Test that one figure holds the hard, soft and pair heatmaps."""
+        fig = strategy_figure(basic_Q)
+        assert len(fig.data) == 3
+
+    def test_diff_against_basic_strategy(self, basic_Q):
+        """Test that diff mode marks only states that differ from basic strategy."""
+        fig = strategy_figure(basic_Q, diff=True)
+        assert all(np.nansum(trace.z) == 0 for trace in fig.data)
+
+        Q = basic_Q.copy()
+        Q[:, 0] = 5.0  # Always hit
+        changed = strategy_figure(Q, diff=True)
+        assert np.nansum(changed.data[0].z) > 0
+        # Unreachable cells such as a hard 4 that isn't a pair stay blank
+        assert np.isnan(changed.data[0].z[0]).all()
+
+    def test_render_exports_batch_once(self, basic_Q, tmp_path, monkeypatch):
+        """Test that a batch of tables is exported with a single write_images call."""
+        calls = []
+        monkeypatch.setattr(
+            "blackjack.visualizer.pio.write_images",
+            lambda figures, outputs, scale: calls.append((figures, outputs)),
+        )
+        paths = []
+        for i in range(3):
+            paths.append(tmp_path / f"agent_{i}.npy")
+            np.save(paths[-1], basic_Q)
+
+        outputs = render_strategies(paths, tmp_path / "plots", diff=True)
+        assert len(calls) == 1
+        assert len(calls[0][0]) == 3
+        assert outputs[0].name == "agent_0_diff_strategy.png"
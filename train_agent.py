@@ -1,24 +1,134 @@
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Sequence, Union
 
 import numpy as np
 
-from blackjack.agent import Agent
+from blackjack.agent import Agent, TrainingCallback
+from blackjack.agent_cache import AGENT_CACHE_PATH, AgentCache
+from blackjack.basic_strategy import basic_strategy_Q
+from blackjack.results import DATABASE_PATH, ResultsStore
+from blackjack.snapshots import MilestoneSnapshots, SnapshotEvaluator, load_milestone
 
 SEED = 42
 NUM_TRAIN_EPISODES = 200_000_000
 SAVEFILE = Path("trained_agents")
+EXPERIMENT_NAME = "train_agent"
+# Greedy snapshots evaluated alongside training, None to train without them
+SNAPSHOT_INTERVAL: Optional[int] = None
+SNAPSHOT_EPISODES = 1_000_000
+# Episode counts at which Q and N are saved during the one run, next to the
+# final table in <name>_milestones/, optionally evaluated on MILESTONE_EPISODES
+MILESTONES: Sequence[int] = ()
+MILESTONE_EPISODES: Optional[int] = None
+# Start from a saved Q table (.npy), a milestone snapshot (.npz, which has N) or
+# "basic" for a basic strategy prior, None for a constant Q of 0
+WARM_START: Optional[Union[Path, str]] = None
+PRIOR_VISITS = 10  # Visits a Q table without N is worth
+PRIOR_WEIGHT = 1.0  # Scales a snapshot's N
+BASIC_PRIOR_VALUE = 0.0  # Above the true returns is optimistic, below pessimistic
+# Load or continue runs of the same configuration from AGENT_CACHE_PATH
+CACHE_AGENTS = True
 
 
-def train_agent(algo_name: str, decay_factor: Optional[int] = None):
-    agent = Agent(algo_name=algo_name, Q_init=0, decay_factor=decay_factor, seed=SEED)
-    agent.train(num_episodes=NUM_TRAIN_EPISODES)
-    np.save(
-        SAVEFILE / f"{algo_name.replace(' ', '_')}__{NUM_TRAIN_EPISODES}.npy", agent.Q
+def train_with_snapshots(
+    agent: Agent,
+    num_episodes: int,
+    snapshot_interval: int,
+    snapshot_episodes: int = SNAPSHOT_EPISODES,
+    callbacks: Sequence[TrainingCallback] = (),
+) -> int:
+    """Train while workers evaluate snapshots into the store, returns the trial_id."""
+    with ResultsStore(DATABASE_PATH) as store:
+        config = {
+            "num_episodes": num_episodes,
+            "snapshot_interval": snapshot_interval,
+            "snapshot_episodes": snapshot_episodes,
+        }
+        experiment_id = store.create_experiment(EXPERIMENT_NAME, config)
+        trial_id = store.add_trial(
+            experiment_id, agent.algo_name, agent.decay_factor, seed=agent.seed
+        )
+        with SnapshotEvaluator(
+            store,
+            trial_id,
+            interval=snapshot_interval,
+            num_episodes=snapshot_episodes,
+            seed=agent.seed,
+            rules=agent.rules,
+        ) as snapshots:
+            agent.train(num_episodes=num_episodes, callbacks=[snapshots, *callbacks])
+    return trial_id
+
+
+def warm_start_tables(
+    source: Union[Path, str],
+    prior_visits: int = PRIOR_VISITS,
+    prior_weight: float = PRIOR_WEIGHT,
+) -> tuple[np.ndarray, Union[np.ndarray, int]]:
+    """Q and the visits it's worth from a WARM_START source. A milestone
+    snapshot's N is scaled by prior_weight, other sources get prior_visits."""
+    if source == "basic":
+        return basic_strategy_Q(BASIC_PRIOR_VALUE), prior_visits
+    source = Path(source)
+    if source.suffix == ".npz":
+        Q, N = load_milestone(source.parent, int(source.stem))
+        return Q, N * prior_weight
+    return np.load(source), prior_visits
+
+
+def train_agent(
+    algo_name: str,
+    decay_factor: Optional[int] = None,
+    num_episodes: int = NUM_TRAIN_EPISODES,
+    seed: int = SEED,
+    save_dir: Path = SAVEFILE,
+    snapshot_interval: Optional[int] = SNAPSHOT_INTERVAL,
+    snapshot_episodes: int = SNAPSHOT_EPISODES,
+    cache_agents: bool = CACHE_AGENTS,
+    milestones: Sequence[int] = MILESTONES,
+    milestone_episodes: Optional[int] = MILESTONE_EPISODES,
+    warm_start: Optional[Union[Path, str]] = WARM_START,
+    prior_visits: int = PRIOR_VISITS,
+    prior_weight: float = PRIOR_WEIGHT,
+) -> Path:
+    if any(milestone > num_episodes for milestone in milestones):
+        raise ValueError("Milestones can't be past num_episodes")
+    path = save_dir / f"{algo_name.replace(' ', '_')}__{num_episodes}.npy"
+    callbacks = []
+    if milestones:
+        callbacks.append(
+            MilestoneSnapshots(
+                path.with_name(path.stem + "_milestones"),
+                milestones,
+                milestone_episodes,
+                seed,
+            )
+        )
+        # A run loaded from the cache would skip the milestones before it
+        cache_agents = False
+
+    agent = Agent(
+        algo_name=algo_name,
+        Q_init=0,
+        decay_factor=decay_factor,
+        seed=seed,
+        cache=AgentCache(AGENT_CACHE_PATH) if cache_agents else None,
     )
+    if warm_start is not None:
+        agent.warm_start(*warm_start_tables(warm_start, prior_visits, prior_weight))
+    if snapshot_interval is None:
+        agent.train(num_episodes=num_episodes, callbacks=callbacks)
+    else:
+        train_with_snapshots(
+            agent, num_episodes, snapshot_interval, snapshot_episodes, callbacks
+        )
+    save_dir.mkdir(parents=True, exist_ok=True)
+    np.save(path, agent.Q)
+    return path
+
 
 if __name__ == "__main__":
     train_agent(algo_name="Q Learning")
     print("Agent 1 Trained")
     train_agent(algo_name="Expected SARSA", decay_factor=1)
-    print("Agent 2 Trained")
\ No newline at end of file
+    print("Agent 2 Trained")